@@ -1,516 +1,426 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-import pandas as pd
-from datetime import date
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Border, Side, Alignment
-from PIL import Image as PILImage, ImageOps
-from openpyxl.drawing.image import Image as XLImage
-from openpyxl.utils import get_column_letter
-from openpyxl.cell import MergedCell
+from datetime import date, timedelta
+import json
 import os
-from io import BytesIO
-import math
-
-# PDF Generation Libraries
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER, TA_RIGHT
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import units
-from reportlab.lib import colors
-from reportlab.lib.utils import ImageReader
-# Import CJK Font support
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+import time
+import uuid
+
+from diary_model import DiaryDraft, ROLE_TYPES, STAFF_GROUPS, PROGRESS_ITEMS_PER_MACHINE, SIDE_ITEM_COUNT
+# openpyxl / reportlab / pandas 相關模組 (excel_export、pdf_export、journal_*) 在第一次導出或上傳舊日誌時才載入，首頁不需等待
+from day_store import DayStore
+from diagnostics import DIAGNOSTICS_ENABLED, NULL_DIAGNOSTICS
+from export_jobs import JobManager, ExportRejected, DONE, FAILED
+from export_tasks import excel_day_task, pdf_day_task, journal_pdf_task, store_pdf_task, store_journal_task
+from spill_io import spool_upload, file_digest
+from photo_pipeline import PhotoCache, DEFAULT_PHOTO_QUALITY, PHOTO_FORMATS, DEFAULT_PHOTO_FORMAT, DEFAULT_JPEG_QUALITY
 
 # --- Streamlit UI 設定 ---
 st.set_page_config(page_title="工廠安裝日記", layout="wide")
 
-# --- Try to Register CJK Font ---
-try:
-    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
-    CJK_FONT_NAME = 'STSong-Light'
-except Exception as e:
-    CJK_FONT_NAME = 'Helvetica' # Fallback font
-
 # --- Streamlit 應用程式標題 ---
 st.title("🛠️ 工廠安裝日記自動生成器")
-if CJK_FONT_NAME == 'STSong-Light':
-    st.success("中文字體 (STSong-Light) 加載成功，可用於 PDF 導出。")
-else:
-    st.warning(f"無法加載中文字體 STSong-Light，PDF 中的中文可能無法正確顯示。將使用 {CJK_FONT_NAME}。")
+
+
+# --- 導出診斷 (DIARY_DIAGNOSTICS=1 或網址加上 ?diagnostics=1 時開啟) ---
+diagnostics_enabled = DIAGNOSTICS_ENABLED or st.query_params.get("diagnostics") == "1"
+
+
+def show_diagnostics(diag, key=None):
+    """在導出結果下方顯示各階段耗時、每張照片耗時與記憶體峰值，並提供 JSON 下載 (未開啟診斷時不顯示)"""
+    if diag is NULL_DIAGNOSTICS: return
+    report = diag.to_dict()
+    with st.expander(f"🩺 導出診斷：{diag.label} ({report['total_seconds']:.2f}s)"):
+        mb = lambda value: round(value, 2) if value is not None else "—"
+        st.table([{"階段": s["stage"], "秒": round(s["seconds"], 3), "記憶體峰值 (MB)": mb(s["peak_mb"]) if not s["shared"] else f"{mb(s['peak_mb'])} (整個行程)",
+                   "留存 (MB)": mb(s["retained_mb"])} for s in report["stages"]])
+        if report["photos"]:
+            st.markdown("**每張照片**")
+            st.table([{"照片": p["name"], "合計 (秒)": round(p["total_seconds"], 3), **{k: round(v, 3) for k, v in p["seconds"].items()},
+                       "直接沿用": ", ".join(p["passthrough"]), "錯誤": p["error"] or ""} for p in report["photos"]])
+        memory_notes = []
+        if report["tracemalloc_peak_mb"] is None: memory_notes.append("未量測記憶體 (伺服器設定 DIARY_DIAGNOSTICS=1 才開啟 tracemalloc)")
+        else:
+            memory_notes.append(f"tracemalloc 峰值 {report['tracemalloc_peak_mb']:.1f} MB (不含 PIL 影像緩衝區)")
+            if report["memory_shared"]: memory_notes.append("部分階段與其他導出同時量測，標示「整個行程」的數值包含其他導出")
+        if report["process_max_rss_mb"] is not None: memory_notes.append(f"行程最高常駐記憶體 {report['process_max_rss_mb']:.0f} MB")
+        st.caption("；".join(memory_notes))
+        st.download_button("📥 下載診斷 JSON", data=diag.to_json(), file_name=f"diagnostics_{diag.label}_{time.strftime('%Y%m%d_%H%M%S')}.json",
+                           mime="application/json", key=key or f"diagnostics_{diag.label}", on_click="ignore")
+
+
+# --- 本機儲存：輸入時自動保存，重新整理頁面或切換日期時還原 ---
+@st.cache_resource
+def open_day_store():
+    """所有 session 共用一個儲存 (SQLite 連線與照片資料夾)；各 session 以 for_owner() 只存取自己的紀錄"""
+    return DayStore()
+
+
+# 日誌擁有者：網址參數 ?diary=<識別碼>，重新整理或以書籤開啟時對應同一份日誌；新的 session 產生新的識別碼
+# 單人使用時可設定 DIARY_STORE_OWNER，所有 session 共用該擁有者的紀錄 (舊版資料庫的紀錄歸 "local")
+STORE_OWNER = os.environ.get("DIARY_STORE_OWNER")
+if "diary_owner" not in st.session_state:
+    st.session_state["diary_owner"] = STORE_OWNER or st.query_params.get("diary", "")[:64] or uuid.uuid4().hex[:12]
+if not STORE_OWNER and st.query_params.get("diary") != st.session_state["diary_owner"]: st.query_params["diary"] = st.session_state["diary_owner"]
+day_store = open_day_store().for_owner(st.session_state["diary_owner"])
+
+
+# --- 背景導出：所有 session 共用一個排程器 (同時執行數有上限，各 session 輪流) ---
+@st.cache_resource
+def export_job_manager():
+    return JobManager()
+
+
+job_manager = export_job_manager()
+if "export_session" not in st.session_state: st.session_state["export_session"] = uuid.uuid4().hex[:8] # 排程器公平輪流的單位
+EXPORT_JOB_POLL_SECONDS = 1.0
+EXPORT_JOB_HISTORY = 5 # 每個 session 保留的已結束工作數 (含可重複下載的檔案)
+
+STAFF_WIDGET_KEYS = {"供應商人員": ("供應商", "sup"), "外包人員": ("外包", "sub")} # 人員分類 -> (欄位標籤, key 前綴)
+
+
+def restore_day(install_day):
+    """把本機儲存中該日期的紀錄填回各輸入欄位 (須在欄位建立前呼叫，例如 on_change)；沒有紀錄時保留目前輸入"""
+    stored = day_store.load_day(install_day)
+    if stored is None: return False
+    ss = st.session_state
+    ss["report_title"] = stored.report_title; ss["recorder"] = stored.recorder; ss["attendees"] = stored.attendees
+    draft = ss["diary"] = DiaryDraft.from_day_record(stored)
+    for group, (_, prefix) in STAFF_WIDGET_KEYS.items():
+        for role, count in zip(ROLE_TYPES, draft.staff_data[group]): ss[f"{prefix}_{role}"] = count
+    for key in [k for k in ss if str(k).startswith("machine_")]: del ss[key]
+    for idx, rows in enumerate(draft.machines.values()):
+        for i, (content, manpower, note) in enumerate(rows, 1):
+            ss[f"machine_{idx}_content_{i}"] = content; ss[f"machine_{idx}_manpower_{i}"] = manpower; ss[f"machine_{idx}_note_{i}"] = note
+    for i, (content, manpower, note) in enumerate(draft.side_rows, 1):
+        ss[f"side_content_{i}"] = content; ss[f"side_manpower_{i}"] = manpower; ss[f"side_note_{i}"] = note
+    return True
+
+
+def load_stored_day(install_day):
+    st.session_state["install_date"] = install_day; restore_day(install_day)
+
+
+def autosave(photo_refs=None):
+    """以目前輸入更新本機儲存 (只寫入有變動的欄位)；photo_refs 為 None 時保留已儲存的照片"""
+    if not st.session_state.get("autosave", True): return
+    ss = st.session_state
+    day = ss["diary"].to_day_record(ss["report_title"], ss["install_date"], ss["attendees"], ss["recorder"])
+    if day_store.save_day(day, photo_refs): ss["autosaved_at"] = time.strftime("%H:%M:%S")
+
+
+# 頁面輸入的結構化資料 (人力、裝機進度、週邊工作)；各區塊為獨立 fragment，輸入時只重跑該區塊，導出時讀取此模型
+if "diary" not in st.session_state:
+    st.session_state["diary"] = DiaryDraft(); st.session_state["install_date"] = date.today()
+    if restore_day(date.today()): st.toast("已由本機儲存還原今天的紀錄")
+diary = st.session_state["diary"]
 
 # --- 新增：報告標題 ---
 st.header("📝 報告標題")
-report_title_input = st.text_input("請輸入報告主標題 (例如：XX專案安裝日記 - YYY設備)")
+report_title_input = st.text_input("請輸入報告主標題 (例如：XX專案安裝日記 - YYY設備)", key="report_title")
 
 
 # --- 基本資料欄位 ---
 st.header("📅 基本資訊")
 col1, col3 = st.columns(2) # 移除天氣欄位後，改為2欄
 with col1:
-    install_date = st.date_input("安裝日期 (將作為新分頁名稱)", value=date.today())
+    install_date = st.date_input("安裝日期 (將作為新分頁名稱)", key="install_date", on_change=lambda: restore_day(st.session_state["install_date"]))
 # with col2: # 天氣欄位已刪除
     # weather_options = ["晴", "陰", "多雲", "陣雨", "雷陣雨", "小雨", "大雨", "其他"]
     # weather = st.selectbox("天氣", options=weather_options, index=0)
 with col3:
-    recorder = st.text_input("記錄人")
+    recorder = st.text_input("記錄人", key="recorder")
 
 # --- 新增：參加人員 ---
 st.header("🧑‍🤝‍🧑 參加人員")
-attendees = st.text_area("請輸入參加人員 (每行一位，或用逗號分隔)", height=100)
-
+attendees = st.text_area("請輸入參加人員 (每行一位，或用逗號分隔)", height=100, key="attendees")
 
 # --- 人力配置 ---
 st.header("👥 人力配置")
 st.write("請填寫供應商人員與外包人員的分類人數")
-# ******** 修改：土木 -> 業務 ********
-role_types = ["機械", "電機", "業務", "軟體"]
-# ***********************************
-staff_data = {}
-# 供應商人員輸入
-cols_sup = st.columns(len(role_types) + 1)
-cols_sup[0].markdown("#### 供應商人員")
-staff_data['供應商人員'] = []
-for i, role in enumerate(role_types):
-    count = cols_sup[i+1].number_input(f"供應商-{role}", min_value=0, step=1, key=f"sup_{role}")
-    staff_data['供應商人員'].append(count)
-# 外包人員輸入
-cols_sub = st.columns(len(role_types) + 1)
-cols_sub[0].markdown("#### 外包人員")
-staff_data['外包人員'] = []
-for i, role in enumerate(role_types):
-    count = cols_sub[i+1].number_input(f"外包-{role}", min_value=0, step=1, key=f"sub_{role}")
-    staff_data['外包人員'].append(count)
+role_types = ROLE_TYPES
+
+
+@st.fragment
+def staff_section():
+    for group, (label, key_prefix) in STAFF_WIDGET_KEYS.items():
+        cols = st.columns(len(role_types) + 1)
+        cols[0].markdown(f"#### {group}")
+        diary.staff_data[group] = [cols[i+1].number_input(f"{label}-{role}", min_value=0, step=1, key=f"{key_prefix}_{role}")
+                                   for i, role in enumerate(role_types)]
+    autosave()
+
+
+staff_section()
 
 # --- 裝機進度 ---
-if "machine_sections" not in st.session_state: st.session_state["machine_sections"] = []
 st.header("🏗️ 裝機進度紀錄")
 new_machine_name = st.text_input("輸入新機台名稱", key="new_machine_input")
 add_machine_button = st.button("➕ 新增機台")
 if add_machine_button and new_machine_name:
-    if new_machine_name not in st.session_state["machine_sections"]:
-        st.session_state["machine_sections"].append(new_machine_name); st.success(f"已新增機台: {new_machine_name}")
-progress_entries = []
-for idx, machine_name in enumerate(st.session_state["machine_sections"]):
+    if diary.add_machine(new_machine_name): st.success(f"已新增機台: {new_machine_name}")
+
+
+@st.fragment
+def machine_section(idx, machine_name):
+    rows = diary.machines[machine_name]
     with st.expander(f"🔧 {machine_name} (點此展開/收合)", expanded=True):
-        for i in range(1, 5): # 裝機進度維持4項
+        for i in range(1, PROGRESS_ITEMS_PER_MACHINE + 1): # 裝機進度維持4項
             st.markdown(f"**第 {i} 項**"); cols = st.columns([4, 1, 2])
-            content = cols[0].text_input(f"內容", key=f"machine_{idx}_content_{i}")
-            manpower = cols[1].number_input(f"人力", key=f"machine_{idx}_manpower_{i}", min_value=0, step=1)
-            note = cols[2].text_input(f"備註", key=f"machine_{idx}_note_{i}")
-            if content: progress_entries.append([machine_name, i, content, manpower, note])
+            content = cols[0].text_input("內容", key=f"machine_{idx}_content_{i}")
+            manpower = cols[1].number_input("人力", key=f"machine_{idx}_manpower_{i}", min_value=0, step=1)
+            note = cols[2].text_input("備註", key=f"machine_{idx}_note_{i}")
+            rows[i - 1] = [content, manpower, note]
+    autosave()
+
+
+for idx, machine_name in enumerate(diary.machines):
+    machine_section(idx, machine_name)
 
 # --- 週邊工作 ---
 st.header("🔧 週邊工作紀錄")
-# ******** 修改：增加到 10 項 ********
-side_entries = []
-for i in range(1, 11): # 項目 1 到 10
-# ***********************************
-    st.markdown(f"**第 {i} 項**"); cols = st.columns([4, 1, 2])
-    content = cols[0].text_input(f"內容 ", key=f"side_content_{i}")
-    manpower = cols[1].number_input(f"人力 ", key=f"side_manpower_{i}", min_value=0, step=1)
-    note = cols[2].text_input(f"備註 ", key=f"side_note_{i}")
-    if content: side_entries.append([i, content, manpower, note])
+
+
+@st.fragment
+def side_section():
+    # ******** 修改：增加到 10 項 ********
+    for i in range(1, SIDE_ITEM_COUNT + 1): # 項目 1 到 10
+    # ***********************************
+        st.markdown(f"**第 {i} 項**"); cols = st.columns([4, 1, 2])
+        content = cols[0].text_input("內容 ", key=f"side_content_{i}")
+        manpower = cols[1].number_input("人力 ", key=f"side_manpower_{i}", min_value=0, step=1)
+        note = cols[2].text_input("備註 ", key=f"side_note_{i}")
+        diary.side_rows[i - 1] = [content, manpower, note]
+    autosave()
+
+
+side_section()
 
 # --- 照片上傳 ---
 st.header("📸 上傳照片")
 st.markdown("**進度留影**")
 photos = st.file_uploader("上傳今天的照片（jpg/png/jpeg）", type=["jpg", "jpeg", "png"], accept_multiple_files=True, key="photo_uploader")
+photo_refs = None # 上傳的照片以內容雜湊存入本機儲存 (每個上傳檔只存一次)
+if photos:
+    stored_photo_ids = st.session_state.setdefault("stored_photo_ids", {})
+    photo_refs = []
+    for photo in photos:
+        file_key = getattr(photo, "file_id", None) or id(photo)
+        if file_key not in stored_photo_ids: stored_photo_ids[file_key] = day_store.put_photo(photo.getvalue())
+        photo_refs.append((stored_photo_ids[file_key], photo.name))
+autosave(photo_refs)
+stored_day = day_store.load_day(install_date)
+stored_photos = stored_day.photos if stored_day else []
+if not photos and stored_photos: st.caption(f"本機儲存中已有 {len(stored_photos)} 張當天照片，導出時會使用")
 
 # --- 新增：上傳舊 Excel 檔案 ---
 st.header("📂 合併舊日誌 (可選)")
 uploaded_excel_file = st.file_uploader("上傳之前的 Excel 安裝日記檔案 (若要合併)", type=["xlsx"])
 
+
+def upload_digest(uploaded_file):
+    """上傳日誌的內容雜湊；依 file_id 記在 session，重跑時不再讀取整份檔案 (查詢與導出的快取都以此為鍵)"""
+    key = getattr(uploaded_file, "file_id", None) or id(uploaded_file)
+    cached = st.session_state.get("journal_digest")
+    if cached is None or cached[0] != key: cached = st.session_state["journal_digest"] = (key, file_digest(uploaded_file))
+    return cached[1]
+
+
 # --- 導出按鈕 ---
 st.header("📄 導出報告")
-col_export1, col_export2 = st.columns(2)
+photo_quality_labels = {"fast": "快速 (草稿)", "balanced": "標準", "best": "最佳 (正式報告，較慢)"}
+photo_quality = st.radio("照片處理品質", options=list(photo_quality_labels), format_func=photo_quality_labels.get,
+                         index=list(photo_quality_labels).index(DEFAULT_PHOTO_QUALITY), horizontal=True, key="photo_quality")
+with st.expander("照片輸出格式與檔案大小"):
+    col_fmt1, col_fmt2, col_fmt3 = st.columns(3)
+    photo_format = col_fmt1.selectbox("照片格式", options=PHOTO_FORMATS, index=PHOTO_FORMATS.index(DEFAULT_PHOTO_FORMAT), key="photo_format")
+    jpeg_quality = col_fmt2.slider("JPEG 品質", min_value=30, max_value=95, value=DEFAULT_JPEG_QUALITY, step=5, key="jpeg_quality", disabled=photo_format != "JPEG")
+    photo_budget_mb = col_fmt3.number_input("每份報告照片大小上限 (MB，0 = 不限)", min_value=0.0, step=1.0, key="photo_budget_mb", disabled=photo_format != "JPEG",
+                                      help="整份報告所有照片的合計上限；由本機儲存產生的完整日誌依各天照片數分配。多日 PDF 不套用此上限。")
+# 照片處理結果依內容雜湊快取於 session，兩種導出與重複導出共用
+if "photo_cache" not in st.session_state: st.session_state["photo_cache"] = PhotoCache()
+photo_cache = st.session_state["photo_cache"]
+photo_options = dict(quality=photo_quality, fmt=photo_format, jpeg_quality=jpeg_quality, size_budget=int(photo_budget_mb * 1024 * 1024) or None, cache=photo_cache)
+if len(photo_cache): st.caption(f"照片快取：{len(photo_cache)} 項，{photo_cache.total_bytes / 1024 / 1024:.1f} MB / {photo_cache.max_bytes / 1024 / 1024:.0f} MB")
+include_summary = st.checkbox("合併舊日誌時加入/更新「統計摘要」分頁", value=True, key="include_summary", disabled=uploaded_excel_file is None)
+
+
+# --- 導出按鈕：送出背景工作，頁面在導出期間仍可操作 ---
+def submit_export(kind, label, task, *args, sheet_unit="分頁"):
+    """送出背景導出工作 (按鈕的 on_click 中呼叫)；只保留最近 EXPORT_JOB_HISTORY 個已結束的工作"""
+    jobs = st.session_state.setdefault("export_jobs", [])
+    finished = [job for job in jobs if not job.active]
+    for job in finished[:max(0, len(finished) - EXPORT_JOB_HISTORY + 1)]: remove_export_job(job)
+    try:
+        jobs.append(job_manager.submit(kind, label, task, *args, session=st.session_state["export_session"], sheet_unit=sheet_unit,
+                                       diagnostics=diagnostics_enabled))
+    except ExportRejected as rejected:
+        st.session_state["export_rejected"] = str(rejected) # 於導出按鈕下方顯示
+
+
+def remove_export_job(job):
+    st.session_state["export_jobs"].remove(job); job.discard() # 輸出的暫存檔立即刪除
+
+
+def sync_diary_from_widgets():
+    """把輸入欄位目前的值寫回 DiaryDraft：按鈕的 on_click 在本次重跑 (含各 fragment) 之前執行，
+    同一次互動中剛修改的欄位尚未經由 fragment 寫入模型"""
+    ss = st.session_state; draft = ss["diary"]
+    for group, (_, prefix) in STAFF_WIDGET_KEYS.items():
+        draft.staff_data[group] = [ss.get(f"{prefix}_{role}", count) for role, count in zip(ROLE_TYPES, draft.staff_data[group])]
+    for idx, rows in enumerate(draft.machines.values()):
+        for i, row in enumerate(rows, 1):
+            rows[i - 1] = [ss.get(f"machine_{idx}_content_{i}", row[0]), ss.get(f"machine_{idx}_manpower_{i}", row[1]), ss.get(f"machine_{idx}_note_{i}", row[2])]
+    for i, row in enumerate(draft.side_rows, 1):
+        draft.side_rows[i - 1] = [ss.get(f"side_content_{i}", row[0]), ss.get(f"side_manpower_{i}", row[1]), ss.get(f"side_note_{i}", row[2])]
+
+
+def current_day_record(day_photos):
+    """送出當下的輸入內容 (之後的編輯不影響已送出的導出)"""
+    ss = st.session_state; sync_diary_from_widgets()
+    return ss["diary"].to_day_record(ss["report_title"], ss["install_date"], ss["attendees"], ss["recorder"], day_photos)
+
+
+def submit_day_export(kind, day_photos, options, journal, with_summary):
+    day = current_day_record(day_photos)
+    if kind == "excel":
+        submit_export("excel", f"Excel {day.sheet_name}", excel_day_task, day, options,
+                      spool_upload(journal) if journal is not None else None, with_summary, upload_digest(journal) if journal is not None else None)
+    else:
+        submit_export("pdf", f"PDF {day.sheet_name}", pdf_day_task, day, options)
 
-# --- 輔助函數：定義 Excel 樣式 (移到按鈕外部) ---
-bold_font_excel = Font(name="標楷體", size=11, bold=True)
-normal_font_excel = Font(name="標楷體", size=11)
-title_font_excel = Font(name="標楷體", size=14, bold=True) # 新增報告標題字體
-thin_border_side_excel = Side(style='thin', color='000000')
-thin_border_excel = Border(left=thin_border_side_excel, right=thin_border_side_excel, top=thin_border_side_excel, bottom=thin_border_side_excel)
-center_align_wrap_excel = Alignment(horizontal="center", vertical="center", wrap_text=True)
-left_align_wrap_excel = Alignment(horizontal="left", vertical="center", wrap_text=True)
-DEFAULT_COL_WIDTH_EXCEL = 18
-DEFAULT_ROW_HEIGHT_EXCEL = 25
-IMAGE_ROW_HEIGHT_EXCEL = 120
-NUM_COLS_TOTAL_EXCEL = 6
-
-# --- 輔助函數：將一天資料寫入指定的 Excel 工作表 ---
-def write_day_to_excel_sheet(ws, report_title_ws, install_date_ws, attendees_ws, recorder_ws, staff_data_ws, progress_entries_ws, side_entries_ws, photos_ws):
-    """將一天的所有資料寫入指定的 openpyxl worksheet (ws)"""
-
-    for i in range(1, NUM_COLS_TOTAL_EXCEL + 1):
-        ws.column_dimensions[get_column_letter(i)].width = DEFAULT_COL_WIDTH_EXCEL
-    current_row_ws = 1
-
-    def write_styled_cell_internal(row, col, value, font, alignment, border=thin_border_excel):
-        cell = ws.cell(row=row, column=col)
-        cell.value = value; cell.font = font; cell.alignment = alignment
-        if border: cell.border = border
-        current_height = ws.row_dimensions[row].height
-        if current_height is None or current_height < DEFAULT_ROW_HEIGHT_EXCEL: ws.row_dimensions[row].height = DEFAULT_ROW_HEIGHT_EXCEL
-
-    def apply_styles_only_internal(row, col, font, alignment, border=thin_border_excel):
-        cell = ws.cell(row=row, column=col)
-        cell.font = font; cell.alignment = alignment
-        if border: cell.border = border
-        current_height = ws.row_dimensions[row].height
-        if current_height is None or current_height < DEFAULT_ROW_HEIGHT_EXCEL: ws.row_dimensions[row].height = DEFAULT_ROW_HEIGHT_EXCEL
-
-    # --- 新增：寫入報告標題 ---
-    if report_title_ws:
-        ws.merge_cells(start_row=current_row_ws, start_column=1, end_row=current_row_ws, end_column=NUM_COLS_TOTAL_EXCEL)
-        write_styled_cell_internal(current_row_ws, 1, report_title_ws, title_font_excel, center_align_wrap_excel, border=None)
-        ws.row_dimensions[current_row_ws].height = 30 # 加高標題列
-        current_row_ws += 1
-        ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL # 空行
-        current_row_ws += 1
-
-
-    # --- 寫入基本資訊 ---
-    ws.merge_cells(start_row=current_row_ws, start_column=2, end_row=current_row_ws, end_column=NUM_COLS_TOTAL_EXCEL)
-    write_styled_cell_internal(current_row_ws, 1, "日期", bold_font_excel, center_align_wrap_excel)
-    write_styled_cell_internal(current_row_ws, 2, str(install_date_ws), normal_font_excel, center_align_wrap_excel)
-    for c in range(3, NUM_COLS_TOTAL_EXCEL + 1): apply_styles_only_internal(current_row_ws, c, normal_font_excel, center_align_wrap_excel, thin_border_excel)
-    current_row_ws += 1
-    # 天氣欄位已刪除
-
-    # --- 新增：寫入參加人員 ---
-    if attendees_ws:
-        ws.merge_cells(start_row=current_row_ws, start_column=2, end_row=current_row_ws, end_column=NUM_COLS_TOTAL_EXCEL)
-        write_styled_cell_internal(current_row_ws, 1, "參加人員", bold_font_excel, left_align_wrap_excel) # 靠左
-        write_styled_cell_internal(current_row_ws, 2, attendees_ws, normal_font_excel, left_align_wrap_excel) # 靠左
-        for c in range(3, NUM_COLS_TOTAL_EXCEL + 1): apply_styles_only_internal(current_row_ws, c, normal_font_excel, left_align_wrap_excel, thin_border_excel)
-        current_row_ws += 1
-
-    ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL; current_row_ws += 1
-
-    # --- 寫入人力配置 ---
-    header_staff = ["人員分類", *role_types, "總計"] # role_types 已更新
-    for col_idx, header_text in enumerate(header_staff, 1):
-        if col_idx <= NUM_COLS_TOTAL_EXCEL: write_styled_cell_internal(current_row_ws, col_idx, header_text, bold_font_excel, center_align_wrap_excel)
-    current_row_ws += 1
-    for group in ["供應商人員", "外包人員"]:
-        group_counts = staff_data_ws.get(group, [])
-        processed_counts = []; valid_data = True
-        if isinstance(group_counts, list):
-            for item in group_counts:
-                if isinstance(item, (int, float)): processed_counts.append(item)
-                else:
-                    try: processed_counts.append(int(item))
-                    except (ValueError, TypeError): valid_data = False; processed_counts.append(0)
-        else: valid_data = False; processed_counts = [0] * len(role_types)
-        total = sum(processed_counts) if valid_data or processed_counts else 0
-        row_data = [group, *processed_counts, total]
-        for col_idx, cell_value in enumerate(row_data, 1):
-             if col_idx <= NUM_COLS_TOTAL_EXCEL:
-                align = left_align_wrap_excel if col_idx == 1 else center_align_wrap_excel
-                write_styled_cell_internal(current_row_ws, col_idx, cell_value, normal_font_excel, align)
-        current_row_ws += 1
-    ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL; current_row_ws += 1
-
-    # --- 寫入裝機進度 ---
-    if progress_entries_ws:
-        ws.merge_cells(start_row=current_row_ws, start_column=1, end_row=current_row_ws, end_column=NUM_COLS_TOTAL_EXCEL)
-        write_styled_cell_internal(current_row_ws, 1, "裝機進度", bold_font_excel, center_align_wrap_excel)
-        for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): apply_styles_only_internal(current_row_ws, c, bold_font_excel, center_align_wrap_excel, thin_border_excel)
-        current_row_ws += 1
-        header_progress = ["機台", "項次", "內容", "人力", "備註"]
-        write_styled_cell_internal(current_row_ws, 1, header_progress[0], bold_font_excel, center_align_wrap_excel); write_styled_cell_internal(current_row_ws, 2, header_progress[1], bold_font_excel, center_align_wrap_excel)
-        ws.merge_cells(start_row=current_row_ws, start_column=3, end_row=current_row_ws, end_column=4); write_styled_cell_internal(current_row_ws, 3, header_progress[2], bold_font_excel, center_align_wrap_excel)
-        apply_styles_only_internal(current_row_ws, 4, bold_font_excel, center_align_wrap_excel, thin_border_excel); write_styled_cell_internal(current_row_ws, 5, header_progress[3], bold_font_excel, center_align_wrap_excel); write_styled_cell_internal(current_row_ws, 6, header_progress[4], bold_font_excel, center_align_wrap_excel)
-        current_row_ws += 1
-        for row_data in progress_entries_ws:
-            machine, item, content, manpower, note = row_data
-            write_styled_cell_internal(current_row_ws, 1, machine, normal_font_excel, left_align_wrap_excel); write_styled_cell_internal(current_row_ws, 2, item, normal_font_excel, center_align_wrap_excel)
-            ws.merge_cells(start_row=current_row_ws, start_column=3, end_row=current_row_ws, end_column=4); write_styled_cell_internal(current_row_ws, 3, content, normal_font_excel, left_align_wrap_excel) # 內容靠左
-            apply_styles_only_internal(current_row_ws, 4, normal_font_excel, left_align_wrap_excel, thin_border_excel); write_styled_cell_internal(current_row_ws, 5, manpower, normal_font_excel, center_align_wrap_excel); write_styled_cell_internal(current_row_ws, 6, note, normal_font_excel, left_align_wrap_excel) # 備註靠左
-            current_row_ws += 1
-        ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL; current_row_ws += 1
-
-    # --- 寫入週邊工作 ---
-    if side_entries_ws: # 週邊工作項數已在 UI 增加
-        ws.merge_cells(start_row=current_row_ws, start_column=1, end_row=current_row_ws, end_column=NUM_COLS_TOTAL_EXCEL)
-        write_styled_cell_internal(current_row_ws, 1, "週邊工作", bold_font_excel, center_align_wrap_excel)
-        for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): apply_styles_only_internal(current_row_ws, c, bold_font_excel, center_align_wrap_excel, thin_border_excel)
-        current_row_ws += 1
-        header_side = ["項次", "內容", "人力", "備註"]
-        write_styled_cell_internal(current_row_ws, 1, header_side[0], bold_font_excel, center_align_wrap_excel)
-        ws.merge_cells(start_row=current_row_ws, start_column=2, end_row=current_row_ws, end_column=4); write_styled_cell_internal(current_row_ws, 2, header_side[1], bold_font_excel, center_align_wrap_excel)
-        apply_styles_only_internal(current_row_ws, 3, bold_font_excel, center_align_wrap_excel, thin_border_excel); apply_styles_only_internal(current_row_ws, 4, bold_font_excel, center_align_wrap_excel, thin_border_excel)
-        write_styled_cell_internal(current_row_ws, 5, header_side[2], bold_font_excel, center_align_wrap_excel); write_styled_cell_internal(current_row_ws, 6, header_side[3], bold_font_excel, center_align_wrap_excel)
-        current_row_ws += 1
-        for row_data in side_entries_ws:
-            item, content, manpower, note = row_data
-            write_styled_cell_internal(current_row_ws, 1, item, normal_font_excel, center_align_wrap_excel)
-            ws.merge_cells(start_row=current_row_ws, start_column=2, end_row=current_row_ws, end_column=4); write_styled_cell_internal(current_row_ws, 2, content, normal_font_excel, left_align_wrap_excel) # 內容靠左
-            apply_styles_only_internal(current_row_ws, 3, normal_font_excel, left_align_wrap_excel, thin_border_excel); apply_styles_only_internal(current_row_ws, 4, normal_font_excel, left_align_wrap_excel, thin_border_excel)
-            write_styled_cell_internal(current_row_ws, 5, manpower, normal_font_excel, center_align_wrap_excel); write_styled_cell_internal(current_row_ws, 6, note, normal_font_excel, left_align_wrap_excel) # 備註靠左
-            current_row_ws += 1
-        ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL; current_row_ws += 1
-
-    # --- 處理圖片區域 ---
-    if photos_ws:
-        ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL; current_row_ws += 1
-        ws.merge_cells(start_row=current_row_ws, start_column=1, end_row=current_row_ws, end_column=NUM_COLS_TOTAL_EXCEL)
-        write_styled_cell_internal(current_row_ws, 1, "進度留影", bold_font_excel, center_align_wrap_excel, border=None)
-        for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): apply_styles_only_internal(current_row_ws, c, bold_font_excel, center_align_wrap_excel, border=None)
-        ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL; current_row_ws += 1
-        try: default_char_width_approx = 7; target_img_width_px = int(DEFAULT_COL_WIDTH_EXCEL * 3 * default_char_width_approx)
-        except: target_img_width_px = int(18 * 3 * 7)
-        target_img_height_px = int(IMAGE_ROW_HEIGHT_EXCEL / 0.75)
-        width_adjustment = 8; adjusted_target_width_px = max(1, target_img_width_px - width_adjustment)
-        img_col_width = 3; num_img_cols = 2
-        for i in range(0, len(photos_ws), num_img_cols):
-            ws.row_dimensions[current_row_ws].height = IMAGE_ROW_HEIGHT_EXCEL
-            ws.row_dimensions[current_row_ws + 1].height = DEFAULT_ROW_HEIGHT_EXCEL
-            for j in range(num_img_cols):
-                photo_index = i + j
-                if photo_index < len(photos_ws):
-                    img_file = photos_ws[photo_index]; filename = img_file.name
-                    try:
-                        img = PILImage.open(img_file); img = ImageOps.exif_transpose(img)
-                        img_w, img_h = img.size; assert img_w > 0 and img_h > 0
-                        target_size = (adjusted_target_width_px, target_img_height_px)
-                        img_cropped = ImageOps.fit(img, target_size, method=PILImage.Resampling.LANCZOS)
-                        img_buffer = BytesIO(); img_cropped.save(img_buffer, format='PNG'); img_buffer.seek(0)
-                        col_start = 1 + j * img_col_width; anchor_cell = f"{get_column_letter(col_start)}{current_row_ws}"
-                        xl_img = XLImage(img_buffer); ws.add_image(xl_img, anchor_cell)
-                        col_end = col_start + img_col_width - 1
-                        merge_range_caption = f"{get_column_letter(col_start)}{current_row_ws + 1}:{get_column_letter(col_end)}{current_row_ws + 1}"
-                        ws.merge_cells(merge_range_caption)
-                        write_styled_cell_internal(current_row_ws + 1, col_start, f"說明：{filename}", normal_font_excel, center_align_wrap_excel)
-                        for c_idx in range(col_start + 1, col_end + 1): apply_styles_only_internal(current_row_ws + 1, c_idx, normal_font_excel, center_align_wrap_excel, thin_border_excel)
-                        for r_idx in [current_row_ws]:
-                            for c_idx in range(col_start, col_end + 1): apply_styles_only_internal(r_idx, c_idx, normal_font_excel, Alignment(vertical="center"), thin_border_excel)
-                    except Exception as e:
-                        st.error(f"處理圖片 {filename} 時發生錯誤 (將在 Excel 中標記): {e}")
-                        col_start = 1 + j * img_col_width; col_end = col_start + img_col_width - 1
-                        merge_range_caption = f"{get_column_letter(col_start)}{current_row_ws + 1}:{get_column_letter(col_end)}{current_row_ws + 1}"
-                        try: ws.merge_cells(merge_range_caption)
-                        except: pass
-                        write_styled_cell_internal(current_row_ws + 1, col_start, f"圖片錯誤", normal_font_excel, center_align_wrap_excel)
-                        for c_idx in range(col_start + 1, col_end + 1): apply_styles_only_internal(current_row_ws + 1, c_idx, normal_font_excel, center_align_wrap_excel, thin_border_excel)
-            current_row_ws += 2
-
-    # --- 添加記錄人資訊 (Excel 底部) ---
-    ws.row_dimensions[current_row_ws].height = DEFAULT_ROW_HEIGHT_EXCEL
-    current_row_ws += 1
-    recorder_text = f"記錄人： {recorder_ws}"
-    merge_start_col = 1; merge_end_col = NUM_COLS_TOTAL_EXCEL
-    merge_range_recorder = f"{get_column_letter(merge_start_col)}{current_row_ws}:{get_column_letter(merge_end_col)}{current_row_ws}"
-    try: ws.merge_cells(merge_range_recorder)
-    except Exception as merge_err: merge_end_col = merge_start_col
-    write_styled_cell_internal(current_row_ws, merge_start_col, recorder_text, normal_font_excel, left_align_wrap_excel, border=thin_border_excel)
-    if merge_end_col > merge_start_col:
-        for c in range(merge_start_col + 1, merge_end_col + 1): apply_styles_only_internal(current_row_ws, c, normal_font_excel, left_align_wrap_excel, border=thin_border_excel)
-
-# --- Excel 導出按鈕邏輯 ---
+
+col_export1, col_export2 = st.columns(2)
 with col_export1:
-    if st.button("✅ 產出/合併 Excel"):
-        current_report_title = report_title_input
-        current_install_date = install_date
-        current_attendees = attendees
-        current_recorder = recorder
-        current_staff_data = staff_data
-        current_progress_entries = progress_entries
-        current_side_entries = side_entries
-        current_photos = photos
-        new_sheet_name = current_install_date.strftime("%Y-%m-%d")
-
-        wb = None
-        if uploaded_excel_file is not None:
-            try:
-                wb = load_workbook(uploaded_excel_file)
-                st.info(f"已加載舊檔案: {uploaded_excel_file.name}。將添加/覆蓋分頁 '{new_sheet_name}'。")
-                if new_sheet_name in wb.sheetnames:
-                    # st.warning(f"工作表 '{new_sheet_name}' 已存在，將覆蓋其內容。")
-                    ws = wb[new_sheet_name]
-                    # 簡單起見，這裡不清除舊內容，直接覆蓋
-                else:
-                    ws = wb.create_sheet(title=new_sheet_name)
-            except Exception as e:
-                st.error(f"讀取上傳的 Excel 檔案時出錯: {e}")
-                st.warning("將創建全新的 Excel 檔案。")
-                wb = None
-        if wb is None:
-            wb = Workbook()
-            if "Sheet" in wb.sheetnames and len(wb.sheetnames) > 1 : # 移除預設工作表 (如果有多個)
-                del wb["Sheet"]
-            ws = wb.active
-            ws.title = new_sheet_name
-            # st.info(f"創建新 Excel 檔案，分頁 '{new_sheet_name}'。")
-
-        try:
-            write_day_to_excel_sheet(ws, current_report_title, current_install_date, current_attendees, current_recorder,
-                                     current_staff_data, current_progress_entries, current_side_entries, current_photos)
-            excel_file = BytesIO()
-            wb.save(excel_file)
-            excel_file.seek(0)
-            excel_file_name = f"{current_report_title}_{current_install_date.strftime('%Y%m%d')}.xlsx" if current_report_title else f"安裝日記_{current_install_date.strftime('%Y%m%d')}.xlsx"
-            if uploaded_excel_file and current_report_title: # 如果合併且有報告標題
-                 excel_file_name = f"{current_report_title}_合併_{current_install_date.strftime('%Y%m%d')}.xlsx"
-            elif uploaded_excel_file: # 如果合併但無報告標題
-                 excel_file_name = f"安裝日記_合併_{current_install_date.strftime('%Y%m%d')}.xlsx"
-
-
-            st.download_button(label="📥 下載 Excel 檔案", data=excel_file, file_name=excel_file_name, mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
-            st.success(f"檔案 {excel_file_name} 已成功產生/合併！")
-        except Exception as write_err:
-             st.error(f"寫入資料到 Excel 工作表 '{ws.title}' 時發生錯誤: {write_err}")
-
-# --- PDF 導出按鈕邏輯 (只產生當天資料) ---
+    st.button("✅ 產出/合併 Excel", on_click=submit_day_export, args=("excel", photos or stored_photos, photo_options, uploaded_excel_file, include_summary))
 with col_export2:
-    if st.button("📄 產出 PDF 報告 (僅當天)"):
-        st.info("PDF 報告目前只會包含您在頁面上輸入的當天資料。")
-        pdf_buffer = BytesIO()
-        page_width, page_height = A4
-        margin = 1.5*units.cm
-        doc_width = page_width - 2 * margin
-
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='CJKNormal', parent=styles['Normal'], fontName=CJK_FONT_NAME, fontSize=10, alignment=TA_LEFT))
-        styles.add(ParagraphStyle(name='CJKBold', parent=styles['CJKNormal'], fontName=CJK_FONT_NAME, fontSize=10, alignment=TA_LEFT))
-        # 主標題 (報告標題)
-        styles.add(ParagraphStyle(name='CJKMainTitle', parent=styles['h1'], fontName=CJK_FONT_NAME, fontSize=20, alignment=TA_CENTER, spaceAfter=6))
-        # 副標題 (工廠安裝日記)
-        styles.add(ParagraphStyle(name='CJKSubTitle', parent=styles['h2'], fontName=CJK_FONT_NAME, fontSize=16, alignment=TA_CENTER, spaceAfter=12))
-        styles.add(ParagraphStyle(name='CJKHeading2', fontName=CJK_FONT_NAME, fontSize=14, leading=17, alignment=TA_LEFT, spaceBefore=6, spaceAfter=6))
-        styles.add(ParagraphStyle(name='CJKTableContent', parent=styles['Normal'], fontName=CJK_FONT_NAME, fontSize=9, alignment=TA_CENTER))
-        styles.add(ParagraphStyle(name='CJKTableContentLeft', parent=styles['CJKTableContent'], alignment=TA_LEFT))
-        styles.add(ParagraphStyle(name='CJKFooterTitleBold', fontName=CJK_FONT_NAME, fontSize=14, alignment=TA_LEFT, leading=17))
-
-        doc = SimpleDocTemplate(pdf_buffer, pagesize=A4, leftMargin=margin, rightMargin=margin, topMargin=margin, bottomMargin=margin, title=f"安裝日記_{install_date}", author="工廠安裝日記自動生成器")
-        story = []
-
-        # --- PDF 內容 - 第一頁 ---
-        if report_title_input:
-            story.append(Paragraph(report_title_input, styles['CJKMainTitle']))
-            story.append(Paragraph("安裝日誌", styles['CJKSubTitle']))
-        else:
-            story.append(Paragraph("工廠安裝日記", styles['CJKMainTitle'])) # 如果沒有輸入報告標題，使用預設
-        story.append(Spacer(1, 0.5*units.cm))
-
-        # 基本資訊表格
-        basic_info_data = [
-            [Paragraph("<b>日期</b>", styles['CJKNormal']), Paragraph(str(install_date), styles['CJKNormal'])],
-            # 天氣已刪除
-        ]
-        basic_info_table = Table(basic_info_data, colWidths=[doc_width/4, doc_width*3/4]) # 調整欄寬以適應兩欄
-        basic_info_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.grey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE')]))
-        story.append(basic_info_table); story.append(Spacer(1, 0.2*units.cm)) # 縮小間距
-
-        # 參加人員
-        if attendees:
-            story.append(Paragraph("<b>參加人員：</b>", styles['CJKNormal']))
-            # 將 attendees 字串按換行符分割，然後用逗號連接（如果使用者用換行輸入）
-            # 或者直接顯示 text_area 的內容
-            attendees_display = attendees.replace('\n', ', ')
-            story.append(Paragraph(attendees_display, styles['CJKNormal']))
-            story.append(Spacer(1, 0.5*units.cm))
-
-
-        story.append(Paragraph("人力配置", styles['CJKHeading2']))
-        staff_header = [Paragraph(f"<b>{h}</b>", styles['CJKTableContent']) for h in ["人員分類", *role_types, "總計"]]
-        staff_table_data = [staff_header]
-        for group in ["供應商人員", "外包人員"]:
-            group_counts = staff_data.get(group, []); processed_counts = [int(c) for c in group_counts]; total = sum(processed_counts)
-            row_data_text = [Paragraph(group, styles['CJKTableContentLeft'])] + [Paragraph(str(c), styles['CJKTableContent']) for c in processed_counts] + [Paragraph(str(total), styles['CJKTableContent'])]
-            staff_table_data.append(row_data_text)
-        staff_col_widths = [doc_width*0.225] + [doc_width*0.15]*len(role_types) + [doc_width*0.175]
-        staff_table = Table(staff_table_data, colWidths=staff_col_widths)
-        staff_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.black), ('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE'), ('ALIGN', (1,0), (-1,-1), 'CENTER')]))
-        story.append(staff_table); story.append(Spacer(1, 0.5*units.cm))
-
-        if progress_entries:
-            story.append(Paragraph("裝機進度紀錄", styles['CJKHeading2']))
-            progress_header = [Paragraph(f"<b>{h}</b>", styles['CJKTableContent']) for h in ["機台", "項次", "內容", "人力", "備註"]]
-            progress_table_data = [progress_header]
-            for entry in progress_entries:
-                row_data_text = [Paragraph(str(entry[0]), styles['CJKTableContentLeft']), Paragraph(str(entry[1]), styles['CJKTableContent']), Paragraph(str(entry[2]), styles['CJKTableContentLeft']), Paragraph(str(entry[3]), styles['CJKTableContent']), Paragraph(str(entry[4]), styles['CJKTableContentLeft'])]
-                progress_table_data.append(row_data_text)
-            progress_table = Table(progress_table_data, colWidths=[doc_width*0.15, doc_width*0.1, doc_width*0.4, doc_width*0.1, doc_width*0.25])
-            progress_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.black), ('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE'), ('ALIGN', (1,1), (1,-1), 'CENTER'), ('ALIGN', (3,1), (3,-1), 'CENTER')]))
-            story.append(progress_table); story.append(Spacer(1, 0.5*units.cm))
-
-        if side_entries: # 週邊工作項數已增加
-            story.append(Paragraph("週邊工作紀錄", styles['CJKHeading2']))
-            side_header = [Paragraph(f"<b>{h}</b>", styles['CJKTableContent']) for h in ["項次", "內容", "人力", "備註"]]
-            side_table_data = [side_header]
-            for entry in side_entries:
-                row_data_text = [Paragraph(str(entry[0]), styles['CJKTableContent']), Paragraph(str(entry[1]), styles['CJKTableContentLeft']), Paragraph(str(entry[2]), styles['CJKTableContent']), Paragraph(str(entry[3]), styles['CJKTableContentLeft'])]
-                side_table_data.append(row_data_text)
-            side_table = Table(side_table_data, colWidths=[doc_width*0.1, doc_width*0.55, doc_width*0.1, doc_width*0.25])
-            side_table.setStyle(TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.black), ('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE'), ('ALIGN', (0,1), (0,-1), 'CENTER'), ('ALIGN', (2,1), (2,-1), 'CENTER')]))
-            story.append(side_table); story.append(Spacer(1, 0.5*units.cm))
-
-        # --- 換頁 ---
-        story.append(PageBreak())
-
-        # --- PDF 內容 - 第二頁 (圖片) ---
-        story.append(Paragraph("進度留影", styles['CJKHeading2']))
-        story.append(Spacer(1, 0.5*units.cm))
-
-        if photos:
-            img_margin = 0.5 * units.cm
-            img_width_pt = (doc_width - img_margin) / 2
-            img_height_pt = 6 * units.cm
-            target_width_px = int(img_width_pt * (4/3))
-            target_height_px = int(img_height_pt * (4/3))
-            target_size_px = (target_width_px, target_height_px)
-
-            for i in range(0, len(photos), 2):
-                img_row_content = []
-                img_file_left = photos[i]
-                try:
-                    img_pil_left = PILImage.open(img_file_left); img_pil_left = ImageOps.exif_transpose(img_pil_left)
-                    img_cropped_left = ImageOps.fit(img_pil_left, target_size_px, method=PILImage.Resampling.LANCZOS)
-                    img_buffer_left = BytesIO(); img_cropped_left.save(img_buffer_left, format='PNG'); img_buffer_left.seek(0)
-                    rl_img_left = Image(img_buffer_left, width=img_width_pt, height=img_height_pt)
-                    img_row_content.append(rl_img_left)
-                except Exception as img_err:
-                    st.error(f"處理圖片 {img_file_left.name} 時發生錯誤: {img_err}")
-                    img_row_content.append(Paragraph(f"[圖片錯誤: {img_file_left.name}]", styles['CJKNormal']))
-
-                img_row_content.append(Spacer(img_margin, 1))
-
-                if i + 1 < len(photos):
-                    img_file_right = photos[i+1]
-                    try:
-                        img_pil_right = PILImage.open(img_file_right); img_pil_right = ImageOps.exif_transpose(img_pil_right)
-                        img_cropped_right = ImageOps.fit(img_pil_right, target_size_px, method=PILImage.Resampling.LANCZOS)
-                        img_buffer_right = BytesIO(); img_cropped_right.save(img_buffer_right, format='PNG'); img_buffer_right.seek(0)
-                        rl_img_right = Image(img_buffer_right, width=img_width_pt, height=img_height_pt)
-                        img_row_content.append(rl_img_right)
-                    except Exception as img_err:
-                        st.error(f"處理圖片 {img_file_right.name} 時發生錯誤: {img_err}")
-                        img_row_content.append(Paragraph(f"[圖片錯誤: {img_file_right.name}]", styles['CJKNormal']))
+    st.button("📄 產出 PDF 報告 (僅當天)", on_click=submit_day_export, args=("pdf", photos or stored_photos, photo_options, None, False),
+              help="PDF 報告目前只會包含您在頁面上輸入的當天資料。")
+if "export_rejected" in st.session_state: st.warning(st.session_state.pop("export_rejected"))
+admission = job_manager.admission_text() # 送出前先告知目前的排程狀態
+if admission: st.caption(f"🖥️ 伺服器：{admission}")
+
+# --- 多日合併 PDF (週報/月報，由上傳的舊日誌產生) ---
+st.subheader("📚 多日 PDF 報告")
+if uploaded_excel_file is None:
+    st.caption("請先於「合併舊日誌」上傳 Excel 日誌，即可將其中多天合併為一份附目錄的 PDF。")
+else:
+    col_range1, col_range2 = st.columns(2)
+    range_start = col_range1.date_input("起始日期", value=install_date - timedelta(days=6), key="multi_pdf_start")
+    range_end = col_range2.date_input("結束日期", value=install_date, key="multi_pdf_end")
+    st.button("📚 產出多日 PDF 報告", on_click=lambda: submit_export(
+        "multi_pdf", f"多日 PDF {range_start} ~ {range_end}", journal_pdf_task, spool_upload(uploaded_excel_file),
+        range_start, range_end, report_title_input or None, photo_options, sheet_unit="天"))
+
+
+# --- 導出工作 (背景執行；進行中時每秒更新進度，完成的檔案保留在 session 可重複下載) ---
+def render_export_jobs(polling):
+    jobs = st.session_state.get("export_jobs", [])
+    if polling and not any(job.active for job in jobs):
+        st.rerun() # 全部結束：重跑整頁以停止定時更新
+    for job in reversed(jobs):
+        with st.container(border=True):
+            col_job1, col_job2 = st.columns([5, 1])
+            col_job1.markdown(f"**{job.label}** — {job.status}" + (f" ({job.elapsed:.1f}s)" if job.started_at else ""))
+            if job.active:
+                col_job1.progress(job.fraction, text="取消中…" if job.cancelling else job.progress_text)
+                col_job2.button("⏹️ 取消", key=f"cancel_{job.id}", on_click=job.cancel, disabled=job.cancelling)
+            else:
+                col_job2.button("🗑️ 移除", key=f"remove_{job.id}", on_click=remove_export_job, args=(job,))
+            for level, text in job.messages: getattr(st, level)(text)
+            if job.status == DONE:
+                st.download_button(f"📥 下載 {job.file_name} ({job.output_size / 1024 / 1024:.1f} MB)", data=job.read_output, file_name=job.file_name, mime=job.mime,
+                                   key=f"download_{job.id}", on_click="ignore")
+            elif job.status == FAILED:
+                st.error(str(job.exception))
+            if not job.active: show_diagnostics(job.diagnostics, key=f"diagnostics_{job.id}")
+
+
+export_jobs = st.session_state.get("export_jobs", [])
+if export_jobs:
+    st.subheader("⏳ 導出工作")
+    polling = any(job.active for job in export_jobs)
+    st.fragment(render_export_jobs, run_every=EXPORT_JOB_POLL_SECONDS if polling else None)(polling)
+
+# --- 日誌查詢 (由上傳的舊日誌建立索引，同一檔案只解析一次) ---
+if uploaded_excel_file is not None:
+    from journal_index import load_journal_index
+    from journal_analytics import summary_tables, weekly_machine_progress, ROLLING_DAYS
+    st.header("🔍 日誌查詢")
+    try:
+        journal_index = load_journal_index(uploaded_excel_file, upload_digest(uploaded_excel_file))
+    except Exception as index_err:
+        journal_index = None
+        st.error(f"無法解析上傳的日誌: {index_err}")
+    if journal_index is not None and len(journal_index):
+        first_day, last_day = journal_index.date_range
+        st.caption(f"共 {len(journal_index)} 天 ({first_day} ~ {last_day})，裝機項目 {len(journal_index.progress)} 筆，週邊工作 {len(journal_index.side)} 筆")
+        col_query1, col_query2 = st.columns(2)
+        with col_query1:
+            st.markdown("**各機台累計人力**")
+            st.dataframe(journal_index.manpower_by_machine(), width="stretch")
+        with col_query2:
+            keyword = st.text_input("搜尋裝機進度 / 週邊工作 (內容或備註)", key="journal_search")
+            if keyword:
+                hits = journal_index.search(keyword)
+                st.caption(f"找到 {len(hits)} 筆")
+                st.dataframe(hits.assign(date=hits["date"].dt.date), width="stretch", hide_index=True)
+        with st.expander("📈 統計分析", expanded=False):
+            tables = summary_tables(journal_index)
+            st.markdown(f"**每日人力 (含近 {ROLLING_DAYS} 日平均)**")
+            st.line_chart(tables["每日人力"])
+            col_chart1, col_chart2 = st.columns(2)
+            with col_chart1:
+                st.markdown("**各職務累計人天**")
+                st.bar_chart(tables["各職務累計人天"][STAFF_GROUPS])
+            with col_chart2:
+                st.markdown("**各機台累計人力**")
+                st.bar_chart(tables["各機台累計人力"]["人力"])
+            st.markdown("**每週裝機項目數 (依機台)**")
+            st.bar_chart(weekly_machine_progress(journal_index))
+            st.dataframe(tables["每週進度"].set_index(tables["每週進度"].index.date), width="stretch")
+        with st.expander("🖼️ 重複照片", expanded=False):
+            if st.checkbox("比對日誌中各天的照片 (第一次需讀取日誌中所有圖片)", key="journal_duplicates"):
+                from photo_dedup import load_journal_fingerprints, find_duplicates
+                duplicate_photos = find_duplicates(load_journal_fingerprints(uploaded_excel_file, upload_digest(uploaded_excel_file)))
+                if duplicate_photos:
+                    st.dataframe([{"日期": m.photo.source, "照片": m.photo.name, "重複於": m.reference.label,
+                                   "類型": "相同" if m.identical else f"相似 (差異 {m.distance}/64)"} for m in duplicate_photos],
+                                 width="stretch", hide_index=True)
                 else:
-                    img_row_content.append(Spacer(img_width_pt, img_height_pt))
-
-                img_table = Table([img_row_content], colWidths=[img_width_pt, img_margin, img_width_pt])
-                img_table.setStyle(TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP')]))
-                story.append(img_table)
-                story.append(Spacer(1, 0.5*units.cm))
-
-        # --- PDF 內容 - 結尾記錄人 ---
-        story.append(Spacer(1, 1*units.cm))
-        story.append(Paragraph(f"<b>記錄人： {recorder}</b>", styles['CJKFooterTitleBold']))
-
-        # --- 生成 PDF ---
-        try:
-            doc.build(story)
-            st.success("PDF 報告已成功產生！")
-            pdf_buffer.seek(0)
-            pdf_file_name = f"{report_title_input}_{install_date}.pdf" if report_title_input else f"安裝日記_{install_date}.pdf"
-            st.download_button(label="📥 下載 PDF 報告", data=pdf_buffer, file_name=pdf_file_name, mime="application/pdf")
-        except Exception as pdf_err:
-            st.error(f"產生 PDF 時發生錯誤: {pdf_err}")
-            st.error("可能的原因包括：中文字體問題、圖片處理錯誤或 ReportLab 內部錯誤。請檢查 Streamlit 終端輸出獲取更詳細的錯誤信息。")
+                    st.caption("沒有發現相同或相似的照片。")
+    elif journal_index is not None:
+        st.info("上傳的檔案中沒有可辨識的日誌分頁。")
+
+# --- 側欄：本機儲存 ---
+with st.sidebar:
+    st.header("💾 本機儲存")
+    if not STORE_OWNER: st.caption(f"日誌識別碼 `{day_store.owner}`：網址已包含此識別碼，加入書籤即可在重新整理或其他裝置上還原")
+    st.checkbox("自動保存輸入內容", value=True, key="autosave")
+    stored_day_count, stored_photo_count, stored_photo_bytes = day_store.stats()
+    st.caption(f"已儲存 {stored_day_count} 天，照片 {stored_photo_count} 張 ({stored_photo_bytes / 1024 / 1024:.1f} MB)"
+               + (f"，最後保存 {st.session_state['autosaved_at']}" if "autosaved_at" in st.session_state else ""))
+    stored_dates = day_store.dates()
+    if stored_dates:
+        selected_date = st.selectbox("已儲存的日期", options=stored_dates[::-1], key="stored_date")
+        st.button("📂 載入此日期", on_click=load_stored_day, args=(selected_date,))
+        st.button("📦 由本機儲存產出完整日誌 (Excel)", on_click=submit_export,
+                  args=("store_excel", "本機儲存完整日誌", store_journal_task, day_store, report_title_input, photo_options))
+        st.button("📚 由本機儲存產出多日 PDF", on_click=submit_export,
+                  args=("store_pdf", "本機儲存多日 PDF", store_pdf_task, day_store, report_title_input or None, photo_options), kwargs=dict(sheet_unit="天"))
+
+    # --- 導出排程統計 (所有 session；開啟診斷時顯示) ---
+    if diagnostics_enabled:
+        st.header("📊 導出排程")
+        metrics = job_manager.metrics_snapshot()
+        st.caption(f"執行中 {metrics['running']}/{metrics['workers']}，排隊 {metrics['queued']} (等待中的 session {metrics['waiting_sessions']}，"
+                   f"最多曾排隊 {metrics['peak_queued']})；已送出 {metrics['submitted']}，拒絕 {metrics['rejected']}，"
+                   + "，".join(f"{status} {count}" for status, count in metrics["finished"].items()))
+        if metrics["latency"]:
+            st.table([{"種類": kind, "完成數": m["count"], "排隊 p50 (秒)": round(m["wait_p50"], 2), "排隊 p90 (秒)": round(m["wait_p90"], 2),
+                       "總計 p50 (秒)": round(m["total_p50"], 2), "總計 p90 (秒)": round(m["total_p90"], 2), "總計 p99 (秒)": round(m["total_p99"], 2)}
+                      for kind, m in metrics["latency"].items()])
+        st.download_button("📥 下載排程統計 JSON", data=json.dumps(metrics, ensure_ascii=False, indent=2),
+                           file_name=f"export_metrics_{time.strftime('%Y%m%d_%H%M%S')}.json", mime="application/json", on_click="ignore")
 
 # --- Script End ---
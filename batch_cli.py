@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""批次產生日報 (不需 Streamlit)，多天平行處理，輸出一本合併的 Excel 日誌與每天一份 PDF
+
+    python batch_cli.py days.json --out-dir out/ --workers 4
+    python batch_cli.py diaries/ --out-dir out/ --no-pdf
+    python batch_cli.py diaries/ --out-dir out/ --combined-pdf   # 另產生附目錄的多日合併 PDF (週報/月報)
+
+輸入為 JSON：單一物件、物件陣列，或資料夾內的多個 *.json。欄位同 DayRecord
+(report_title, install_date, attendees, recorder, staff_data, progress_entries, side_entries)，
+照片以 photos 列出檔案路徑，或以 photo_dir 指定資料夾；相對路徑以 JSON 檔所在資料夾為準。"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from diary_model import DayRecord
+from photo_pipeline import (prepare_photos, PHOTO_TARGETS, PHOTO_QUALITY_MODES, PHOTO_FORMATS,
+                            DEFAULT_PHOTO_QUALITY, DEFAULT_PHOTO_FORMAT, DEFAULT_JPEG_QUALITY)
+
+PHOTO_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# 檔名中不可使用 (或會跳出輸出資料夾) 的字元
+UNSAFE_FILE_NAME_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def _day_from_json(data, base_dir):
+    day = DayRecord.from_dict(data)
+    day.photos = [os.path.join(base_dir, p) for p in day.photos]
+    if data.get("photo_dir"):
+        photo_dir = os.path.join(base_dir, data["photo_dir"])
+        day.photos += sorted(os.path.join(photo_dir, n) for n in os.listdir(photo_dir) if n.lower().endswith(PHOTO_EXTENSIONS))
+    return day
+
+
+def load_day_records(paths):
+    """讀取 JSON 檔或資料夾，回傳依日期排序的 DayRecord (photos 為檔案路徑)"""
+    files = []
+    for path in paths:
+        files += sorted(glob.glob(os.path.join(path, "*.json"))) if os.path.isdir(path) else [path]
+    days = []
+    for file in files:
+        with open(file, encoding="utf-8") as f: data = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(file))
+        days += [_day_from_json(d, base_dir) for d in (data if isinstance(data, list) else [data])]
+    return sorted(days, key=lambda d: d.install_date)
+
+
+def render_day(day, photo_options, pdf_dir=None, keep_excel=True):
+    """子行程工作：處理照片、寫出 PDF；回傳 (保留 Excel 照片緩衝的 day, 統計)"""
+    from pdf_export import write_day_pdf, pdf_file_name # 只在子行程載入 reportlab
+    started = time.perf_counter()
+    targets = {t: s for t, s in PHOTO_TARGETS.items() if (t == "pdf" and pdf_dir) or (t == "excel" and keep_excel)}
+    day.photos = prepare_photos(day.photos, targets, max_workers=1, **photo_options) # 平行度由行程池提供
+    errors = [f"處理圖片 {p.name} 時發生錯誤: {p.error}" for p in day.photos if p.error]
+    pdf_path = None
+    if pdf_dir:
+        pdf_path = os.path.join(pdf_dir, safe_file_name(pdf_file_name(day)))
+        write_day_pdf(day, pdf_path)
+    for p in day.photos: p.buffers.pop("pdf", None) # 只把 Excel 需要的資料傳回主行程
+    stats = dict(photos=len(day.photos), errors=errors, pdf=pdf_path, pdf_bytes=os.path.getsize(pdf_path) if pdf_path else 0,
+                 seconds=time.perf_counter() - started)
+    return day, stats
+
+
+def safe_file_name(name):
+    """報告標題組成的檔名中，路徑分隔字元與 Windows 不允許的字元改為 "_"，結果一定位於輸出資料夾內"""
+    name = UNSAFE_FILE_NAME_CHARS.sub("_", name).strip().rstrip(".") # Windows 會去掉結尾的句點
+    return name or "_"
+
+
+def journal_file_name(days):
+    title = days[0].report_title or "安裝日記"
+    return f"{title}_{days[0].install_date.strftime('%Y%m%d')}-{days[-1].install_date.strftime('%Y%m%d')}.xlsx"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批次產生工廠安裝日記 (Excel 合併日誌 + 每日 PDF)")
+    parser.add_argument("inputs", nargs="+", help="JSON 檔或含 *.json 的資料夾")
+    parser.add_argument("--out-dir", default="out", help="輸出資料夾 (預設 out)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="平行處理的行程數")
+    parser.add_argument("--quality", choices=list(PHOTO_QUALITY_MODES), default=DEFAULT_PHOTO_QUALITY, help="照片處理品質")
+    parser.add_argument("--format", choices=PHOTO_FORMATS, default=DEFAULT_PHOTO_FORMAT, help="照片嵌入格式")
+    parser.add_argument("--jpeg-quality", type=int, default=DEFAULT_JPEG_QUALITY)
+    parser.add_argument("--excel-name", help="合併日誌檔名 (預設依標題與日期範圍)")
+    parser.add_argument("--no-excel", action="store_true", help="不產生 Excel 日誌")
+    parser.add_argument("--no-pdf", action="store_true", help="不產生每日 PDF")
+    parser.add_argument("--summary", action="store_true", help="在 Excel 日誌最後加入「統計摘要」分頁")
+    parser.add_argument("--combined-pdf", action="store_true", help="另產生一份所有日期的多日合併 PDF (附目錄)")
+    args = parser.parse_args(argv)
+
+    days = load_day_records(args.inputs)
+    if not days: parser.error("沒有找到任何日誌資料")
+    os.makedirs(args.out_dir, exist_ok=True)
+    photo_options = dict(quality=args.quality, fmt=args.format, jpeg_quality=args.jpeg_quality)
+    pdf_dir = None if args.no_pdf else args.out_dir
+
+    started = time.perf_counter(); rendered = []; total_photos = 0; total_errors = 0; pdf_bytes = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(render_day, day, photo_options, pdf_dir, not args.no_excel): day for day in days}
+        for done, future in enumerate(as_completed(futures), 1):
+            day = futures[future]
+            try:
+                day, stats = future.result()
+            except Exception as e:
+                total_errors += 1
+                print(f"[{done}/{len(days)}] {day.sheet_name} 失敗: {e}", file=sys.stderr); continue
+            rendered.append(day); total_photos += stats["photos"]; pdf_bytes += stats["pdf_bytes"]; total_errors += len(stats["errors"])
+            for message in stats["errors"]: print(f"  {message}", file=sys.stderr)
+            print(f"[{done}/{len(days)}] {day.sheet_name}  照片 {stats['photos']} 張  {stats['seconds']:.2f}s")
+    render_seconds = time.perf_counter() - started
+
+    excel_path = None; shared_photos = 0
+    if not args.no_excel and rendered:
+        from excel_export import write_journal_workbook
+        rendered.sort(key=lambda d: d.install_date)
+        excel_path = os.path.join(args.out_dir, args.excel_name or safe_file_name(journal_file_name(rendered)))
+        extra_sheets = []
+        if args.summary:
+            from journal_index import index_days
+            from journal_analytics import summary_tables, build_summary_layout, SUMMARY_SHEET_NAME
+            extra_sheets.append((SUMMARY_SHEET_NAME, build_summary_layout(summary_tables(index_days(rendered)), rendered[0].report_title or None)))
+        shared_photos = write_journal_workbook(rendered, excel_path, extra_sheets=extra_sheets)
+    excel_seconds = time.perf_counter() - started - render_seconds
+
+    combined_path = None
+    if args.combined_pdf:
+        from pdf_export import write_multi_day_pdf, multi_day_pdf_file_name
+        # 以原始照片路徑重新載入：照片於繪製各頁時才逐張處理，記憶體不隨天數成長
+        source_days = load_day_records(args.inputs)
+        combined_path = os.path.join(args.out_dir, safe_file_name(multi_day_pdf_file_name(source_days)))
+        combined_errors = []
+        write_multi_day_pdf(source_days, combined_path, photo_options=photo_options,
+                            on_photo_error=lambda p: combined_errors.append(f"處理圖片 {p.name} 時發生錯誤 (多日 PDF): {p.error}"))
+        total_errors += len(combined_errors)
+        for message in combined_errors: print(f"  {message}", file=sys.stderr)
+    total_seconds = time.perf_counter() - started
+
+    # --- 摘要 ---
+    print("-" * 40)
+    print(f"完成 {len(rendered)}/{len(days)} 天，照片 {total_photos} 張，錯誤 {total_errors} 項")
+    print(f"總耗時 {total_seconds:.2f}s (處理/PDF {render_seconds:.2f}s，Excel {excel_seconds:.2f}s)")
+    print(f"吞吐量 {len(rendered) / total_seconds:.2f} 天/s，{total_photos / total_seconds:.1f} 張照片/s，{args.workers} 個行程")
+    if pdf_dir: print(f"PDF：{len(rendered)} 份，共 {pdf_bytes / 1024 / 1024:.1f} MB，位於 {pdf_dir}")
+    if combined_path: print(f"多日 PDF：{combined_path} ({os.path.getsize(combined_path) / 1024 / 1024:.1f} MB)")
+    if excel_path: print(f"Excel：{excel_path} ({os.path.getsize(excel_path) / 1024 / 1024:.1f} MB)"
+                         + (f"，{shared_photos} 張重複照片共用圖片" if shared_photos else ""))
+    return 1 if total_errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
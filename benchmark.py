@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""導出效能基準：以合成的日誌與照片量測 Excel / PDF 導出的時間、記憶體與檔案大小
+
+    python benchmark.py                          # 預設組合，結果寫入 bench_results.json
+    python benchmark.py --suite quick            # 快速檢查
+    python benchmark.py --suite full --repeat 3 --output v2.json
+    python benchmark.py --compare v1.json v2.json   # 比較兩次結果 (時間/記憶體/大小比例)
+
+每個案例在全新的子行程中執行，peak_rss_mb 為該行程的最高常駐記憶體 (含產生合成輸入)，
+setup_rss_mb 為輸入準備完成、開始計時前的常駐記憶體。合成資料由 seed 決定，同參數每次相同。"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO
+
+try:
+    import resource # 僅 Unix；其他平台的 RSS 欄位為 NaN
+except ImportError:
+    resource = None
+
+from diary_model import DayRecord, ROLE_TYPES, STAFF_GROUPS, PROGRESS_ITEMS_PER_MACHINE, SIDE_ITEM_COUNT
+
+DEFAULT_OUTPUT = "bench_results.json"
+START_DATE = date(2024, 1, 1)
+
+# 案例：(名稱, 參數)；photos 每天張數、resolution 原始照片像素、machines 機台數、journal_days 既有日誌天數
+SUITES = {
+    "quick": [
+        ("excel_day", dict(photos=4, resolution=(1600, 1200), machines=3)),
+        ("pdf_day", dict(photos=4, resolution=(1600, 1200), machines=3)),
+        ("excel_merge", dict(photos=4, resolution=(1600, 1200), machines=3, journal_days=30)),
+        ("excel_merge_full", dict(photos=4, resolution=(1600, 1200), machines=3, journal_days=30)),
+    ],
+    "default": [
+        *[("excel_day", dict(photos=n, resolution=(1600, 1200), machines=3)) for n in (0, 4, 12)],
+        ("excel_day", dict(photos=4, resolution=(4000, 3000), machines=3)),
+        ("excel_day", dict(photos=4, resolution=(1600, 1200), machines=15)),
+        *[("pdf_day", dict(photos=n, resolution=(1600, 1200), machines=3)) for n in (0, 4, 12)],
+        ("pdf_day", dict(photos=4, resolution=(4000, 3000), machines=3)),
+        ("pdf_day", dict(photos=0, resolution=(1600, 1200), machines=60)), # 密集表格 (240 列進度，跨多頁)
+        *[("excel_merge", dict(photos=4, resolution=(1600, 1200), machines=3, journal_days=n)) for n in (30, 150)],
+        *[("excel_merge_full", dict(photos=4, resolution=(1600, 1200), machines=3, journal_days=n)) for n in (30, 150)],
+        ("pdf_multi", dict(photos=2, resolution=(1600, 1200), machines=3, journal_days=30)),
+    ],
+    "full": [
+        *[("excel_day", dict(photos=n, resolution=res, machines=m)) for n in (0, 4, 12, 24) for res in ((1600, 1200), (4000, 3000)) for m in (3, 15)],
+        *[("pdf_day", dict(photos=n, resolution=res, machines=m)) for n in (0, 4, 12, 24) for res in ((1600, 1200), (4000, 3000)) for m in (3, 15)],
+        *[("pdf_day", dict(photos=0, resolution=(1600, 1200), machines=m)) for m in (60, 200)],
+        *[("excel_merge", dict(photos=4, resolution=(1600, 1200), machines=3, journal_days=n)) for n in (30, 150, 300)],
+        *[("excel_merge_full", dict(photos=4, resolution=(1600, 1200), machines=3, journal_days=n)) for n in (30, 150, 300)],
+        *[("pdf_multi", dict(photos=2, resolution=(1600, 1200), machines=3, journal_days=n)) for n in (30, 90)],
+    ],
+}
+
+
+# --- 合成資料 ---
+class SyntheticPhoto(BytesIO):
+    """有檔名的記憶體照片 (與 Streamlit UploadedFile 一樣提供 name / getvalue)"""
+
+    def __init__(self, data, name):
+        super().__init__(data); self.name = name
+
+
+def synthetic_photo(resolution, seed, quality=90):
+    """可重現的 JPEG：低頻色塊 + 細紋理放大到 resolution，壓縮率接近實拍照片"""
+    from PIL import Image
+    rng = random.Random(seed); width, height = resolution
+    def noise(w, h): return Image.frombytes("L", (w, h), rng.randbytes(w * h)).resize(resolution, Image.BICUBIC)
+    bands = [Image.blend(noise(16, 12), noise(max(1, width // 8), max(1, height // 8)), 0.3) for _ in range(3)]
+    out = BytesIO(); Image.merge("RGB", bands).save(out, "JPEG", quality=quality)
+    return out.getvalue()
+
+
+def synthetic_day(install_date, machines=3, photos=0, resolution=(1600, 1200), seed=0, photo_cache=None):
+    """一天的合成紀錄；photo_cache ({(resolution, seed): bytes}) 可讓多天共用產生好的照片"""
+    rng = random.Random(f"{seed}-{install_date}")
+    staff_data = {group: [rng.randint(0, 6) for _ in ROLE_TYPES] for group in STAFF_GROUPS}
+    progress = [[f"機台{m + 1:02d}", i, f"第 {i} 項 吊裝定位與配線 {rng.randint(1, 999)}", rng.randint(0, 4), "依圖施工" if i % 2 else ""]
+                for m in range(machines) for i in range(1, PROGRESS_ITEMS_PER_MACHINE + 1)]
+    side = [[i, f"週邊工作 配管與焊接 {rng.randint(1, 999)}", rng.randint(0, 3), ""] for i in range(1, SIDE_ITEM_COUNT + 1)]
+    day_photos = []
+    for p in range(photos):
+        key = (tuple(resolution), (seed + p) % 8) # 最多 8 種不同照片，避免產生過多大圖
+        if photo_cache is None or key not in photo_cache:
+            data = synthetic_photo(resolution, key[1])
+            if photo_cache is None: day_photos.append(SyntheticPhoto(data, f"photo_{p:02d}.jpg")); continue
+            photo_cache[key] = data
+        day_photos.append(SyntheticPhoto(photo_cache[key], f"photo_{p:02d}.jpg"))
+    return DayRecord("合成測試專案", install_date, "王小明\n李大華", "記錄員", staff_data, progress, side, day_photos)
+
+
+def synthetic_journal(path, days, machines=3, photos=2, resolution=(1600, 1200), seed=0):
+    """寫出 days 天的合成日誌 (write_only 串流)"""
+    from excel_export import write_journal_workbook
+    from photo_pipeline import prepare_photos, EXCEL_PHOTO_SIZE_PX
+    photo_cache = {}
+    def prepared():
+        for n in range(days):
+            day = synthetic_day(START_DATE + timedelta(n), machines, photos, resolution, seed, photo_cache)
+            day.photos = prepare_photos(day.photos, {"excel": EXCEL_PHOTO_SIZE_PX}); yield day
+    write_journal_workbook(prepared(), path)
+    return path
+
+
+# --- 案例 (子行程) ---
+def _rss_mb():
+    if resource is None: return float("nan")
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Linux 為 KB
+
+
+def run_case(case, params, journal_path=None):
+    """執行一個案例，回傳 {wall_seconds, stages, output_bytes, ...}"""
+    from photo_pipeline import prepare_photos, EXCEL_PHOTO_SIZE_PX, PDF_PHOTO_SIZE_PX
+    excel_target, pdf_target = {"excel": EXCEL_PHOTO_SIZE_PX}, {"pdf": PDF_PHOTO_SIZE_PX} # 與 export_tasks 相同，每種導出只處理一種尺寸
+    resolution = tuple(params.get("resolution", (1600, 1200)))
+    install_date = START_DATE + timedelta(params.get("journal_days", 0)) # 合併案例為新的一天
+    day = synthetic_day(install_date, params.get("machines", 3), params.get("photos", 0), resolution, photo_cache={})
+    setup_rss = _rss_mb(); output = BytesIO(); stages = {}
+
+    def stage(name, func, *args, **kwargs):
+        t = time.perf_counter(); result = func(*args, **kwargs); stages[name] = time.perf_counter() - t
+        return result
+
+    started = time.perf_counter()
+    if case == "excel_day": # 同 excel_day_task 沒有舊日誌時：write_only 串流寫出
+        from excel_export import write_journal_workbook
+        day.photos = stage("prepare_photos", prepare_photos, day.photos, excel_target)
+        stage("write_journal_workbook", write_journal_workbook, [day], output)
+    elif case == "pdf_day":
+        from pdf_export import write_day_pdf
+        day.photos = stage("prepare_photos", prepare_photos, day.photos, pdf_target)
+        stage("doc.build", write_day_pdf, day, output)
+    elif case == "excel_merge":
+        from excel_merge import merge_day_into_journal
+        day.photos = stage("prepare_photos", prepare_photos, day.photos, excel_target)
+        stage("merge_day_into_journal", merge_day_into_journal, journal_path, day, output)
+    elif case == "excel_merge_full": # excel_day_task 無法增量合併時的退路：load_workbook + 寫入分頁 + save_workbook
+        from openpyxl import load_workbook
+        from excel_export import write_day_to_excel_sheet, save_workbook
+        day.photos = stage("prepare_photos", prepare_photos, day.photos, excel_target)
+        wb = stage("load_workbook", load_workbook, journal_path)
+        ws = wb.create_sheet(title=day.sheet_name)
+        stage("write_day_to_excel_sheet", write_day_to_excel_sheet, ws, day.report_title, day.install_date, day.attendees, day.recorder,
+              day.staff_data, day.progress_entries, day.side_entries, day.photos)
+        stage("save_workbook", save_workbook, wb, output)
+    elif case == "pdf_multi":
+        from journal_reader import iter_journal_days
+        from pdf_export import write_multi_day_pdf
+        days = stage("iter_journal_days", lambda: list(iter_journal_days(journal_path)))
+        stage("doc.multiBuild", write_multi_day_pdf, days, output)
+    else:
+        raise ValueError(f"未知的案例: {case}")
+    return dict(wall_seconds=time.perf_counter() - started, stages=stages, output_bytes=len(output.getvalue()),
+                setup_rss_mb=setup_rss, peak_rss_mb=_rss_mb())
+
+
+# --- 主程式 ---
+def _git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _case_label(case, params):
+    return f"{case}(" + ", ".join(f"{k}={'x'.join(map(str, v)) if isinstance(v, (list, tuple)) else v}" for k, v in sorted(params.items())) + ")"
+
+
+def run_suite(cases, repeat, workdir):
+    journals = {} # (天數) -> 路徑，同一份合成日誌供多個案例共用
+    results = []
+    for case, params in cases:
+        journal_path = None
+        if "journal_days" in params:
+            n = params["journal_days"]
+            if n not in journals:
+                print(f"產生 {n} 天的合成日誌…", file=sys.stderr)
+                journals[n] = synthetic_journal(os.path.join(workdir, f"journal_{n}.xlsx"), n)
+            journal_path = journals[n]
+        runs = []
+        for _ in range(max(1, repeat)):
+            spec = json.dumps(dict(case=case, params=params, journal_path=journal_path))
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", spec], capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        result = dict(case=case, params=params, label=_case_label(case, params), runs=len(runs),
+                      wall_seconds=statistics.median(r["wall_seconds"] for r in runs),
+                      stages={name: statistics.median(r["stages"][name] for r in runs) for name in runs[0]["stages"]},
+                      peak_rss_mb=max(r["peak_rss_mb"] for r in runs), setup_rss_mb=statistics.median(r["setup_rss_mb"] for r in runs),
+                      output_bytes=runs[-1]["output_bytes"])
+        if journal_path: result["journal_bytes"] = os.path.getsize(journal_path)
+        results.append(result)
+        print(f"{result['label']:<80} {result['wall_seconds']:8.3f}s  RSS {result['peak_rss_mb']:7.1f} MB  輸出 {result['output_bytes'] / 1024:9.1f} KB")
+    return results
+
+
+def compare(old_path, new_path):
+    """依案例名稱比對兩份結果，印出新/舊比例 (>1 代表變慢或變大)"""
+    with open(old_path, encoding="utf-8") as f: old = {r["label"]: r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f: new = {r["label"]: r for r in json.load(f)["results"]}
+    print(f"{'案例':<80} {'時間':>8} {'RSS':>8} {'大小':>8}")
+    for label, r in new.items():
+        if label not in old: continue
+        o = old[label]
+        ratio = lambda key: r[key] / o[key] if o[key] else float("nan")
+        print(f"{label:<80} {ratio('wall_seconds'):8.2f} {ratio('peak_rss_mb'):8.2f} {ratio('output_bytes'):8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="工廠安裝日記導出效能基準")
+    parser.add_argument("--suite", choices=list(SUITES), default="default")
+    parser.add_argument("--case", action="append", help="只執行名稱符合的案例 (可重複)")
+    parser.add_argument("--repeat", type=int, default=1, help="每個案例重複次數 (取中位數)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help=f"結果 JSON (預設 {DEFAULT_OUTPUT})")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="比較兩份結果後結束")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        spec = json.loads(args.child)
+        print(json.dumps(run_case(spec["case"], spec["params"], spec.get("journal_path")))); return 0
+    if args.compare:
+        compare(*args.compare); return 0
+
+    cases = [(c, p) for c, p in SUITES[args.suite] if not args.case or c in args.case]
+    started = time.time()
+    with tempfile.TemporaryDirectory(prefix="diary_bench_") as workdir:
+        results = run_suite(cases, args.repeat, workdir)
+    meta = dict(version=_git_version(), suite=args.suite, repeat=args.repeat, started_at=time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+                python=platform.python_version(), platform=platform.platform(), cpu_count=os.cpu_count(), seconds=time.time() - started)
+    with open(args.output, "w", encoding="utf-8") as f: json.dump(dict(meta=meta, results=results), f, ensure_ascii=False, indent=2)
+    print(f"結果已寫入 {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""本機日誌儲存：SQLite 保存每天的結構化紀錄，照片以內容雜湊存成檔案 (同一張照片只存一份)
+頁面重新整理後可還原當天輸入；Excel / PDF 可直接由儲存的紀錄產生，不需重新解析上傳的日誌
+紀錄依擁有者 (使用者/專案識別碼) 分開：DayStore().for_owner(owner) 只看得到該擁有者的日期
+
+    store/
+      diary.sqlite3           每個 (擁有者, 日期) 一列 (各欄位為 JSON)
+      photos/ab/abcdef...     照片原始位元組，檔名為 photo_digest()
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+
+from diary_model import DayRecord
+from photo_pipeline import photo_digest
+
+DEFAULT_STORE_DIR = os.environ.get("DIARY_STORE_DIR", "diary_store")
+# 舊版 (不分擁有者) 資料庫升級後，既有紀錄歸屬的擁有者
+LEGACY_OWNER = "local"
+
+# 文字欄位原樣保存，其餘以 JSON 保存
+TEXT_FIELDS = ("report_title", "attendees", "recorder")
+JSON_FIELDS = ("staff_data", "progress_entries", "side_entries", "photos")
+
+DAYS_TABLE = """
+CREATE TABLE IF NOT EXISTS days (
+    owner TEXT NOT NULL,
+    install_date TEXT NOT NULL,
+    report_title TEXT NOT NULL DEFAULT '',
+    attendees TEXT NOT NULL DEFAULT '',
+    recorder TEXT NOT NULL DEFAULT '',
+    staff_data TEXT NOT NULL DEFAULT '{}',
+    progress_entries TEXT NOT NULL DEFAULT '[]',
+    side_entries TEXT NOT NULL DEFAULT '[]',
+    photos TEXT NOT NULL DEFAULT '[]', -- [[digest, 檔名], ...]
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (owner, install_date)
+);
+"""
+SCHEMA = DAYS_TABLE + """
+CREATE TABLE IF NOT EXISTS photos (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class StoredPhoto:
+    """儲存中的一張照片；getvalue() 時才讀檔 (可直接交給 prepare_photos)"""
+
+    def __init__(self, path, digest, name):
+        self.path = path; self.digest = digest; self.name = name
+
+    def getvalue(self):
+        with open(self.path, "rb") as f: return f.read()
+
+
+def _is_blank(day):
+    return not (any(getattr(day, name) for name in TEXT_FIELDS) or day.progress_entries or day.side_entries
+                or any(any(counts) for counts in day.staff_data.values()))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class DayStore:
+    """單一資料夾的日誌儲存；可跨執行緒共用 (Streamlit 各 session 共用一個實例，再以 for_owner() 取得各自的視圖)
+    save_day() 只寫入與上次儲存不同的欄位，內容未變時完全不寫入"""
+
+    def __init__(self, root=DEFAULT_STORE_DIR, owner=LEGACY_OWNER):
+        self.root = root; self.owner = owner; self.photo_dir = os.path.join(root, "photos")
+        os.makedirs(self.photo_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "diary.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL"); self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate(); self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._saved = {} # {(擁有者, 日期字串): {欄位: 已儲存的值}}，避免重複寫入
+
+    def _migrate(self):
+        """舊版 days 表 (以日期為主鍵、沒有 owner 欄) 改為 (owner, install_date) 主鍵，既有紀錄歸 LEGACY_OWNER"""
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(days)")]
+        if not columns or "owner" in columns: return
+        fields = ", ".join(columns)
+        self._conn.executescript(f"""BEGIN;
+            ALTER TABLE days RENAME TO days_v1;{DAYS_TABLE}
+            INSERT INTO days (owner, {fields}) SELECT '{LEGACY_OWNER}', {fields} FROM days_v1;
+            DROP TABLE days_v1;
+            COMMIT;""")
+
+    def for_owner(self, owner):
+        """同一資料庫中 owner 的日誌 (共用連線、鎖與快取)；各擁有者的紀錄互不可見"""
+        view = copy.copy(self); view.owner = owner
+        return view
+
+    # --- 照片 ---
+    def photo_path(self, digest):
+        return os.path.join(self.photo_dir, digest[:2], digest)
+
+    def put_photo(self, raw):
+        """保存照片原始位元組，回傳內容雜湊；已存在時不再寫檔"""
+        digest = photo_digest(raw); path = self.photo_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f: f.write(raw)
+            os.replace(tmp_path, path)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR IGNORE INTO photos (digest, size, created_at) VALUES (?, ?, ?)", (digest, len(raw), time.time()))
+        return digest
+
+    # --- 日誌 ---
+    def _snapshot(self, key):
+        """該日期目前儲存的欄位值 (第一次存取時由資料庫讀取)"""
+        if (self.owner, key) not in self._saved:
+            row = self._conn.execute(f"SELECT {', '.join(TEXT_FIELDS + JSON_FIELDS)} FROM days WHERE owner = ? AND install_date = ?",
+                                     (self.owner, key)).fetchone()
+            self._saved[self.owner, key] = dict(zip(TEXT_FIELDS + JSON_FIELDS, row)) if row else None
+        return self._saved[self.owner, key]
+
+    def save_day(self, day, photos=None):
+        """保存一天的紀錄；photos 為 [(digest, 檔名)]，None 表示保留已儲存的照片 (day.photos 不使用)
+        回傳實際寫入的欄位名稱 (內容未變時為空 list)"""
+        key = day.install_date.isoformat()
+        values = {name: getattr(day, name) or "" for name in TEXT_FIELDS}
+        values.update(staff_data=_dumps(day.staff_data), progress_entries=_dumps(day.progress_entries), side_entries=_dumps(day.side_entries))
+        if photos is not None: values["photos"] = _dumps([list(p) for p in photos])
+        with self._lock, self._conn:
+            saved = self._snapshot(key)
+            if saved is None and _is_blank(day) and not photos: return [] # 空白的新日期不建立紀錄
+            if saved is None:
+                columns = ["owner", "install_date", *values, "updated_at"]
+                self._conn.execute(f"INSERT INTO days ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                                   (self.owner, key, *values.values(), time.time()))
+                self._saved[self.owner, key] = {"photos": "[]", **values}
+                return list(values)
+            changed = {name: value for name, value in values.items() if saved.get(name) != value}
+            if not changed: return []
+            assignments = ", ".join(f"{name} = ?" for name in changed)
+            self._conn.execute(f"UPDATE days SET {assignments}, updated_at = ? WHERE owner = ? AND install_date = ?",
+                               (*changed.values(), time.time(), self.owner, key))
+            saved.update(changed)
+            return list(changed)
+
+    def _day_from_row(self, row):
+        install_date, *fields = row
+        data = dict(zip(TEXT_FIELDS + JSON_FIELDS, fields))
+        for name in JSON_FIELDS: data[name] = json.loads(data[name])
+        photos = [StoredPhoto(self.photo_path(digest), digest, name) for digest, name in data.pop("photos")]
+        return DayRecord(install_date=date.fromisoformat(install_date), photos=photos, **data)
+
+    def load_day(self, install_date):
+        """回傳該日期的 DayRecord (photos 為 StoredPhoto)，沒有紀錄時回傳 None"""
+        with self._lock:
+            row = self._conn.execute(f"SELECT install_date, {', '.join(TEXT_FIELDS + JSON_FIELDS)} FROM days WHERE owner = ? AND install_date = ?",
+                                     (self.owner, install_date.isoformat())).fetchone()
+        return self._day_from_row(row) if row else None
+
+    def iter_days(self, start=None, end=None):
+        """依日期產生 DayRecord (可限定範圍)；一次只在記憶體中保留一天"""
+        query = (f"SELECT install_date, {', '.join(TEXT_FIELDS + JSON_FIELDS)} FROM days "
+                 "WHERE owner = ? AND install_date BETWEEN ? AND ? ORDER BY install_date")
+        with self._lock:
+            rows = self._conn.execute(query, (self.owner, (start or date.min).isoformat(), (end or date.max).isoformat())).fetchall()
+        for row in rows: yield self._day_from_row(row)
+
+    def dates(self):
+        with self._lock:
+            return [date.fromisoformat(d) for (d,) in self._conn.execute("SELECT install_date FROM days WHERE owner = ? ORDER BY install_date", (self.owner,))]
+
+    def delete_day(self, install_date):
+        """刪除一天的紀錄 (照片檔保留，可能仍被其他日期引用)"""
+        key = install_date.isoformat()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM days WHERE owner = ? AND install_date = ?", (self.owner, key)); self._saved.pop((self.owner, key), None)
+
+    def stats(self):
+        """此擁有者的 (天數, 照片數, 照片總位元組)；照片依內容計算，多天共用的照片只算一次"""
+        with self._lock:
+            days = self._conn.execute("SELECT COUNT(*) FROM days WHERE owner = ?", (self.owner,)).fetchone()[0]
+            photos, size = self._conn.execute("""SELECT COUNT(*), COALESCE(SUM(size), 0) FROM photos WHERE digest IN
+                (SELECT json_extract(p.value, '$[0]') FROM days, json_each(days.photos) AS p WHERE days.owner = ?)""", (self.owner,)).fetchone()
+        return days, photos, size
+
+    def close(self):
+        with self._lock: self._conn.close()
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""導出診斷：記錄一次導出各階段的耗時與記憶體峰值 (tracemalloc)、每張照片的處理耗時
+以環境變數 DIARY_DIAGNOSTICS=1 (或網址參數 ?diagnostics=1) 開啟；關閉時使用 NULL_DIAGNOSTICS，每個階段只多一次空的 with
+tracemalloc 為整個行程共用，會拖慢所有 session，只有伺服器設定 DIARY_DIAGNOSTICS=1 時才量測記憶體 (網址參數只記錄耗時)"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource # 僅 Unix；其他平台不回報行程最高常駐記憶體
+except ImportError:
+    resource = None
+
+DIAGNOSTICS_ENABLED = os.environ.get("DIARY_DIAGNOSTICS", "").lower() not in ("", "0", "false", "no")
+
+# --- tracemalloc 共用計數：最後一個使用者結束時才停止 (僅停止由此啟動的追蹤) ---
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_started = False
+_tracing_epoch = 0 # 每有導出開始追蹤即遞增，用來判斷某階段期間是否有其他導出加入
+
+
+def _start_tracing():
+    global _tracing_users, _tracing_started, _tracing_epoch
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(); _tracing_started = True
+        _tracing_users += 1; _tracing_epoch += 1
+
+
+def _stop_tracing():
+    global _tracing_users, _tracing_started
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_started:
+            tracemalloc.stop(); _tracing_started = False
+
+
+def process_max_rss_mb():
+    """行程的最高常駐記憶體 (MB)；沒有 resource 模組的平台回傳 None"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource is not None else None # Linux 為 KB
+
+
+class ExportDiagnostics:
+    """一次導出的診斷紀錄；以 with diag.stage("名稱"): 包住各階段，照片處理結果以 add_photos() 加入
+    trace_memory 時以 tracemalloc 量測各階段的記憶體 (只含 Python 物件配置，PIL 影像緩衝區等 C 配置不在其中)，另附行程的最高常駐記憶體
+    其他導出同時量測時不重設峰值，該階段標記為 shared，峰值為整個行程的數值、不回報留存量"""
+
+    def __init__(self, label, trace_memory=True):
+        self.label = label; self.stages = []; self.photos = []; self.trace_memory = trace_memory
+        if trace_memory: _start_tracing()
+        self._started = time.perf_counter(); self.total_seconds = None; self.peak_bytes = None
+
+    @contextmanager
+    def stage(self, name):
+        if not self.trace_memory:
+            started = time.perf_counter()
+            try: yield
+            finally: self.stages.append(dict(stage=name, seconds=time.perf_counter() - started, peak_mb=None, retained_mb=None, shared=False))
+            return
+        with _tracing_lock:
+            epoch = _tracing_epoch; shared = _tracing_users > 1
+            if not shared: tracemalloc.reset_peak() # 只有自己在量測時才能重設整個行程的峰值
+            before, _ = tracemalloc.get_traced_memory()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with _tracing_lock:
+                current, peak = tracemalloc.get_traced_memory()
+                shared = shared or _tracing_users > 1 or _tracing_epoch != epoch
+            self.stages.append(dict(stage=name, seconds=time.perf_counter() - started, shared=shared,
+                                    peak_mb=(peak if shared else peak - before) / 1024 / 1024,
+                                    retained_mb=None if shared else (current - before) / 1024 / 1024)) # 同時量測時無法歸屬於此導出
+
+    def add_photos(self, prepared_photos):
+        for p in prepared_photos:
+            self.photos.append(dict(name=p.name, error=str(p.error) if p.error else None, passthrough=sorted(p.passthrough),
+                                    bytes={target: len(data) for target, data in p.buffers.items()},
+                                    seconds=dict(p.timings), total_seconds=sum(p.timings.values())))
+
+    def finish(self):
+        """結束量測 (釋放 tracemalloc，最後一個量測中的導出結束時停止追蹤)，回傳 self"""
+        if self.total_seconds is None:
+            self.total_seconds = time.perf_counter() - self._started
+            if self.trace_memory:
+                self.peak_bytes = max([0, *(s["peak_mb"] for s in self.stages)]) * 1024 * 1024
+                _stop_tracing()
+        return self
+
+    def to_dict(self):
+        self.finish()
+        return dict(label=self.label, total_seconds=self.total_seconds,
+                    tracemalloc_peak_mb=self.peak_bytes / 1024 / 1024 if self.peak_bytes is not None else None,
+                    memory_shared=any(s["shared"] for s in self.stages), process_max_rss_mb=process_max_rss_mb(),
+                    stages=self.stages, photos=self.photos)
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+
+class _NullDiagnostics:
+    """關閉診斷時的替代物件：所有記錄皆為空操作"""
+    label = None
+
+    def stage(self, name): return nullcontext()
+    def add_photos(self, prepared_photos): pass
+    def finish(self): return self
+
+
+NULL_DIAGNOSTICS = _NullDiagnostics()
+
+
+def export_diagnostics(label, enabled=DIAGNOSTICS_ENABLED):
+    """enabled 時回傳 ExportDiagnostics；記憶體量測只在伺服器開啟 DIARY_DIAGNOSTICS 時進行"""
+    return ExportDiagnostics(label, trace_memory=DIAGNOSTICS_ENABLED) if enabled else NULL_DIAGNOSTICS
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""日誌資料模型：一天的記錄與共用的分類常數 (Excel / PDF 導出共用)"""
+from dataclasses import dataclass, field
+from datetime import date
+
+# ******** 修改：土木 -> 業務 ********
+ROLE_TYPES = ["機械", "電機", "業務", "軟體"]
+# ***********************************
+STAFF_GROUPS = ["供應商人員", "外包人員"]
+PROGRESS_ITEMS_PER_MACHINE = 4 # 裝機進度每台機台的項數
+SIDE_ITEM_COUNT = 10 # 週邊工作項數
+
+
+@dataclass
+class DayRecord:
+    """一天的安裝日記
+    staff_data: {人員分類: [各 ROLE_TYPES 人數]}
+    progress_entries: [[機台, 項次, 內容, 人力, 備註], ...]
+    side_entries: [[項次, 內容, 人力, 備註], ...]
+    photos: 導出時為 prepare_photos() 的結果"""
+    report_title: str = ""
+    install_date: date = field(default_factory=date.today)
+    attendees: str = ""
+    recorder: str = ""
+    staff_data: dict = field(default_factory=dict)
+    progress_entries: list = field(default_factory=list)
+    side_entries: list = field(default_factory=list)
+    photos: list = field(default_factory=list)
+
+    @property
+    def sheet_name(self):
+        return self.install_date.strftime("%Y-%m-%d")
+
+    @classmethod
+    def from_dict(cls, data):
+        """由 JSON 物件建立；install_date 為 YYYY-MM-DD 字串，缺少的人力分類補 0"""
+        install_date = data.get("install_date") or date.today()
+        if isinstance(install_date, str): install_date = date.fromisoformat(install_date)
+        staff_data = {group: list(data.get("staff_data", {}).get(group, [0] * len(ROLE_TYPES))) for group in STAFF_GROUPS}
+        return cls(data.get("report_title", ""), install_date, data.get("attendees", ""), data.get("recorder", ""), staff_data,
+                   [list(e) for e in data.get("progress_entries", [])], [list(e) for e in data.get("side_entries", [])], list(data.get("photos", [])))
+
+
+def _blank_rows(count):
+    return [["", 0, ""] for _ in range(count)]
+
+
+@dataclass
+class DiaryDraft:
+    """頁面上編輯中的日誌 (存於 st.session_state)，各輸入區塊各自更新自己的部分，導出時由此取得資料
+    machines: {機台: [[內容, 人力, 備註] × PROGRESS_ITEMS_PER_MACHINE]}，依新增順序
+    side_rows: [[內容, 人力, 備註] × SIDE_ITEM_COUNT]；內容空白的列不會導出"""
+    staff_data: dict = field(default_factory=lambda: {group: [0] * len(ROLE_TYPES) for group in STAFF_GROUPS})
+    machines: dict = field(default_factory=dict)
+    side_rows: list = field(default_factory=lambda: _blank_rows(SIDE_ITEM_COUNT))
+
+    @classmethod
+    def from_day_record(cls, day):
+        """由已儲存的一天還原 (項次超出範圍的項目略過)"""
+        draft = cls(staff_data={group: list(day.staff_data.get(group, [0] * len(ROLE_TYPES))) for group in STAFF_GROUPS})
+        for machine, item, content, manpower, note in day.progress_entries:
+            draft.add_machine(machine)
+            if 1 <= int(item) <= PROGRESS_ITEMS_PER_MACHINE: draft.machines[machine][int(item) - 1] = [content, manpower, note]
+        for item, content, manpower, note in day.side_entries:
+            if 1 <= int(item) <= SIDE_ITEM_COUNT: draft.side_rows[int(item) - 1] = [content, manpower, note]
+        return draft
+
+    def add_machine(self, name):
+        """新增機台，已存在時回傳 False"""
+        if name in self.machines: return False
+        self.machines[name] = _blank_rows(PROGRESS_ITEMS_PER_MACHINE); return True
+
+    @property
+    def progress_entries(self):
+        return [[machine, i, content, manpower, note] for machine, rows in self.machines.items()
+                for i, (content, manpower, note) in enumerate(rows, 1) if content]
+
+    @property
+    def side_entries(self):
+        return [[i, content, manpower, note] for i, (content, manpower, note) in enumerate(self.side_rows, 1) if content]
+
+    def to_day_record(self, report_title, install_date, attendees, recorder, photos=()):
+        return DayRecord(report_title, install_date, attendees, recorder, {group: list(counts) for group, counts in self.staff_data.items()},
+                         self.progress_entries, self.side_entries, list(photos))
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""Excel 導出引擎：先算好一天的版面 (DayLayout)，再寫入一般工作表或以 write_only 串流寫出整本日誌
+樣式以具名樣式 (NamedStyle) 每本活頁簿註冊一次，儲存格只引用名稱"""
+import zipfile
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.drawing.image import Image as XLImage
+from openpyxl.styles import Font, Border, Side, Alignment, NamedStyle
+from openpyxl.packaging.relationship import get_rels_path
+from openpyxl.utils import get_column_letter
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.xml.functions import tostring
+
+from diary_model import DayRecord, ROLE_TYPES, STAFF_GROUPS
+from photo_pipeline import EXCEL_PHOTO_SIZE_PX, photo_digest
+
+# --- Excel 樣式 ---
+bold_font_excel = Font(name="標楷體", size=11, bold=True)
+normal_font_excel = Font(name="標楷體", size=11)
+title_font_excel = Font(name="標楷體", size=14, bold=True) # 報告標題字體
+thin_border_side_excel = Side(style='thin', color='000000')
+thin_border_excel = Border(left=thin_border_side_excel, right=thin_border_side_excel, top=thin_border_side_excel, bottom=thin_border_side_excel)
+center_align_wrap_excel = Alignment(horizontal="center", vertical="center", wrap_text=True)
+left_align_wrap_excel = Alignment(horizontal="left", vertical="center", wrap_text=True)
+DEFAULT_COL_WIDTH_EXCEL = 18
+DEFAULT_ROW_HEIGHT_EXCEL = 25
+TITLE_ROW_HEIGHT_EXCEL = 30
+IMAGE_ROW_HEIGHT_EXCEL = 120
+NUM_COLS_TOTAL_EXCEL = 6
+IMG_COL_WIDTH_EXCEL = 3; NUM_IMG_COLS_EXCEL = 2
+
+# --- 具名樣式 (字體, 對齊, 框線) ---
+STYLE_TITLE = "diary_title"
+STYLE_SECTION = "diary_section" # 無框線的區塊標題 (進度留影)
+STYLE_HEADER = "diary_header"
+STYLE_HEADER_LEFT = "diary_header_left"
+STYLE_CELL = "diary_cell"
+STYLE_CELL_LEFT = "diary_cell_left"
+STYLE_PHOTO = "diary_photo"
+NAMED_STYLE_SPECS = {
+    STYLE_TITLE: (title_font_excel, center_align_wrap_excel, None),
+    STYLE_SECTION: (bold_font_excel, center_align_wrap_excel, None),
+    STYLE_HEADER: (bold_font_excel, center_align_wrap_excel, thin_border_excel),
+    STYLE_HEADER_LEFT: (bold_font_excel, left_align_wrap_excel, thin_border_excel),
+    STYLE_CELL: (normal_font_excel, center_align_wrap_excel, thin_border_excel),
+    STYLE_CELL_LEFT: (normal_font_excel, left_align_wrap_excel, thin_border_excel),
+    STYLE_PHOTO: (normal_font_excel, Alignment(vertical="center"), thin_border_excel),
+}
+
+
+def register_named_styles(wb):
+    """把日誌用的具名樣式加入活頁簿 (已存在者略過)"""
+    existing = set(wb.named_styles)
+    for name, (font, alignment, border) in NAMED_STYLE_SPECS.items():
+        if name in existing: continue
+        wb.add_named_style(NamedStyle(name=name, font=font, alignment=alignment, border=border or Border()))
+
+
+class DayLayout:
+    """一天工作表的版面：列高、儲存格 (值, 具名樣式)、合併範圍與圖片錨點"""
+
+    def __init__(self):
+        self.heights = {}; self.cells = defaultdict(dict); self.merges = []; self.images = []
+
+    def cell(self, row, col, value, style):
+        self.cells[row][col] = (value, style); self.min_height(row)
+
+    def style(self, row, col, style):
+        """只套樣式 (合併範圍內的其他格)"""
+        value = self.cells[row].get(col, (None, None))[0]
+        self.cells[row][col] = (value, style); self.min_height(row)
+
+    def min_height(self, row):
+        if (self.heights.get(row) or 0) < DEFAULT_ROW_HEIGHT_EXCEL: self.heights[row] = DEFAULT_ROW_HEIGHT_EXCEL
+
+    def height(self, row, height):
+        self.heights[row] = height
+
+    def merge(self, start_row, start_col, end_row, end_col):
+        self.merges.append(f"{get_column_letter(start_col)}{start_row}:{get_column_letter(end_col)}{end_row}")
+
+    @property
+    def max_row(self):
+        return max([*self.heights, *self.cells, 0])
+
+
+def build_day_layout(day, on_photo_error=None):
+    """依 DayRecord 算出一天的版面；photos 需為 prepare_photos() 的結果，失敗的照片會呼叫 on_photo_error(photo)"""
+    layout = DayLayout(); current_row = 1
+
+    # --- 報告標題 ---
+    if day.report_title:
+        layout.merge(current_row, 1, current_row, NUM_COLS_TOTAL_EXCEL)
+        layout.cell(current_row, 1, day.report_title, STYLE_TITLE)
+        layout.height(current_row, TITLE_ROW_HEIGHT_EXCEL) # 加高標題列
+        current_row += 1
+        layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL) # 空行
+        current_row += 1
+
+    # --- 基本資訊 ---
+    layout.merge(current_row, 2, current_row, NUM_COLS_TOTAL_EXCEL)
+    layout.cell(current_row, 1, "日期", STYLE_HEADER)
+    layout.cell(current_row, 2, str(day.install_date), STYLE_CELL)
+    for c in range(3, NUM_COLS_TOTAL_EXCEL + 1): layout.style(current_row, c, STYLE_CELL)
+    current_row += 1
+
+    # --- 參加人員 ---
+    if day.attendees:
+        layout.merge(current_row, 2, current_row, NUM_COLS_TOTAL_EXCEL)
+        layout.cell(current_row, 1, "參加人員", STYLE_HEADER_LEFT) # 靠左
+        layout.cell(current_row, 2, day.attendees, STYLE_CELL_LEFT) # 靠左
+        for c in range(3, NUM_COLS_TOTAL_EXCEL + 1): layout.style(current_row, c, STYLE_CELL_LEFT)
+        current_row += 1
+
+    layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+
+    # --- 人力配置 ---
+    header_staff = ["人員分類", *ROLE_TYPES, "總計"]
+    for col_idx, header_text in enumerate(header_staff, 1):
+        if col_idx <= NUM_COLS_TOTAL_EXCEL: layout.cell(current_row, col_idx, header_text, STYLE_HEADER)
+    current_row += 1
+    for group in STAFF_GROUPS:
+        group_counts = day.staff_data.get(group, [])
+        processed_counts = []; valid_data = True
+        if isinstance(group_counts, list):
+            for item in group_counts:
+                if isinstance(item, (int, float)): processed_counts.append(item)
+                else:
+                    try: processed_counts.append(int(item))
+                    except (ValueError, TypeError): valid_data = False; processed_counts.append(0)
+        else: valid_data = False; processed_counts = [0] * len(ROLE_TYPES)
+        total = sum(processed_counts) if valid_data or processed_counts else 0
+        row_data = [group, *processed_counts, total]
+        for col_idx, cell_value in enumerate(row_data, 1):
+            if col_idx <= NUM_COLS_TOTAL_EXCEL:
+                layout.cell(current_row, col_idx, cell_value, STYLE_CELL_LEFT if col_idx == 1 else STYLE_CELL)
+        current_row += 1
+    layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+
+    # --- 裝機進度 ---
+    if day.progress_entries:
+        layout.merge(current_row, 1, current_row, NUM_COLS_TOTAL_EXCEL)
+        layout.cell(current_row, 1, "裝機進度", STYLE_HEADER)
+        for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): layout.style(current_row, c, STYLE_HEADER)
+        current_row += 1
+        header_progress = ["機台", "項次", "內容", "人力", "備註"]
+        layout.cell(current_row, 1, header_progress[0], STYLE_HEADER); layout.cell(current_row, 2, header_progress[1], STYLE_HEADER)
+        layout.merge(current_row, 3, current_row, 4); layout.cell(current_row, 3, header_progress[2], STYLE_HEADER); layout.style(current_row, 4, STYLE_HEADER)
+        layout.cell(current_row, 5, header_progress[3], STYLE_HEADER); layout.cell(current_row, 6, header_progress[4], STYLE_HEADER)
+        current_row += 1
+        for machine, item, content, manpower, note in day.progress_entries:
+            layout.cell(current_row, 1, machine, STYLE_CELL_LEFT); layout.cell(current_row, 2, item, STYLE_CELL)
+            layout.merge(current_row, 3, current_row, 4); layout.cell(current_row, 3, content, STYLE_CELL_LEFT); layout.style(current_row, 4, STYLE_CELL_LEFT) # 內容靠左
+            layout.cell(current_row, 5, manpower, STYLE_CELL); layout.cell(current_row, 6, note, STYLE_CELL_LEFT) # 備註靠左
+            current_row += 1
+        layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+
+    # --- 週邊工作 ---
+    if day.side_entries:
+        layout.merge(current_row, 1, current_row, NUM_COLS_TOTAL_EXCEL)
+        layout.cell(current_row, 1, "週邊工作", STYLE_HEADER)
+        for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): layout.style(current_row, c, STYLE_HEADER)
+        current_row += 1
+        header_side = ["項次", "內容", "人力", "備註"]
+        layout.cell(current_row, 1, header_side[0], STYLE_HEADER)
+        layout.merge(current_row, 2, current_row, 4); layout.cell(current_row, 2, header_side[1], STYLE_HEADER)
+        layout.style(current_row, 3, STYLE_HEADER); layout.style(current_row, 4, STYLE_HEADER)
+        layout.cell(current_row, 5, header_side[2], STYLE_HEADER); layout.cell(current_row, 6, header_side[3], STYLE_HEADER)
+        current_row += 1
+        for item, content, manpower, note in day.side_entries:
+            layout.cell(current_row, 1, item, STYLE_CELL)
+            layout.merge(current_row, 2, current_row, 4); layout.cell(current_row, 2, content, STYLE_CELL_LEFT) # 內容靠左
+            layout.style(current_row, 3, STYLE_CELL_LEFT); layout.style(current_row, 4, STYLE_CELL_LEFT)
+            layout.cell(current_row, 5, manpower, STYLE_CELL); layout.cell(current_row, 6, note, STYLE_CELL_LEFT) # 備註靠左
+            current_row += 1
+        layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+
+    # --- 圖片區域 (2 欄，每張佔 3 欄寬，下方一列說明) ---
+    if day.photos:
+        layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+        layout.merge(current_row, 1, current_row, NUM_COLS_TOTAL_EXCEL)
+        layout.cell(current_row, 1, "進度留影", STYLE_SECTION)
+        for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): layout.style(current_row, c, STYLE_SECTION)
+        layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+        for i in range(0, len(day.photos), NUM_IMG_COLS_EXCEL):
+            layout.height(current_row, IMAGE_ROW_HEIGHT_EXCEL)
+            layout.height(current_row + 1, DEFAULT_ROW_HEIGHT_EXCEL)
+            for j, prepared_photo in enumerate(day.photos[i:i + NUM_IMG_COLS_EXCEL]):
+                col_start = 1 + j * IMG_COL_WIDTH_EXCEL; col_end = col_start + IMG_COL_WIDTH_EXCEL - 1
+                layout.merge(current_row + 1, col_start, current_row + 1, col_end)
+                if prepared_photo.error:
+                    if on_photo_error: on_photo_error(prepared_photo)
+                    layout.cell(current_row + 1, col_start, "圖片錯誤", STYLE_CELL)
+                    for c_idx in range(col_start + 1, col_end + 1): layout.style(current_row + 1, c_idx, STYLE_CELL)
+                    continue
+                layout.images.append((f"{get_column_letter(col_start)}{current_row}", prepared_photo))
+                layout.cell(current_row + 1, col_start, f"說明：{prepared_photo.name}", STYLE_CELL)
+                for c_idx in range(col_start + 1, col_end + 1): layout.style(current_row + 1, c_idx, STYLE_CELL)
+                for c_idx in range(col_start, col_end + 1): layout.style(current_row, c_idx, STYLE_PHOTO)
+            current_row += 2
+
+    # --- 記錄人 (底部) ---
+    layout.height(current_row, DEFAULT_ROW_HEIGHT_EXCEL); current_row += 1
+    layout.merge(current_row, 1, current_row, NUM_COLS_TOTAL_EXCEL)
+    layout.cell(current_row, 1, f"記錄人： {day.recorder}", STYLE_CELL_LEFT)
+    for c in range(2, NUM_COLS_TOTAL_EXCEL + 1): layout.style(current_row, c, STYLE_CELL_LEFT)
+    return layout
+
+
+def _layout_image(prepared_photo):
+    xl_img = XLImage(prepared_photo.open("excel")); xl_img.width, xl_img.height = EXCEL_PHOTO_SIZE_PX
+    return xl_img
+
+
+def render_layout_to_sheet(ws, layout):
+    """把版面寫入一般 (可隨機存取) 的工作表"""
+    register_named_styles(ws.parent)
+    for i in range(1, NUM_COLS_TOTAL_EXCEL + 1):
+        ws.column_dimensions[get_column_letter(i)].width = DEFAULT_COL_WIDTH_EXCEL
+    for merge_range in layout.merges: ws.merge_cells(merge_range)
+    for row, cells in layout.cells.items():
+        for col, (value, style) in cells.items():
+            cell = ws.cell(row=row, column=col)
+            if value is not None: cell.value = value
+            cell.style = style
+    for row, height in layout.heights.items(): ws.row_dimensions[row].height = height
+    for anchor, prepared_photo in layout.images: ws.add_image(_layout_image(prepared_photo), anchor)
+
+
+def render_layout_write_only(ws, layout):
+    """把版面以串流方式寫入 write_only 工作表 (欄寬、列高、合併需在寫列之前設定)"""
+    for i in range(1, NUM_COLS_TOTAL_EXCEL + 1):
+        ws.column_dimensions[get_column_letter(i)].width = DEFAULT_COL_WIDTH_EXCEL
+    for row, height in layout.heights.items(): ws.row_dimensions[row].height = height
+    for merge_range in layout.merges: ws.merged_cells.add(merge_range)
+    for anchor, prepared_photo in layout.images: ws.add_image(_layout_image(prepared_photo), anchor)
+    for row in range(1, layout.max_row + 1):
+        cells = layout.cells.get(row, {}); row_cells = [None] * max(cells, default=0)
+        for col, (value, style) in cells.items():
+            cell = WriteOnlyCell(ws, value=value); cell.style = style; row_cells[col - 1] = cell
+        ws.append(row_cells)
+
+
+class SharedMediaWriter(ExcelWriter):
+    """內容相同的圖片只寫入一個 media 部件，各分頁繪圖的關聯指向同一檔案 (跨日重複上傳的照片)
+    圖片在寫入所屬繪圖時立即寫進 zip，不在儲存結束前保留整本活頁簿的圖片位元組
+    覆寫 openpyxl 的內部方法，requirements.txt 因此固定 openpyxl~=3.1.5；升級前請先通過 tests/test_excel_export.py"""
+
+    def __init__(self, workbook, archive):
+        super().__init__(workbook, archive)
+        self._media_ids = {}; self.shared_images = 0
+
+    def _write_drawing(self, drawing):
+        """同 ExcelWriter._write_drawing，但圖片依內容編號，不重複的圖片直接寫出 (Image._data() 讀完即關閉來源並釋放緩衝)"""
+        self._drawings.append(drawing)
+        drawing._id = len(self._drawings)
+        for chart in drawing.charts:
+            self._charts.append(chart)
+            chart._id = len(self._charts)
+        for img in drawing.images:
+            data = img._data(); key = (photo_digest(data), img.format)
+            if key in self._media_ids:
+                self.shared_images += 1; img._id = self._media_ids[key]
+            else:
+                self._images.append(img); self._media_ids[key] = img._id = len(self._images)
+                self._archive.writestr(img.path[1:], data)
+        self._archive.writestr(drawing.path[1:], tostring(drawing._write()))
+        self._archive.writestr(get_rels_path(drawing.path)[1:], tostring(drawing._write_rels()))
+        self.manifest.append(drawing)
+
+    def _write_images(self):
+        pass # 已於 _write_drawing 寫出
+
+
+def save_workbook(wb, output):
+    """取代 wb.save(output)：相同內容的圖片共用 media 部件；回傳共用 (未重複寫入) 的圖片數"""
+    if wb.write_only and not wb.worksheets: wb.create_sheet()
+    wb.properties.modified = datetime.now(tz=timezone.utc).replace(tzinfo=None)
+    writer = SharedMediaWriter(wb, zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED, allowZip64=True))
+    writer.save()
+    return writer.shared_images
+
+
+def write_day_to_excel_sheet(ws, report_title_ws, install_date_ws, attendees_ws, recorder_ws, staff_data_ws, progress_entries_ws, side_entries_ws, photos_ws, on_photo_error=None):
+    """將一天的所有資料寫入指定的 openpyxl worksheet (ws)；photos_ws 為 prepare_photos() 的結果"""
+    day = DayRecord(report_title_ws, install_date_ws, attendees_ws, recorder_ws, staff_data_ws, progress_entries_ws, side_entries_ws, photos_ws)
+    render_layout_to_sheet(ws, build_day_layout(day, on_photo_error))
+
+
+def write_journal_workbook(days, output, on_photo_error=None, extra_sheets=(), on_sheet=None):
+    """以 write_only 模式串流寫出多天日誌 (每天一個分頁)；days 可為產生器，每天寫完即釋放其版面
+    extra_sheets: 接在日期分頁之後的其他分頁 [(分頁名稱, DayLayout)]，例如統計摘要
+    on_sheet(分頁名稱) 於每個分頁寫完後呼叫；跨日相同的照片只存一份，回傳共用的圖片數"""
+    wb = Workbook(write_only=True); register_named_styles(wb)
+    for day in days:
+        render_layout_write_only(wb.create_sheet(title=day.sheet_name), build_day_layout(day, on_photo_error))
+        if on_sheet: on_sheet(day.sheet_name)
+    for title, layout in extra_sheets:
+        render_layout_write_only(wb.create_sheet(title=title), layout)
+        if on_sheet: on_sheet(title)
+    return save_workbook(wb, output)
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""增量合併：把 .xlsx 當作 zip 套件，只寫入新增/取代的當天分頁 (工作表、繪圖、圖片) 與活頁簿清單
+其餘部件 (舊分頁、舊圖片) 直接複製壓縮後的原始位元組，不解析也不重新壓縮，合併成本只與當天資料量有關
+當天與日誌中既有圖片內容相同的照片 (跨日重複上傳) 直接引用舊的 media 部件，不再存第二份"""
+import copy
+import posixpath
+import re
+import struct
+import xml.etree.ElementTree as ET
+import zipfile
+import zlib
+from io import BytesIO
+from xml.sax.saxutils import quoteattr
+
+from excel_export import write_journal_workbook
+from xlsx_package import (NS_DOC_REL, NS_PKG_REL, NS_CT, REL_WORKSHEET, REL_STYLES, CT_WORKSHEET,
+                          qname, rels_path, read_rels, workbook_part)
+
+COPY_CHUNK_BYTES = 1024 * 1024
+# styles.xml 各區塊在 schema 中的順序 (新增缺少的區塊時需放在正確位置)
+STYLE_SECTIONS = ["numFmts", "fonts", "fills", "borders", "cellStyleXfs", "cellXfs", "cellStyles", "dxfs", "tableStyles", "colors", "extLst"]
+
+
+class PackageMergeError(Exception):
+    """套件結構不在預期內，呼叫端應改用 load_workbook 完整合併"""
+
+
+def _rels_xml(rels):
+    items = "".join(f'<Relationship Id={quoteattr(rid)} Type={quoteattr(rtype)} Target={quoteattr("/" + target)}/>' for rid, rtype, target in rels)
+    return f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships xmlns="{NS_PKG_REL}">{items}</Relationships>'.encode("utf-8")
+
+
+def _unused_name(names, pattern):
+    n = 1
+    while pattern.format(n) in names: n += 1
+    return pattern.format(n)
+
+
+def _copy_member_raw(src, info, dst):
+    """不解壓直接複製 zip 成員 (本地檔頭依中央目錄重建，去掉 data descriptor 旗標)"""
+    if info.flag_bits & 0x1: # 加密成員無法原樣搬移
+        dst.writestr(info, src.read(info)); return
+    src.fp.seek(info.header_offset)
+    local_header = src.fp.read(30)
+    if local_header[:4] != b"PK\x03\x04": raise PackageMergeError(f"zip 成員檔頭損壞: {info.filename}")
+    name_len, extra_len = struct.unpack("<HH", local_header[26:30])
+    src.fp.seek(info.header_offset + 30 + name_len + extra_len)
+    zinfo = copy.copy(info); zinfo.flag_bits &= ~0x08
+    zinfo.header_offset = dst.fp.tell()
+    dst.fp.write(zinfo.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        chunk = src.fp.read(min(COPY_CHUNK_BYTES, remaining))
+        if not chunk: raise PackageMergeError(f"zip 成員資料不完整: {info.filename}")
+        dst.fp.write(chunk); remaining -= len(chunk)
+    dst.filelist.append(zinfo); dst.NameToInfo[zinfo.filename] = zinfo
+    dst.start_dir = dst.fp.tell(); dst._didModify = True
+
+
+def _owned_parts(zf, root_part):
+    """root_part 及只被它 (遞迴) 引用的部件，取代分頁時一併移除；被其他分頁共用的圖片保留"""
+    referrers = {}
+    for name in zf.namelist():
+        if not name.endswith(".rels"): continue
+        folder, rels_name = posixpath.split(name)
+        source = posixpath.join(posixpath.dirname(folder), rels_name[:-len(".rels")])
+        for _, _, target in read_rels(zf, source):
+            if target: referrers.setdefault(target, set()).add(source)
+    owned = {root_part}; changed = True
+    while changed:
+        changed = False
+        for target, sources in referrers.items():
+            if target not in owned and sources <= owned and target in zf.NameToInfo:
+                owned.add(target); changed = True
+    return owned | {rels_path(p) for p in owned if rels_path(p) in zf.NameToInfo}
+
+
+def _media_index(zf):
+    """{(CRC32, 大小): [media 部件]}，只讀 zip 中央目錄"""
+    index = {}
+    for info in zf.infolist():
+        if info.filename.startswith("xl/media/"): index.setdefault((info.CRC, info.file_size), []).append(info.filename)
+    return index
+
+
+def _matching_media(zf, media_index, data):
+    """日誌中與 data 內容相同的既有圖片部件 (CRC 與大小相符時才讀出比對)，沒有則回傳 None"""
+    for part in media_index.get((zlib.crc32(data), len(data)), []):
+        if zf.read(part) == data: return part
+    return None
+
+
+def _children(root, section):
+    found = root.find(qname(section))
+    return list(found) if found is not None else []
+
+
+def _strip_ns(element):
+    """複製元素並移除命名空間，序列化後沿用舊 styles.xml 的預設命名空間"""
+    element = copy.deepcopy(element)
+    for node in element.iter():
+        if node.tag.startswith("{"): node.tag = node.tag.split("}", 1)[1]
+    return element
+
+
+def _canonical(element):
+    return ET.tostring(_strip_ns(element), encoding="unicode")
+
+
+def _merge_styles(old_xml, new_xml, used_xf_ids):
+    """把新分頁用到的 cellXfs (及其字體/填滿/框線/數字格式/具名樣式) 附加到舊 styles.xml
+    只做文字插入與 count 更新，不重新序列化舊內容；回傳 (新 styles.xml, {新 xf 編號: 舊 xf 編號})"""
+    old_text = old_xml.decode("utf-8")
+    if re.search(r"<\w+:styleSheet\b", old_text): raise PackageMergeError("styles.xml 使用前綴命名空間")
+    old_root = ET.fromstring(old_xml); new_root = ET.fromstring(new_xml)
+    sections = {name: [_canonical(e) for e in _children(old_root, name)] for name in STYLE_SECTIONS[:7]}
+    additions = {name: [] for name in STYLE_SECTIONS[:7]}
+    new_section = lambda name: _children(new_root, name)
+
+    def add(section, element):
+        text = _canonical(element); entries = sections[section]
+        if text in entries: return entries.index(text)
+        entries.append(text); additions[section].append(text)
+        return len(entries) - 1
+
+    new_num_fmts = {e.get("formatCode"): int(e.get("numFmtId")) for e in new_section("numFmts")}
+    new_num_fmt_codes = {v: k for k, v in new_num_fmts.items()}
+    old_num_fmts = {e.get("formatCode"): int(e.get("numFmtId")) for e in _children(old_root, "numFmts")}
+
+    def remap_xf(xf):
+        xf = _strip_ns(xf)
+        for attr, section in (("fontId", "fonts"), ("fillId", "fills"), ("borderId", "borders")):
+            if xf.get(attr) is not None: xf.set(attr, str(add(section, new_section(section)[int(xf.get(attr))])))
+        num_fmt_id = int(xf.get("numFmtId", 0))
+        if num_fmt_id >= 164: # 自訂數字格式需搬移並重新編號
+            code = new_num_fmt_codes[num_fmt_id]
+            if code not in old_num_fmts:
+                old_num_fmts[code] = max([163, *old_num_fmts.values()]) + 1
+                additions["numFmts"].append(f'<numFmt numFmtId="{old_num_fmts[code]}" formatCode={quoteattr(code)}/>')
+            xf.set("numFmtId", str(old_num_fmts[code]))
+        return xf
+
+    new_style_xfs = new_section("cellStyleXfs")
+    new_style_names = {int(e.get("xfId")): e for e in new_section("cellStyles")}
+    old_style_names = {e.get("name"): int(e.get("xfId")) for e in _children(old_root, "cellStyles")}
+    new_cell_xfs = new_section("cellXfs"); xf_map = {}
+    for xf_id in sorted(used_xf_ids):
+        xf = remap_xf(new_cell_xfs[xf_id])
+        style_xf_id = int(xf.get("xfId", 0)); cell_style = new_style_names.get(style_xf_id)
+        if cell_style is not None and cell_style.get("name") in old_style_names:
+            xf.set("xfId", str(old_style_names[cell_style.get("name")]))
+        elif cell_style is not None:
+            old_xf_id = add("cellStyleXfs", remap_xf(new_style_xfs[style_xf_id]))
+            cell_style = _strip_ns(cell_style); cell_style.set("xfId", str(old_xf_id))
+            additions["cellStyles"].append(ET.tostring(cell_style, encoding="unicode"))
+            old_style_names[cell_style.get("name")] = old_xf_id; xf.set("xfId", str(old_xf_id))
+        else: xf.set("xfId", "0")
+        xf_map[xf_id] = add("cellXfs", xf)
+
+    for section in STYLE_SECTIONS[:7]:
+        if not additions[section]: continue
+        inserted = "".join(additions[section])
+        match = re.search(rf"<{section}\b[^>]*?(/?)>", old_text)
+        if match is None: # 區塊不存在：插在下一個存在的區塊之前
+            following = [m for m in (re.search(rf"<{s}\b", old_text) for s in STYLE_SECTIONS[STYLE_SECTIONS.index(section) + 1:]) if m]
+            position = following[0].start() if following else old_text.index("</styleSheet>")
+            old_text = old_text[:position] + f'<{section} count="{len(additions[section])}">{inserted}</{section}>' + old_text[position:]
+            continue
+        count = len(_children(old_root, section)) + len(additions[section])
+        opening = re.sub(r'\scount="\d+"', "", match.group(0).rstrip("/>").rstrip(">")) + f' count="{count}">'
+        if match.group(1): # 自我關閉的空區塊 <numFmts count="0"/>
+            old_text = old_text[:match.start()] + opening + inserted + f"</{section}>" + old_text[match.end():]
+        else:
+            end = old_text.index(f"</{section}>", match.end())
+            old_text = old_text[:match.start()] + opening + old_text[match.end():end] + inserted + old_text[end:]
+    return old_text.encode("utf-8"), xf_map
+
+
+def _remap_sheet_styles(sheet_xml, xf_map):
+    text = sheet_xml.decode("utf-8")
+    if 't="s"' in text: raise PackageMergeError("新分頁含共用字串") # write_only 分頁應全為 inlineStr
+    text = re.sub(r'(<c\b[^>]*?\s)s="(\d+)"', lambda m: f'{m.group(1)}s="{xf_map.get(int(m.group(2)), 0)}"', text)
+    return text.encode("utf-8")
+
+
+def _used_xf_ids(sheet_xml):
+    return {int(m.group(1)) for m in re.finditer(r'<c\b[^>]*?\ss="(\d+)"', sheet_xml.decode("utf-8"))}
+
+
+def splice_sheet(journal_file, day_package, sheet_name, output):
+    """把 day_package (只含一個分頁的 .xlsx) 的分頁以 sheet_name 加入/取代到 journal_file，寫入 output
+    回傳 "replaced" 或 "added"；遇到無法處理的結構時拋出 PackageMergeError"""
+    with zipfile.ZipFile(journal_file) as src, zipfile.ZipFile(day_package) as new:
+        return _splice_sheet(src, new, sheet_name, output)
+
+
+def _splice_sheet(src, new, sheet_name, output):
+    names = set(src.namelist())
+    book_part = workbook_part(src)
+    if book_part is None: raise PackageMergeError("找不到 workbook 部件")
+    workbook_rels_path = rels_path(book_part)
+    workbook_rels = read_rels(src, book_part)
+    workbook_text = src.read(book_part).decode("utf-8")
+    workbook_root = ET.fromstring(workbook_text)
+    sheets = {s.get("name"): s.get(qname("id", NS_DOC_REL)) for s in workbook_root.iter(qname("sheet"))}
+    rel_targets = {rid: target for rid, _, target in workbook_rels}
+    styles_parts = [target for _, rtype, target in workbook_rels if rtype == REL_STYLES]
+    if not styles_parts: raise PackageMergeError("找不到 styles.xml")
+
+    # --- 新分頁的部件 ---
+    new_workbook_rels = read_rels(new, workbook_part(new))
+    new_sheet_part = [t for _, rtype, t in new_workbook_rels if rtype == REL_WORKSHEET][0]
+    new_styles_part = [t for _, rtype, t in new_workbook_rels if rtype == REL_STYLES][0]
+    new_content_types = {o.get("PartName")[1:]: o.get("ContentType") for o in ET.fromstring(new.read("[Content_Types].xml")).iter(qname("Override", NS_CT))}
+    new_defaults = {d.get("Extension"): d.get("ContentType") for d in ET.fromstring(new.read("[Content_Types].xml")).iter(qname("Default", NS_CT))}
+
+    # --- 目標分頁：取代既有 (先移除它獨佔的繪圖/圖片) 或新增 ---
+    removed = set(); calc_chain = []
+    if sheet_name in sheets:
+        mode = "replaced"; sheet_part = rel_targets[sheets[sheet_name]]
+        removed = _owned_parts(src, sheet_part)
+        calc_chain = [t for _, rtype, t in workbook_rels if rtype.endswith("/calcChain")]
+        removed.update(calc_chain) # 取代分頁後舊的計算鏈可能失效，交由 Excel 重建
+    else:
+        mode = "added"; sheet_part = _unused_name(names, "xl/worksheets/sheet{}.xml")
+    taken = names - removed
+
+    written = {} # 部件路徑 -> 位元組
+    new_overrides = {sheet_part: CT_WORKSHEET}
+    sheet_rels = []
+    media_index = _media_index(src); media_parts = {} # 新套件的圖片 -> 日誌中的部件 (內容相同的舊圖片直接共用)
+    for rid, rtype, target in read_rels(new, new_sheet_part): # 目前只有 drawing
+        if target is None: raise PackageMergeError("新分頁含外部連結")
+        drawing_part = _unused_name(taken, "xl/drawings/drawing{}.xml"); taken.add(drawing_part)
+        written[drawing_part] = new.read(target); new_overrides[drawing_part] = new_content_types[target]
+        drawing_rels = []
+        for media_rid, media_type, media_target in read_rels(new, target):
+            if media_target not in media_parts:
+                data = new.read(media_target); media_part = _matching_media(src, media_index, data)
+                if media_part is not None:
+                    removed.discard(media_part); taken.add(media_part) # 取代分頁時舊分頁的同一張照片保留下來共用
+                else:
+                    media_part = _unused_name(taken, "xl/media/image{}" + posixpath.splitext(media_target)[1]); taken.add(media_part)
+                    written[media_part] = data
+                media_parts[media_target] = media_part
+            drawing_rels.append((media_rid, media_type, media_parts[media_target]))
+        if drawing_rels: written[rels_path(drawing_part)] = _rels_xml(drawing_rels)
+        sheet_rels.append((rid, rtype, drawing_part))
+    if sheet_rels: written[rels_path(sheet_part)] = _rels_xml(sheet_rels)
+
+    new_sheet_xml = new.read(new_sheet_part)
+    styles_xml, xf_map = _merge_styles(src.read(styles_parts[0]), new.read(new_styles_part), _used_xf_ids(new_sheet_xml))
+    written[styles_parts[0]] = styles_xml
+    written[sheet_part] = _remap_sheet_styles(new_sheet_xml, xf_map)
+
+    # --- 活頁簿清單 ---
+    workbook_rels_text = src.read(workbook_rels_path).decode("utf-8")
+    for part in calc_chain:
+        workbook_rels_text = re.sub(rf'<Relationship\b[^>]*Target="[^"]*{re.escape(posixpath.basename(part))}"[^>]*/>', "", workbook_rels_text)
+    if mode == "added":
+        rid = _unused_name({r[0] for r in workbook_rels}, "rId{}")
+        relationship = f'<Relationship Id="{rid}" Type="{REL_WORKSHEET}" Target="/{sheet_part}"/>'
+        workbook_rels_text = workbook_rels_text.replace("</Relationships>", relationship + "</Relationships>")
+        sheet_ids = [int(s.get("sheetId")) for s in workbook_root.iter(qname("sheet"))]
+        sheets_close = re.search(r"</(\w+:)?sheets>", workbook_text)
+        if sheets_close is None: raise PackageMergeError("workbook.xml 沒有 sheets 區塊")
+        prefix = sheets_close.group(1) or ""
+        sheet_element = f'<{prefix}sheet xmlns:r="{NS_DOC_REL}" name={quoteattr(sheet_name)} sheetId="{max(sheet_ids, default=0) + 1}" r:id="{rid}"/>'
+        workbook_text = workbook_text[:sheets_close.start()] + sheet_element + workbook_text[sheets_close.start():]
+        written[book_part] = workbook_text.encode("utf-8")
+    written[workbook_rels_path] = workbook_rels_text.encode("utf-8")
+
+    content_types = src.read("[Content_Types].xml").decode("utf-8")
+    for part in removed:
+        content_types = re.sub(rf'<Override\b[^>]*PartName="/{re.escape(part)}"[^>]*/>', "", content_types)
+    extensions = {d.get("Extension").lower() for d in ET.fromstring(content_types).iter(qname("Default", NS_CT))}
+    additions = "".join(f'<Override PartName="/{part}" ContentType="{ctype}"/>' for part, ctype in new_overrides.items()
+                        if f'PartName="/{part}"' not in content_types)
+    for part in written:
+        ext = posixpath.splitext(part)[1][1:]
+        if ext and ext.lower() not in extensions and ext in new_defaults:
+            additions += f'<Default Extension="{ext}" ContentType="{new_defaults[ext]}"/>'; extensions.add(ext.lower())
+    written["[Content_Types].xml"] = content_types.replace("</Types>", additions + "</Types>").encode("utf-8")
+
+    # --- 寫出：未變動的部件原樣搬移，其餘寫入新內容 ---
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED) as dst:
+        for info in src.infolist():
+            if info.filename in removed and info.filename not in written: continue
+            if info.filename in written: dst.writestr(info.filename, written.pop(info.filename))
+            else: _copy_member_raw(src, info, dst)
+        for part, data in written.items(): dst.writestr(part, data)
+    return mode
+
+
+def merge_day_into_journal(journal_file, day, output, on_photo_error=None):
+    """把一天 (DayRecord) 以增量方式合併進既有日誌 journal_file，寫入 output；回傳 "replaced" 或 "added" """
+    day_package = BytesIO()
+    write_journal_workbook([day], day_package, on_photo_error)
+    return splice_sheet(journal_file, day_package, day.sheet_name, output)
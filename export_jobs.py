@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""背景導出工作：Excel / PDF 由行程共用的排程器產生，頁面在導出期間仍可操作
+工作回報照片與分頁進度、可取消；完成的輸出 (spill_io.SpooledFile，大檔在暫存檔) 保留在工作物件 (放在 st.session_state)，
+可重複下載不需重建，job.discard() 或工作物件被回收時刪除
+排程器同時最多執行 EXPORT_WORKERS 個導出，排隊的工作依 session 輪流執行 (執行中較少的 session 優先)，
+佇列已滿或同一 session 的工作過多時拒絕送出 (ExportRejected)；metrics_snapshot() 回報佇列深度與延遲百分位數
+
+    manager = JobManager()                          # app.py 以 st.cache_resource 保存，所有 session 共用
+    job = manager.submit("excel", "Excel 日誌", excel_day_task, day, ..., session=session_id)
+    job.fraction, job.progress_text, job.status     # 由頁面定時讀取 (排隊中時含排隊順位)
+    job.cancel()
+    job.read_output()                               # 下載時才讀出位元組
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from diagnostics import NULL_DIAGNOSTICS, export_diagnostics
+
+# 同時執行的導出數 (其餘排隊)；照片處理另以 photo_pipeline.PHOTO_CPU_SLOTS 限制整個行程的 CPU 使用
+EXPORT_WORKERS = int(os.environ.get("DIARY_EXPORT_WORKERS", 2))
+# 允許入列的上限：所有 session 合計的排隊工作數、每個 session 未結束 (排隊 + 執行中) 的工作數
+EXPORT_MAX_QUEUED = int(os.environ.get("DIARY_EXPORT_MAX_QUEUED", 20))
+EXPORT_MAX_PER_SESSION = int(os.environ.get("DIARY_EXPORT_MAX_PER_SESSION", 3))
+# 延遲百分位數以最近幾個結束的工作計算
+EXPORT_METRICS_WINDOW = int(os.environ.get("DIARY_EXPORT_METRICS_WINDOW", 200))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "排隊中", "執行中", "完成", "失敗", "已取消"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """工作已被取消；由進度回報處拋出，中止導出"""
+
+
+class ExportRejected(Exception):
+    """排程器拒絕送出 (佇列已滿或同一 session 的工作過多)；訊息可直接顯示給使用者"""
+
+
+class ExportJob:
+    """一個背景導出工作；進度與訊息由工作執行緒寫入、頁面讀取
+    導出函式以 job.add_photos() / job.sheet_done() / job.set_stage() 回報進度 (取消時在這些呼叫處拋出 JobCancelled)，
+    以 job.info() / warning() / error() 留下訊息 (背景執行緒不能直接呼叫 st.*)"""
+
+    def __init__(self, kind, label, sheet_unit="分頁", session=None):
+        self.id = uuid.uuid4().hex[:8]; self.kind = kind; self.label = label; self.sheet_unit = sheet_unit; self.session = session
+        self.status = QUEUED; self.stage = ""
+        self.photos_done = self.photos_total = self.sheets_done = self.sheets_total = 0
+        self.messages = [] # [(等級, 文字)]，等級為 info / warning / error / success
+        self.output = None; self.file_name = None; self.mime = None; self.exception = None; self.diagnostics = NULL_DIAGNOSTICS
+        self.created_at = time.time(); self.started_at = None; self.finished_at = None
+        self._cancel_event = threading.Event(); self._manager = None; self._output_lock = threading.Lock()
+
+    # --- 進度回報 (工作執行緒) ---
+    def check_cancelled(self):
+        if self._cancel_event.is_set(): raise JobCancelled()
+
+    def set_stage(self, stage, photos_total=None, sheets_total=None):
+        self.check_cancelled()
+        self.stage = stage
+        if photos_total is not None: self.photos_total = photos_total
+        if sheets_total is not None: self.sheets_total = sheets_total
+
+    def photo_progress(self, done, total):
+        """可直接作為 prepare_photos 的 on_progress"""
+        self.check_cancelled()
+        self.photos_done = done; self.photos_total = max(self.photos_total, total)
+
+    def add_photos(self, count):
+        self.check_cancelled()
+        self.photos_done += count; self.photos_total = max(self.photos_total, self.photos_done)
+
+    def sheet_done(self, *_):
+        """可直接作為 write_journal_workbook 的 on_sheet"""
+        self.check_cancelled()
+        self.sheets_done += 1; self.sheets_total = max(self.sheets_total, self.sheets_done)
+
+    def info(self, text): self.messages.append(("info", text))
+    def warning(self, text): self.messages.append(("warning", text))
+    def error(self, text): self.messages.append(("error", text))
+    def success(self, text): self.messages.append(("success", text))
+
+    # --- 狀態 (頁面) ---
+    @property
+    def active(self):
+        return self.status not in FINISHED_STATUSES
+
+    @property
+    def cancelling(self):
+        return self.active and self._cancel_event.is_set()
+
+    @property
+    def fraction(self):
+        if self.status == DONE: return 1.0
+        total = self.photos_total + self.sheets_total
+        return min(1.0, (self.photos_done + self.sheets_done) / total) if total else 0.0
+
+    @property
+    def elapsed(self):
+        if self.started_at is None: return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def queue_position(self):
+        """排隊中時為第幾個會被執行的工作 (1 起算，含其他 session)，否則為 None"""
+        return self._manager.queue_position(self) if self._manager is not None and self.status == QUEUED else None
+
+    @property
+    def progress_text(self):
+        position = self.queue_position
+        if position is not None: return f"{QUEUED}：第 {position} 位"
+        parts = [self.stage or self.status]
+        if self.photos_total: parts.append(f"照片 {self.photos_done}/{self.photos_total}")
+        if self.sheets_total: parts.append(f"{self.sheet_unit} {self.sheets_done}/{self.sheets_total}")
+        return "，".join(parts)
+
+    @property
+    def output_size(self):
+        return self.output.size if self.output is not None else 0
+
+    def read_output(self):
+        """完成的輸出內容；可直接作為 st.download_button 的 data (點擊下載時才呼叫)"""
+        with self._output_lock: return self.output.read_all()
+
+    def discard(self):
+        """刪除輸出 (暫存檔)；工作從頁面移除時呼叫"""
+        with self._output_lock:
+            if self.output is not None: self.output.close(); self.output = None
+
+    def cancel(self):
+        """要求取消；排隊中的工作直接取消，執行中的工作在下一次回報進度時停止"""
+        self._cancel_event.set()
+        if self._manager is not None and self._manager._withdraw(self):
+            self.status = CANCELLED; self.finished_at = time.time()
+
+
+def percentile(values, q):
+    """最近秩百分位數 (q 為 0~100)；values 需已排序，空清單回傳 None"""
+    if not values: return None
+    return values[min(len(values) - 1, max(0, -(-len(values) * q // 100) - 1))]
+
+
+class ExportMetrics:
+    """排程器的統計：目前與最高佇列深度、各狀態的完成數、最近 EXPORT_METRICS_WINDOW 個工作的排隊與總延遲"""
+
+    def __init__(self, window=EXPORT_METRICS_WINDOW):
+        self.submitted = 0; self.rejected = 0; self.peak_queued = 0
+        self.finished = {status: 0 for status in FINISHED_STATUSES}
+        self._latencies = deque(maxlen=window) # (種類, 排隊秒數, 總秒數)
+
+    def record(self, job):
+        self.finished[job.status] += 1
+        if job.status == DONE:
+            waited = (job.started_at or job.finished_at) - job.created_at
+            self._latencies.append((job.kind, waited, job.finished_at - job.created_at))
+
+    def latency_summary(self):
+        """{種類: {"count", "wait_p50", "wait_p90", "total_p50", "total_p90", "total_p99"}}，"全部" 為所有種類合計 (秒)"""
+        by_kind = {"全部": list(self._latencies)}
+        for entry in self._latencies: by_kind.setdefault(entry[0], []).append(entry)
+        summary = {}
+        for kind, entries in by_kind.items():
+            if not entries: continue
+            waits = sorted(e[1] for e in entries); totals = sorted(e[2] for e in entries)
+            summary[kind] = dict(count=len(entries), wait_p50=percentile(waits, 50), wait_p90=percentile(waits, 90),
+                                 total_p50=percentile(totals, 50), total_p90=percentile(totals, 90), total_p99=percentile(totals, 99))
+        return summary
+
+
+class JobManager:
+    """行程共用的導出排程器；submit() 立即回傳 ExportJob
+    工作放在各 session 的佇列，空閒的工作執行緒從「執行中工作最少」的 session 取出最早送出的工作 (同數量時取最久未輪到者)"""
+
+    def __init__(self, max_workers=EXPORT_WORKERS, max_queued=EXPORT_MAX_QUEUED, max_per_session=EXPORT_MAX_PER_SESSION):
+        self.max_workers = max(1, max_workers); self.max_queued = max_queued; self.max_per_session = max_per_session
+        self.metrics = ExportMetrics()
+        self._queues = {} # session -> deque[(ExportJob, task, args, kwargs, diagnostics)]
+        self._running = {} # session -> 執行中的工作數
+        self._served = {} # session -> 最近一次取出工作的序號 (沒有排隊與執行中的工作時移除)
+        self._dispatched = 0
+        self._condition = threading.Condition(); self._workers = []; self._closed = False
+
+    # --- 送出 (頁面) ---
+    def submit(self, kind, label, task, *args, session=None, sheet_unit="分頁", diagnostics=False, **kwargs):
+        """排入 task(job, *args, **kwargs)；task 回傳 (SpooledFile, 檔名, MIME)
+        session 為送出者的識別 (公平輪流與每個 session 的上限依此計算)；超過上限時拋出 ExportRejected
+        diagnostics 為 True 時 job.diagnostics 為 ExportDiagnostics (kind 作為標籤)，否則為 NULL_DIAGNOSTICS"""
+        with self._condition:
+            if self._closed: raise ExportRejected("伺服器正在關閉，無法送出導出。")
+            queued = self.queued_count
+            if queued >= self.max_queued:
+                self.metrics.rejected += 1
+                raise ExportRejected(f"目前有 {queued} 個導出排隊中，已達上限，請稍後再試。")
+            session_jobs = len(self._queues.get(session, ())) + self._running.get(session, 0)
+            if self.max_per_session and session_jobs >= self.max_per_session:
+                self.metrics.rejected += 1
+                raise ExportRejected(f"您已有 {session_jobs} 個導出尚未完成 (上限 {self.max_per_session})，請等待完成或取消後再送出。")
+            job = ExportJob(kind, label, sheet_unit, session); job._manager = self
+            self._queues.setdefault(session, deque()).append((job, task, args, kwargs, diagnostics))
+            self.metrics.submitted += 1; self.metrics.peak_queued = max(self.metrics.peak_queued, queued + 1)
+            if len(self._workers) < self.max_workers and queued + 1 > self.idle_workers: self._start_worker() # 執行緒需要時才建立
+            self._condition.notify()
+        return job
+
+    # --- 狀態 (頁面) ---
+    @property
+    def queued_count(self):
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def running_count(self):
+        return sum(self._running.values())
+
+    @property
+    def idle_workers(self):
+        return len(self._workers) - self.running_count
+
+    def queue_position(self, job):
+        """依目前的佇列與執行狀態模擬取出順序，回傳 job 的順位 (1 起算)；不在佇列中回傳 None"""
+        with self._condition:
+            queues = {session: deque(entry[0] for entry in q) for session, q in self._queues.items()}
+            running = dict(self._running); served = dict(self._served)
+            for position in range(1, sum(len(q) for q in queues.values()) + 1):
+                session = self._pick_session(queues, running, served)
+                if queues[session].popleft() is job: return position
+                running[session] = running.get(session, 0) + 1; served[session] = self._dispatched + position
+        return None
+
+    def admission_text(self):
+        """送出前的提示，例如「2 個導出執行中，3 個排隊中；新送出的導出需排隊」；沒有工作時回傳 None"""
+        running, queued = self.running_count, self.queued_count
+        if not running and not queued: return None
+        text = f"{running} 個導出執行中" + (f"，{queued} 個排隊中" if queued else "")
+        return text + ("；新送出的導出需排隊" if queued or running >= self.max_workers else "")
+
+    def metrics_snapshot(self):
+        with self._condition:
+            return dict(workers=self.max_workers, running=self.running_count, queued=self.queued_count,
+                        waiting_sessions=sum(1 for q in self._queues.values() if q), peak_queued=self.metrics.peak_queued,
+                        submitted=self.metrics.submitted, rejected=self.metrics.rejected, finished=dict(self.metrics.finished),
+                        latency=self.metrics.latency_summary())
+
+    # --- 排程 ---
+    @staticmethod
+    def _pick_session(queues, running, served):
+        """有排隊工作的 session 中執行中工作最少者；同數量時取最久未輪到者 (從未輪到的最優先，再依送出順序)"""
+        return min((session for session, q in queues.items() if q), key=lambda session: (running.get(session, 0), served.get(session, -1)))
+
+    def _next(self):
+        """取出下一個工作 (呼叫時持有 self._condition)；沒有工作時回傳 None"""
+        if not self.queued_count: return None
+        session = self._pick_session(self._queues, self._running, self._served)
+        entry = self._queues[session].popleft()
+        if not self._queues[session]: del self._queues[session]
+        self._running[session] = self._running.get(session, 0) + 1
+        self._dispatched += 1; self._served[session] = self._dispatched
+        return entry
+
+    def _withdraw(self, job):
+        """把排隊中的 job 移出佇列 (取消)；已開始執行時回傳 False"""
+        with self._condition:
+            queue = self._queues.get(job.session)
+            for entry in queue or ():
+                if entry[0] is job:
+                    queue.remove(entry)
+                    if not queue: del self._queues[job.session]; self._forget(job.session)
+                    self.metrics.finished[CANCELLED] += 1
+                    return True
+        return False
+
+    def _forget(self, session):
+        if session not in self._queues and session not in self._running: self._served.pop(session, None)
+
+    def _start_worker(self):
+        worker = threading.Thread(target=self._work, name=f"export-{len(self._workers) + 1}", daemon=True)
+        self._workers.append(worker); worker.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                entry = self._next()
+                while entry is None:
+                    if self._closed: return
+                    self._condition.wait(); entry = self._next()
+            job = entry[0]
+            try:
+                self._run(*entry)
+            finally:
+                with self._condition:
+                    self._running[job.session] -= 1
+                    if not self._running[job.session]: del self._running[job.session]; self._forget(job.session)
+                    self.metrics.record(job)
+
+    @staticmethod
+    def _run(job, task, args, kwargs, diagnostics):
+        job.started_at = time.time(); job.status = RUNNING
+        job.diagnostics = export_diagnostics(job.kind, diagnostics)
+        try:
+            job.check_cancelled()
+            job.output, job.file_name, job.mime = task(job, *args, **kwargs)
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.exception = e; job.status = FAILED
+        finally:
+            job.diagnostics.finish(); job.finished_at = time.time()
+
+    def shutdown(self, cancel_pending=True):
+        """停止接受新工作；cancel_pending 時取消所有排隊中的工作 (執行中的工作會完成)"""
+        with self._condition:
+            self._closed = True
+            if cancel_pending:
+                for queue in self._queues.values():
+                    for entry in queue: entry[0].status = CANCELLED; entry[0].finished_at = time.time()
+                self._queues.clear()
+            self._condition.notify_all()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""頁面上的各種導出 (由 JobManager 在背景執行)：每個函式的第一個參數為 ExportJob，回傳 (SpooledFile, 檔名, MIME)
+輸出超過 DIARY_SPILL_MB 時寫入暫存檔；每種導出只處理它需要的照片尺寸
+openpyxl / reportlab / pandas 相關模組在函式內才載入，首頁不需等待"""
+from photo_pipeline import prepare_photos, EXCEL_PHOTO_SIZE_PX, PDF_PHOTO_SIZE_PX
+from spill_io import SpooledFile
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_MIME = "application/pdf"
+
+
+def pdf_font_warning(job):
+    """PDF 模組載入後 (第一次導出 PDF 時) 才知道中文字體是否可用"""
+    from pdf_export import CJK_FONT_NAME
+    if CJK_FONT_NAME != 'STSong-Light':
+        job.warning(f"無法加載中文字體 STSong-Light，PDF 中的中文可能無法正確顯示。將使用 {CJK_FONT_NAME}。")
+
+
+def _photo_error_logger(job, suffix=""):
+    return lambda p: job.error(f"處理圖片 {p.name} 時發生錯誤{suffix}: {p.error}")
+
+
+def _prepare_day_photos(job, day, photo_options, target, size):
+    diag = job.diagnostics
+    job.set_stage("處理照片", photos_total=len(day.photos))
+    with diag.stage("prepare_photos (解碼/縮放/編碼)"):
+        day.photos = prepare_photos(day.photos, {target: size}, on_progress=job.photo_progress, **photo_options) # 一次解碼、平行裁切
+    diag.add_photos(day.photos)
+
+
+def _report_duplicates(job, matches, identical=True):
+    """重複照片提醒；identical=False 時只提醒相似 (內容相同者已共用圖片，由呼叫端彙總)"""
+    for match in matches:
+        if match.identical and identical:
+            job.info(f"照片 {match.photo.name} 與 {match.reference.label} 相同，日誌中共用同一份圖片。")
+        elif not match.identical:
+            job.warning(f"照片 {match.photo.name} 與 {match.reference.label} 相似 (差異 {match.distance}/64)，請確認是否重複上傳。")
+
+
+def excel_day_task(job, day, photo_options, journal=None, include_summary=True, journal_digest=None):
+    """當天的 Excel；有上傳舊日誌 (journal，建議先以 spill_io.spool_upload 複製) 時合併進去並可加入統計摘要分頁
+    journal_digest 為舊日誌的內容雜湊 (頁面已計算時傳入，查詢快取時不再重新計算)"""
+    from openpyxl import load_workbook
+    from excel_export import write_day_to_excel_sheet, write_journal_workbook, save_workbook
+    from excel_merge import merge_day_into_journal
+    from photo_dedup import prepared_fingerprints, load_journal_fingerprints, find_duplicates
+    diag = job.diagnostics
+    _prepare_day_photos(job, day, photo_options, "excel", EXCEL_PHOTO_SIZE_PX)
+    if day.photos:
+        job.set_stage("比對重複照片")
+        with diag.stage("比對重複照片 (內容雜湊 / dHash)"):
+            # 要被取代的同日分頁不列入比對
+            references = [f for f in load_journal_fingerprints(journal, journal_digest) if f.source != str(day.install_date)] if journal is not None else []
+            _report_duplicates(job, find_duplicates(prepared_fingerprints(day.photos, str(day.install_date)), references))
+    new_sheet_name = day.sheet_name
+    excel_photo_error = _photo_error_logger(job, " (將在 Excel 中標記)")
+    job.set_stage("寫入分頁", sheets_total=1 + bool(include_summary and journal is not None))
+
+    excel_file = SpooledFile()
+    wb = None; merged_incrementally = False
+    if journal is not None:
+        # 先嘗試增量合併：只改寫當天分頁，其餘分頁與圖片原樣搬移
+        try:
+            with diag.stage("merge_day_into_journal (增量合併)"):
+                merge_mode = merge_day_into_journal(journal, day, excel_file, on_photo_error=excel_photo_error)
+            merged_incrementally = True
+            job.info(f"已加載舊檔案: {journal.name}。已{'覆蓋' if merge_mode == 'replaced' else '添加'}分頁 '{new_sheet_name}'。")
+        except Exception as merge_err:
+            excel_photo_error = None # 照片錯誤已回報過
+            excel_file.close(); excel_file = SpooledFile()
+            job.warning(f"無法增量合併 ({merge_err})，改為完整讀取舊檔案。")
+    if journal is not None and not merged_incrementally:
+        try:
+            journal.seek(0)
+            with diag.stage("load_workbook"):
+                wb = load_workbook(journal)
+            job.info(f"已加載舊檔案: {journal.name}。將添加/覆蓋分頁 '{new_sheet_name}'。")
+            if new_sheet_name in wb.sheetnames:
+                # 先刪除舊分頁再於原位置重建，避免殘留舊內容
+                sheet_index = wb.sheetnames.index(new_sheet_name)
+                del wb[new_sheet_name]
+                ws = wb.create_sheet(title=new_sheet_name, index=sheet_index)
+            else:
+                ws = wb.create_sheet(title=new_sheet_name)
+        except Exception as e:
+            job.error(f"讀取上傳的 Excel 檔案時出錯: {e}")
+            job.warning("將創建全新的 Excel 檔案。")
+            wb = None
+
+    try:
+        if wb is None and not merged_incrementally: # 全新日誌：write_only 串流寫出
+            with diag.stage("write_journal_workbook (版面/樣式/儲存)"):
+                write_journal_workbook([day], excel_file, on_photo_error=excel_photo_error)
+        elif wb is not None:
+            with diag.stage("write_day_to_excel_sheet (儲存格/樣式)"):
+                write_day_to_excel_sheet(ws, day.report_title, day.install_date, day.attendees, day.recorder,
+                                         day.staff_data, day.progress_entries, day.side_entries, day.photos,
+                                         on_photo_error=excel_photo_error)
+            with diag.stage("wb.save"):
+                save_workbook(wb, excel_file)
+        job.sheet_done()
+        if include_summary and journal is not None:
+            job.set_stage("統計摘要分頁")
+            try: # 統計以舊日誌索引加上當天資料計算，不需重新解析合併後的檔案
+                from journal_index import load_journal_index
+                from journal_analytics import add_summary_sheet
+                with diag.stage("統計摘要分頁"):
+                    summary_index = load_journal_index(journal, journal_digest).with_days([day])
+                    summarized_file = SpooledFile()
+                    add_summary_sheet(excel_file, summary_index, summarized_file, day.report_title or None)
+                excel_file.close(); excel_file = summarized_file # 未加摘要的版本 (可能在暫存檔) 立即刪除
+            except Exception as summary_err:
+                job.warning(f"無法加入統計摘要分頁: {summary_err}")
+            job.sheet_done()
+    except Exception as write_err:
+        raise RuntimeError(f"寫入資料到 Excel 工作表 '{new_sheet_name}' 時發生錯誤: {write_err}") from write_err
+    excel_file_name = f"{day.report_title}_{day.install_date.strftime('%Y%m%d')}.xlsx" if day.report_title else f"安裝日記_{day.install_date.strftime('%Y%m%d')}.xlsx"
+    if journal is not None and day.report_title: # 如果合併且有報告標題
+        excel_file_name = f"{day.report_title}_合併_{day.install_date.strftime('%Y%m%d')}.xlsx"
+    elif journal is not None: # 如果合併但無報告標題
+        excel_file_name = f"安裝日記_合併_{day.install_date.strftime('%Y%m%d')}.xlsx"
+    job.success(f"檔案 {excel_file_name} 已成功產生/合併！")
+    return excel_file, excel_file_name, XLSX_MIME
+
+
+def pdf_day_task(job, day, photo_options):
+    """當天的 PDF 報告 (只包含頁面上輸入的資料)"""
+    from pdf_export import write_day_pdf, pdf_file_name
+    pdf_font_warning(job)
+    _prepare_day_photos(job, day, photo_options, "pdf", PDF_PHOTO_SIZE_PX)
+    job.set_stage("PDF 排版", sheets_total=1)
+    pdf_buffer = SpooledFile()
+    try:
+        with job.diagnostics.stage("doc.build (reportlab 排版)"):
+            write_day_pdf(day, pdf_buffer, on_photo_error=_photo_error_logger(job))
+    except Exception as pdf_err:
+        job.error("可能的原因包括：中文字體問題、圖片處理錯誤或 ReportLab 內部錯誤。請檢查 Streamlit 終端輸出獲取更詳細的錯誤信息。")
+        raise RuntimeError(f"產生 PDF 時發生錯誤: {pdf_err}") from pdf_err
+    job.sheet_done()
+    job.success("PDF 報告已成功產生！")
+    return pdf_buffer, pdf_file_name(day), PDF_MIME
+
+
+def _multi_day_pdf(job, days, title, photo_options):
+    from pdf_export import write_multi_day_pdf, multi_day_pdf_file_name
+    pdf_font_warning(job)
+    # 照片在繪製各頁時才逐張處理 (大小預算為單份報告整體設定，此處不適用)
+    lazy_photo_options = {k: v for k, v in photo_options.items() if k != "size_budget"}
+    def on_section(pass_count, section_count):
+        job.set_stage(f"PDF 排版 (第 {pass_count} 輪)"); job.sheets_done = section_count
+    job.set_stage("PDF 排版", sheets_total=len(days))
+    pdf_buffer = SpooledFile()
+    with job.diagnostics.stage("multiBuild (reportlab 排版，含目錄)"):
+        write_multi_day_pdf(days, pdf_buffer, title=title, photo_options=lazy_photo_options,
+                            on_photo_error=_photo_error_logger(job), on_section=on_section)
+    job.success(f"已合併 {len(days)} 天的日誌！")
+    return pdf_buffer, multi_day_pdf_file_name(days), PDF_MIME
+
+
+def journal_pdf_task(job, journal, start, end, title, photo_options):
+    """由上傳的舊日誌 (spool_upload 的複本) 中 start ~ end 的分頁產生多日 PDF"""
+    from journal_reader import iter_journal_days
+    job.set_stage("讀取日誌")
+    with job.diagnostics.stage("iter_journal_days"):
+        range_days = [d for d in iter_journal_days(journal) if start <= d.install_date <= end]
+    if not range_days: raise ValueError(f"日誌中沒有 {start} ~ {end} 的分頁。")
+    return _multi_day_pdf(job, range_days, title, photo_options)
+
+
+def store_pdf_task(job, store, title, photo_options):
+    """由本機儲存的所有日期產生多日 PDF (照片為 StoredPhoto，繪製時才讀取)"""
+    return _multi_day_pdf(job, list(store.iter_days()), title, photo_options)
+
+
+def store_journal_task(job, store, title, photo_options):
+    """由本機儲存的所有日期產生完整 Excel 日誌；逐天處理照片，寫完即釋放
+    照片大小預算 (size_budget) 為整份日誌的上限：依各天照片數分配，前面各天未用完的額度留給之後的日期"""
+    from excel_export import write_journal_workbook
+    from photo_dedup import prepared_fingerprints, find_duplicates
+    stored_days = store.dates()
+    if not stored_days: raise ValueError("本機儲存中沒有日誌")
+    photos_total = sum(len(d.photos) for d in store.iter_days())
+    job.set_stage("寫入分頁", photos_total=photos_total, sheets_total=len(stored_days))
+    seen = [] # 先前各天的照片指紋
+    def prepared_days():
+        budget_left, photos_left = photo_options.get("size_budget"), photos_total
+        for day in store.iter_days():
+            day_options = photo_options
+            if budget_left is not None and day.photos:
+                day_options = {**photo_options, "size_budget": max(1, budget_left * len(day.photos) // photos_left)}
+            day.photos = prepare_photos(day.photos, {"excel": EXCEL_PHOTO_SIZE_PX}, **day_options)
+            if budget_left is not None:
+                photos_left -= len(day.photos); budget_left -= sum(len(p.buffers["excel"]) for p in day.photos if "excel" in p.buffers)
+            job.add_photos(len(day.photos)); job.diagnostics.add_photos(day.photos)
+            fingerprints = prepared_fingerprints(day.photos, str(day.install_date))
+            _report_duplicates(job, find_duplicates(fingerprints, seen), identical=False); seen.extend(fingerprints)
+            yield day
+    store_excel = SpooledFile()
+    with job.diagnostics.stage("write_journal_workbook (逐天處理照片與寫入)"):
+        shared = write_journal_workbook(prepared_days(), store_excel, on_photo_error=_photo_error_logger(job), on_sheet=job.sheet_done)
+    if shared: job.info(f"{shared} 張重複的照片與其他日期共用同一份圖片。")
+    job.success(f"已寫入 {len(stored_days)} 天的日誌！")
+    return (store_excel, f"{title or '安裝日記'}_{stored_days[0].strftime('%Y%m%d')}-{stored_days[-1].strftime('%Y%m%d')}.xlsx",
+            XLSX_MIME)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""日誌統計：在 JournalIndex 的欄式資料上以 groupby / pivot 計算人力與進度統計
+結果供 Streamlit 圖表使用，並可輸出為日誌中的「統計摘要」分頁"""
+from io import BytesIO
+
+import pandas as pd
+
+from diary_model import ROLE_TYPES, STAFF_GROUPS
+from excel_export import (DayLayout, write_journal_workbook, NUM_COLS_TOTAL_EXCEL, TITLE_ROW_HEIGHT_EXCEL,
+                          STYLE_TITLE, STYLE_SECTION, STYLE_HEADER, STYLE_CELL, STYLE_CELL_LEFT)
+from excel_merge import splice_sheet
+
+SUMMARY_SHEET_NAME = "統計摘要"
+ROLLING_DAYS = 7 # 移動平均的日曆天數
+
+
+def _week_start(dates):
+    return dates.dt.to_period("W-SUN").dt.start_time
+
+
+def daily_headcount(index, rolling_days=ROLLING_DAYS):
+    """每天各人員分類的人數與總計，另附近 rolling_days 個日曆天內 (有紀錄的日子) 的平均總人數"""
+    table = (index.staff.pivot_table(index="date", columns="group", values="count", aggfunc="sum", fill_value=0)
+             .reindex(columns=STAFF_GROUPS, fill_value=0))
+    table["總計"] = table.sum(axis=1)
+    table[f"近{rolling_days}日平均"] = table["總計"].rolling(f"{rolling_days}D").mean().round(1)
+    table.columns.name = None
+    return table
+
+
+def role_man_days(index):
+    """各職務 × 人員分類的累計人天"""
+    table = (index.staff.pivot_table(index="role", columns="group", values="count", aggfunc="sum", fill_value=0)
+             .reindex(index=ROLE_TYPES, columns=STAFF_GROUPS, fill_value=0))
+    table["總計"] = table.sum(axis=1)
+    table.index.name = "職務"; table.columns.name = None
+    return table
+
+
+def machine_man_days(index):
+    """各機台的累計人天、紀錄天數與項目數"""
+    table = index.manpower_by_machine()
+    table.index.name = "機台"
+    return table
+
+
+def weekly_progress(index):
+    """每週 (週一起算) 的裝機 / 週邊項目數與人力"""
+    progress = index.progress.groupby(_week_start(index.progress["date"])).agg(
+        裝機項目=("machine", "size"), 機台數=("machine", "nunique"), 裝機人力=("manpower", "sum"))
+    side = index.side.groupby(_week_start(index.side["date"])).agg(週邊項目=("item", "size"), 週邊人力=("manpower", "sum"))
+    table = progress.join(side, how="outer").fillna(0).astype(int)
+    table.index.name = "週"
+    return table
+
+
+def weekly_machine_progress(index):
+    """每週 × 機台的裝機項目數 (圖表用)"""
+    table = index.progress.pivot_table(index=_week_start(index.progress["date"]), columns="machine", values="item", aggfunc="count", fill_value=0)
+    table.index.name = "週"; table.columns.name = None
+    return table
+
+
+def summary_tables(index, rolling_days=ROLLING_DAYS):
+    """{標題: DataFrame}，依摘要分頁中的順序"""
+    if not len(index): return {}
+    return {"各職務累計人天": role_man_days(index), "各機台累計人力": machine_man_days(index),
+            "每週進度": weekly_progress(index), "每日人力": daily_headcount(index, rolling_days)}
+
+
+def _cell_value(value):
+    if isinstance(value, pd.Timestamp): return value.strftime("%Y-%m-%d")
+    return value.item() if hasattr(value, "item") else value # numpy 純量 -> Python 數值
+
+
+def build_summary_layout(tables, title=None):
+    """把 summary_tables() 的結果排成一個分頁版面 (沿用日誌的具名樣式)"""
+    layout = DayLayout(); current_row = 1
+    layout.merge(current_row, 1, current_row, NUM_COLS_TOTAL_EXCEL)
+    layout.cell(current_row, 1, f"{title}　{SUMMARY_SHEET_NAME}" if title else SUMMARY_SHEET_NAME, STYLE_TITLE)
+    layout.height(current_row, TITLE_ROW_HEIGHT_EXCEL); current_row += 2
+    for table_title, table in tables.items():
+        table = table.reset_index()
+        layout.merge(current_row, 1, current_row, max(len(table.columns), 2))
+        layout.cell(current_row, 1, table_title, STYLE_SECTION); current_row += 1
+        for col_idx, header_text in enumerate(table.columns, 1):
+            layout.cell(current_row, col_idx, "日期" if header_text == "date" else str(header_text), STYLE_HEADER)
+        current_row += 1
+        for row in table.itertuples(index=False):
+            for col_idx, value in enumerate(row, 1):
+                layout.cell(current_row, col_idx, _cell_value(value), STYLE_CELL_LEFT if col_idx == 1 else STYLE_CELL)
+            current_row += 1
+        current_row += 1
+    return layout
+
+
+def add_summary_sheet(journal_file, index, output, title=None):
+    """把 index 的統計摘要以「統計摘要」分頁加入/取代到 journal_file，寫入 output"""
+    summary_package = BytesIO()
+    write_journal_workbook([], summary_package, extra_sheets=[(SUMMARY_SHEET_NAME, build_summary_layout(summary_tables(index), title))])
+    return splice_sheet(journal_file, summary_package, SUMMARY_SHEET_NAME, output)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""日誌索引：把既有日誌的每個日期分頁解析為 pandas DataFrame，供查詢與統計
+以 openpyxl read_only 串流讀取且不碰圖片部件；同一份檔案 (內容雜湊) 只解析一次"""
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from diary_model import ROLE_TYPES, STAFF_GROUPS
+from journal_reader import iter_journal_days
+from spill_io import file_digest, as_file
+
+# 行程內保留的日誌索引份數 (不同檔案內容)
+JOURNAL_INDEX_CACHE_SIZE = int(os.environ.get("DIARY_JOURNAL_INDEX_CACHE", 8))
+
+DAY_COLUMNS = ["date", "sheet", "report_title", "attendees", "recorder"]
+STAFF_COLUMNS = ["date", "group", "role", "count"]
+PROGRESS_COLUMNS = ["date", "machine", "item", "content", "manpower", "note"]
+SIDE_COLUMNS = ["date", "item", "content", "manpower", "note"]
+
+
+class JournalIndex:
+    """一本日誌的欄式索引
+    days: 每天一列；staff: 每天 × 人員分類 × 職務一列 (長表)；progress / side: 每個項目一列"""
+
+    def __init__(self, days, staff, progress, side, digest=None):
+        self.days = days; self.staff = staff; self.progress = progress; self.side = side; self.digest = digest
+
+    def __len__(self):
+        return len(self.days)
+
+    @property
+    def date_range(self):
+        if self.days.empty: return None, None
+        return self.days["date"].min().date(), self.days["date"].max().date()
+
+    def manpower_by_machine(self):
+        """各機台的累計人力 (人天) 與紀錄天數，依人力由大到小"""
+        grouped = self.progress.groupby("machine", sort=False)
+        return (pd.DataFrame({"人力": grouped["manpower"].sum(), "天數": grouped["date"].nunique(), "項目數": grouped.size()})
+                .sort_values("人力", ascending=False))
+
+    def search(self, keyword, sections=("progress", "side")):
+        """內容或備註包含 keyword 的項目 (不分大小寫)，依日期排序"""
+        frames = []
+        for section in sections:
+            frame = getattr(self, section)
+            hit = frame["content"].str.contains(keyword, case=False, regex=False) | frame["note"].str.contains(keyword, case=False, regex=False)
+            frames.append(frame[hit].assign(section=section))
+        if not frames: return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True).sort_values("date", kind="stable").reset_index(drop=True)
+
+    def with_days(self, days):
+        """加入 (或取代同日期的) days 後的新索引，例如尚未寫入日誌的當天資料"""
+        added = index_days(days)
+        dates = added.days["date"]
+        merged = [pd.concat([old[~old["date"].isin(dates)], new], ignore_index=True)
+                  for old, new in ((self.days, added.days), (self.staff, added.staff), (self.progress, added.progress), (self.side, added.side))]
+        merged[0] = merged[0].sort_values("date", kind="stable").reset_index(drop=True)
+        return JournalIndex(*merged)
+
+
+def index_days(days, digest=None):
+    """由 DayRecord 一次建出所有 DataFrame"""
+    days_rows, staff, progress, side = [], [], [], []
+    for day in days:
+        when = day.install_date
+        days_rows.append((when, day.sheet_name, day.report_title, day.attendees, day.recorder))
+        for group in STAFF_GROUPS:
+            staff += [(when, group, role, count) for role, count in zip(ROLE_TYPES, day.staff_data.get(group, []))]
+        progress += [(when, *entry) for entry in day.progress_entries]
+        side += [(when, *entry) for entry in day.side_entries]
+
+    def frame(rows, columns, numeric=()):
+        df = pd.DataFrame(rows, columns=columns)
+        df["date"] = pd.to_datetime(df["date"])
+        for column in numeric: df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0)
+        for column in ("content", "note"):
+            if column in df: df[column] = df[column].fillna("").astype(str)
+        return df
+    return JournalIndex(frame(days_rows, DAY_COLUMNS).sort_values("date", kind="stable").reset_index(drop=True),
+                        frame(staff, STAFF_COLUMNS, ["count"]), frame(progress, PROGRESS_COLUMNS, ["manpower"]),
+                        frame(side, SIDE_COLUMNS, ["manpower"]), digest)
+
+
+def build_journal_index(journal_file, digest=None):
+    """逐分頁解析日誌 (略過圖片)"""
+    return index_days(iter_journal_days(journal_file, with_photos=False), digest)
+
+
+_index_cache = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def load_journal_index(journal_file, digest=None):
+    """回傳 journal_file (路徑、位元組或 file-like) 的 JournalIndex；依內容雜湊快取，同一份檔案重複查詢不再解析
+    雜湊分段計算、解析直接讀取 journal_file，大型日誌不會整份複製到記憶體；已知雜湊 (digest) 時不再重新計算"""
+    digest = digest or file_digest(journal_file)
+    with _index_lock:
+        index = _index_cache.get(digest)
+        if index is not None:
+            _index_cache.move_to_end(digest); return index
+    index = build_journal_index(as_file(journal_file), digest)
+    with _index_lock:
+        _index_cache[digest] = index
+        while len(_index_cache) > JOURNAL_INDEX_CACHE_SIZE: _index_cache.popitem(last=False)
+    return index
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""讀回既有日誌：依 write_day_to_excel_sheet 的版面把每個日期分頁解析回 DayRecord
+儲存格以 openpyxl read_only 串流讀取；照片只記錄其在 zip 中的位置，需要時才讀取"""
+import posixpath
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from datetime import date
+
+from openpyxl import load_workbook
+
+from diary_model import DayRecord, ROLE_TYPES, STAFF_GROUPS
+from excel_export import NUM_COLS_TOTAL_EXCEL
+from xlsx_package import NS_DOC_REL, NS_DRAWING, NS_A, REL_DRAWING, qname, read_rels, sheet_parts
+
+CAPTION_PREFIX = "說明："
+RECORDER_PREFIX = "記錄人："
+
+
+class JournalArchive:
+    """iter_journal_days() 期間共用一個 ZipFile，結束時關閉；之後的讀取各自開啟並立即關閉
+    (Windows 上開啟中的檔案無法刪除或覆寫，不能讓延遲讀取的照片一直持有檔案)"""
+
+    def __init__(self, source):
+        self.source = source; self.zip = zipfile.ZipFile(source); self._lock = threading.Lock()
+
+    def read(self, member):
+        with self._lock: # 同一個 file-like 來源不能同時由多個 ZipFile 讀取
+            if self.zip is not None: return self.zip.read(member)
+            with zipfile.ZipFile(self.source) as archive: return archive.read(member)
+
+    def close(self):
+        with self._lock:
+            if self.zip is not None: self.zip.close(); self.zip = None
+
+
+class JournalPhoto:
+    """日誌中嵌入的一張照片；getvalue() 時才從 zip 讀出位元組 (可直接交給 prepare_photos)"""
+
+    def __init__(self, archive, member, name):
+        self.archive = archive; self.member = member; self.name = name
+
+    def getvalue(self):
+        return self.archive.read(self.member)
+
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def _parse_date(value):
+    try: return date.fromisoformat(_text(value).strip()[:10])
+    except ValueError: return None
+
+
+def _is_blank(row):
+    return all(v is None or v == "" for v in row)
+
+
+def parse_day_rows(rows, sheet_name):
+    """把一個分頁的儲存格值 (每列一個 list，至少 NUM_COLS_TOTAL_EXCEL 欄) 解析為 DayRecord；非日誌分頁回傳 None"""
+    day = DayRecord(install_date=None, staff_data={group: [0] * len(ROLE_TYPES) for group in STAFF_GROUPS})
+    i = 0
+    while i < len(rows):
+        row = rows[i]; first = row[0]
+        if first == "日期":
+            day.install_date = _parse_date(row[1]) or _parse_date(sheet_name)
+        elif first == "參加人員":
+            day.attendees = _text(row[1])
+        elif first == "人員分類":
+            while i + 1 < len(rows) and rows[i + 1][0] in STAFF_GROUPS:
+                i += 1
+                day.staff_data[rows[i][0]] = [int(v or 0) if isinstance(v, (int, float)) else 0 for v in rows[i][1:1 + len(ROLE_TYPES)]]
+        elif first == "裝機進度":
+            i += 2 # 跳過區塊標題列與表頭
+            while i < len(rows) and not _is_blank(rows[i]):
+                machine, item, content, _, manpower, note = rows[i][:6]
+                day.progress_entries.append([_text(machine), item, _text(content), manpower or 0, _text(note)]); i += 1
+        elif first == "週邊工作":
+            i += 2
+            while i < len(rows) and not _is_blank(rows[i]):
+                item, content, _, _, manpower, note = rows[i][:6]
+                day.side_entries.append([item, _text(content), manpower or 0, _text(note)]); i += 1
+        elif isinstance(first, str) and first.startswith(RECORDER_PREFIX):
+            day.recorder = first[len(RECORDER_PREFIX):].strip()
+        elif i == 0 and first:
+            day.report_title = _text(first)
+        i += 1
+    return day if day.install_date else None
+
+
+def _sheet_photos(archive, sheet_part, rows):
+    """依繪圖錨點 (列, 欄) 排序取出分頁中的照片，說明列 "說明：檔名" 作為照片名稱 (archive 為 JournalArchive)"""
+    package = archive.zip
+    drawings = [target for _, rtype, target in read_rels(package, sheet_part) if rtype == REL_DRAWING and target]
+    photos = []
+    for drawing in drawings:
+        media = {rid: target for rid, _, target in read_rels(package, drawing)}
+        for anchor in ET.fromstring(package.read(drawing)):
+            start = anchor.find(qname("from", NS_DRAWING)); blip = anchor.find(f".//{qname('blip', NS_A)}")
+            if start is None or blip is None: continue
+            row = int(start.find(qname("row", NS_DRAWING)).text); col = int(start.find(qname("col", NS_DRAWING)).text)
+            member = media.get(blip.get(qname("embed", NS_DOC_REL)))
+            if not member: continue
+            caption = _text(rows[row + 1][col]) if row + 1 < len(rows) and col < len(rows[row + 1]) else ""
+            name = caption[len(CAPTION_PREFIX):] if caption.startswith(CAPTION_PREFIX) else posixpath.basename(member)
+            photos.append((row, col, JournalPhoto(archive, member, name)))
+    return [photo for _, _, photo in sorted(photos, key=lambda p: (p[0], p[1]))]
+
+
+def iter_journal_days(journal_file, with_photos=True):
+    """逐一產生日誌中每個日期分頁的 DayRecord (非日誌分頁略過)
+    with_photos=False 時完全不碰繪圖與圖片部件；為 True 時 photos 為延遲讀取的 JournalPhoto"""
+    archive = JournalArchive(journal_file) if with_photos else None
+    wb = None
+    try:
+        parts = sheet_parts(archive.zip) if with_photos else {}
+        if hasattr(journal_file, "seek"): journal_file.seek(0)
+        wb = load_workbook(journal_file, read_only=True, data_only=True)
+        for ws in wb.worksheets:
+            rows = [list(r[:NUM_COLS_TOTAL_EXCEL]) + [None] * (NUM_COLS_TOTAL_EXCEL - len(r)) for r in ws.iter_rows(values_only=True)]
+            day = parse_day_rows(rows, ws.title)
+            if day is None: continue
+            if with_photos and parts.get(ws.title): day.photos = _sheet_photos(archive, parts[ws.title], rows)
+            yield day
+    finally:
+        if wb is not None: wb.close()
+        if archive is not None: archive.close()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""PDF 導出：由 DayRecord 組出 reportlab story 並產生單日報告或多日合併報告 (Streamlit 與批次 CLI 共用)"""
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from reportlab.platypus import SimpleDocTemplate, BaseDocTemplate, PageTemplate, Frame, Flowable, Paragraph, Spacer, Image, Table, LongTable, TableStyle, PageBreak
+from reportlab.platypus.tableofcontents import TableOfContents
+from reportlab.lib.utils import ImageReader
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_LEFT, TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import units
+from reportlab.lib import colors
+# Import CJK Font support
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+
+from diary_model import ROLE_TYPES, STAFF_GROUPS
+from photo_pipeline import PreparedPhoto, PhotoCache, prepare_photos, PDF_PHOTO_SIZE_PX
+
+# --- Try to Register CJK Font ---
+try:
+    pdfmetrics.registerFont(UnicodeCIDFont('STSong-Light'))
+    CJK_FONT_NAME = 'STSong-Light'
+except Exception:
+    CJK_FONT_NAME = 'Helvetica' # Fallback font
+
+PAGE_WIDTH, PAGE_HEIGHT = A4
+PDF_MARGIN = 1.5*units.cm
+PDF_DOC_WIDTH = PAGE_WIDTH - 2 * PDF_MARGIN
+# 表格儲存格：字級/行距與 CJKTableContent 相同，純文字與 Paragraph 的列高一致；左右內距為 reportlab 預設
+TABLE_FONT_SIZE, TABLE_LEADING = 9, 12
+TABLE_CELL_PADDING = 6
+
+
+@lru_cache(maxsize=None)
+def build_pdf_styles():
+    """PDF 段落樣式 (每個行程只建立一次，各報告共用；請勿修改回傳的樣式)"""
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='CJKNormal', parent=styles['Normal'], fontName=CJK_FONT_NAME, fontSize=10, alignment=TA_LEFT))
+    styles.add(ParagraphStyle(name='CJKBold', parent=styles['CJKNormal'], fontName=CJK_FONT_NAME, fontSize=10, alignment=TA_LEFT))
+    # 主標題 (報告標題)
+    styles.add(ParagraphStyle(name='CJKMainTitle', parent=styles['h1'], fontName=CJK_FONT_NAME, fontSize=20, alignment=TA_CENTER, spaceAfter=6))
+    # 副標題 (工廠安裝日記)
+    styles.add(ParagraphStyle(name='CJKSubTitle', parent=styles['h2'], fontName=CJK_FONT_NAME, fontSize=16, alignment=TA_CENTER, spaceAfter=12))
+    styles.add(ParagraphStyle(name='CJKHeading2', fontName=CJK_FONT_NAME, fontSize=14, leading=17, alignment=TA_LEFT, spaceBefore=6, spaceAfter=6))
+    styles.add(ParagraphStyle(name='CJKTableContent', parent=styles['Normal'], fontName=CJK_FONT_NAME, fontSize=9, alignment=TA_CENTER))
+    styles.add(ParagraphStyle(name='CJKTableContentLeft', parent=styles['CJKTableContent'], alignment=TA_LEFT))
+    styles.add(ParagraphStyle(name='CJKFooterTitleBold', fontName=CJK_FONT_NAME, fontSize=14, alignment=TA_LEFT, leading=17))
+    # 多日報告：每天一節的標題 (列入目錄與書籤) 與目錄項目
+    styles.add(ParagraphStyle(name='CJKDayHeading', parent=styles['h1'], fontName=CJK_FONT_NAME, fontSize=18, alignment=TA_LEFT, spaceAfter=12))
+    styles.add(ParagraphStyle(name='CJKTOCEntry', fontName=CJK_FONT_NAME, fontSize=11, leading=16, leftIndent=12))
+    return styles
+
+
+class PdfReportTemplate:
+    """預先編譯的報告版面：段落樣式、表格樣式與欄寬只建立一次，各報告 (含背景工作同時產生的報告) 共用
+    Frame / PageTemplate 在排版時會記錄目前位置，仍由每份文件各自建立"""
+
+    def __init__(self, doc_width=PDF_DOC_WIDTH):
+        self.doc_width = doc_width; self.styles = build_pdf_styles()
+        grid = [('GRID', (0,0), (-1,-1), 0.5, colors.black), ('BACKGROUND', (0,0), (-1,0), colors.lightgrey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+                ('FONT', (0,0), (-1,-1), CJK_FONT_NAME, TABLE_FONT_SIZE, TABLE_LEADING), ('ALIGN', (0,0), (-1,0), 'CENTER')]
+        self.basic_info_widths = [doc_width/4, doc_width*3/4] # 調整欄寬以適應兩欄
+        self.basic_info_style = TableStyle([('GRID', (0,0), (-1,-1), 0.5, colors.grey), ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+                                            ('FONT', (0,0), (-1,-1), CJK_FONT_NAME, 10, 12)])
+        self.staff_widths = [doc_width*0.225] + [doc_width*0.15]*len(ROLE_TYPES) + [doc_width*0.175]
+        self.staff_style = TableStyle(grid + [('ALIGN', (1,1), (-1,-1), 'CENTER')])
+        self.progress_widths = [doc_width*0.15, doc_width*0.1, doc_width*0.4, doc_width*0.1, doc_width*0.25]
+        self.progress_style = TableStyle(grid + [('ALIGN', (1,1), (1,-1), 'CENTER'), ('ALIGN', (3,1), (3,-1), 'CENTER')])
+        self.side_widths = [doc_width*0.1, doc_width*0.55, doc_width*0.1, doc_width*0.25]
+        self.side_style = TableStyle(grid + [('ALIGN', (0,1), (0,-1), 'CENTER'), ('ALIGN', (2,1), (2,-1), 'CENTER')])
+        self.img_margin = 0.5 * units.cm
+        self.img_width = (doc_width - self.img_margin) / 2; self.img_height = 6 * units.cm
+        self.photo_row_widths = [self.img_width, self.img_margin, self.img_width]
+        self.photo_row_style = TableStyle([('VALIGN', (0,0), (-1,-1), 'TOP')])
+
+    def cell(self, value, col_width, style_name='CJKTableContentLeft'):
+        """一行放得下的純文字直接作為儲存格 (不需建立與排版 Paragraph)；需換行時才用 Paragraph"""
+        text = "" if value is None else str(value)
+        if "\n" in text or stringWidth(text, CJK_FONT_NAME, TABLE_FONT_SIZE) > col_width - 2 * TABLE_CELL_PADDING:
+            return Paragraph(escape(text), self.styles[style_name])
+        return text
+
+    def table(self, rows, col_widths, style, header=True):
+        """表格；有標題列的表格在跨頁時重複標題，並以 LongTable 分頁 (列數多時不需反覆重算整張表)"""
+        table = (LongTable(rows, colWidths=col_widths, repeatRows=1) if header else Table(rows, colWidths=col_widths))
+        table.setStyle(style)
+        return table
+
+
+@lru_cache(maxsize=None)
+def compile_report_template(doc_width=PDF_DOC_WIDTH):
+    return PdfReportTemplate(doc_width)
+
+
+class LazyPhoto(Flowable):
+    """繪製頁面時才讀取並處理的照片，story 中只保留來源 (路徑 / JournalPhoto)，不持有解碼後的影像
+    多日報告的記憶體因此不隨天數成長；photo_options 同 prepare_photos 的參數 (建議帶 cache，multiBuild 會繪製多次)"""
+
+    def __init__(self, source, width, height, style, photo_options=None, on_photo_error=None):
+        super().__init__()
+        self.source = source; self.width = width; self.height = height; self.style = style
+        self.photo_options = photo_options or {}; self.on_photo_error = on_photo_error
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        prepared = prepare_photos([self.source], {"pdf": PDF_PHOTO_SIZE_PX}, max_workers=1, **self.photo_options)[0]
+        if prepared.error:
+            if self.on_photo_error: self.on_photo_error(prepared)
+            error_text = Paragraph(f"[圖片錯誤: {escape(prepared.name)}]", self.style)
+            _, text_height = error_text.wrap(self.width, self.height)
+            error_text.drawOn(self.canv, 0, self.height - text_height); return
+        self.canv.drawImage(ImageReader(prepared.open("pdf")), 0, 0, self.width, self.height)
+
+
+def build_day_story(day, doc_width=PDF_DOC_WIDTH, on_photo_error=None, section=False, photo_options=None):
+    """一天報告的 flowables：第一頁為基本資訊與表格，第二頁起為照片；樣式來自 compile_report_template()
+    photos 為 prepare_photos() 的結果；其他來源 (路徑 / JournalPhoto) 以 LazyPhoto 於繪製時才處理
+    section=True 時以單行日期標題取代報告主標題 (多日報告的一節)"""
+    template = compile_report_template(doc_width); styles = template.styles
+    story = []
+
+    # --- PDF 內容 - 第一頁 ---
+    if section:
+        story.append(Paragraph(f"{day.install_date}　{escape(day.report_title or '工廠安裝日記')}", styles['CJKDayHeading']))
+    elif day.report_title:
+        story.append(Paragraph(escape(day.report_title), styles['CJKMainTitle']))
+        story.append(Paragraph("安裝日誌", styles['CJKSubTitle']))
+    else:
+        story.append(Paragraph("工廠安裝日記", styles['CJKMainTitle'])) # 如果沒有輸入報告標題，使用預設
+    story.append(Spacer(1, 0.5*units.cm))
+
+    # 基本資訊表格 (天氣已刪除)
+    story.append(template.table([["日期", str(day.install_date)]], template.basic_info_widths, template.basic_info_style, header=False))
+    story.append(Spacer(1, 0.2*units.cm)) # 縮小間距
+
+    # 參加人員
+    if day.attendees:
+        story.append(Paragraph("<b>參加人員：</b>", styles['CJKNormal']))
+        # 將 attendees 字串按換行符分割，然後用逗號連接（如果使用者用換行輸入）
+        attendees_display = day.attendees.replace('\n', ', ')
+        story.append(Paragraph(escape(attendees_display), styles['CJKNormal']))
+        story.append(Spacer(1, 0.5*units.cm))
+
+    story.append(Paragraph("人力配置", styles['CJKHeading2']))
+    staff_table_data = [["人員分類", *ROLE_TYPES, "總計"]]
+    for group in STAFF_GROUPS:
+        processed_counts = [int(c) for c in day.staff_data.get(group, [])]
+        staff_table_data.append([group, *map(str, processed_counts), str(sum(processed_counts))])
+    story.append(template.table(staff_table_data, template.staff_widths, template.staff_style)); story.append(Spacer(1, 0.5*units.cm))
+
+    if day.progress_entries:
+        story.append(Paragraph("裝機進度紀錄", styles['CJKHeading2']))
+        widths = template.progress_widths
+        progress_table_data = [["機台", "項次", "內容", "人力", "備註"]]
+        for machine, item, content, manpower, note in day.progress_entries:
+            progress_table_data.append([template.cell(machine, widths[0]), str(item), template.cell(content, widths[2]),
+                                        template.cell(manpower, widths[3], 'CJKTableContent'), template.cell(note, widths[4])])
+        story.append(template.table(progress_table_data, widths, template.progress_style)); story.append(Spacer(1, 0.5*units.cm))
+
+    if day.side_entries:
+        story.append(Paragraph("週邊工作紀錄", styles['CJKHeading2']))
+        widths = template.side_widths
+        side_table_data = [["項次", "內容", "人力", "備註"]]
+        for item, content, manpower, note in day.side_entries:
+            side_table_data.append([str(item), template.cell(content, widths[1]), template.cell(manpower, widths[2], 'CJKTableContent'),
+                                    template.cell(note, widths[3])])
+        story.append(template.table(side_table_data, widths, template.side_style)); story.append(Spacer(1, 0.5*units.cm))
+
+    # --- 換頁 ---
+    story.append(PageBreak())
+
+    # --- PDF 內容 - 第二頁 (圖片) ---
+    story.append(Paragraph("進度留影", styles['CJKHeading2']))
+    story.append(Spacer(1, 0.5*units.cm))
+
+    if day.photos:
+        img_width_pt, img_height_pt = template.img_width, template.img_height
+
+        def pdf_photo_cell(prepared_photo):
+            if not isinstance(prepared_photo, PreparedPhoto):
+                return LazyPhoto(prepared_photo, img_width_pt, img_height_pt, styles['CJKNormal'], photo_options, on_photo_error)
+            if prepared_photo.error:
+                if on_photo_error: on_photo_error(prepared_photo)
+                return Paragraph(f"[圖片錯誤: {escape(prepared_photo.name)}]", styles['CJKNormal'])
+            return Image(prepared_photo.open("pdf"), width=img_width_pt, height=img_height_pt)
+
+        for i in range(0, len(day.photos), 2):
+            img_row_content = [pdf_photo_cell(day.photos[i]), Spacer(template.img_margin, 1)]
+            img_row_content.append(pdf_photo_cell(day.photos[i+1]) if i + 1 < len(day.photos) else Spacer(img_width_pt, img_height_pt))
+            story.append(template.table([img_row_content], template.photo_row_widths, template.photo_row_style, header=False))
+            story.append(Spacer(1, 0.5*units.cm))
+
+    # --- PDF 內容 - 結尾記錄人 ---
+    story.append(Spacer(1, 1*units.cm))
+    story.append(Paragraph(f"<b>記錄人： {escape(day.recorder or '')}</b>", styles['CJKFooterTitleBold']))
+    return story
+
+
+def pdf_file_name(day):
+    return f"{day.report_title}_{day.install_date}.pdf" if day.report_title else f"安裝日記_{day.install_date}.pdf"
+
+
+def write_day_pdf(day, output, on_photo_error=None):
+    """產生單日 PDF 報告寫入 output (路徑或 file-like)"""
+    doc = SimpleDocTemplate(output, pagesize=A4, leftMargin=PDF_MARGIN, rightMargin=PDF_MARGIN, topMargin=PDF_MARGIN, bottomMargin=PDF_MARGIN, title=f"安裝日記_{day.install_date}", author="工廠安裝日記自動生成器")
+    doc.build(build_day_story(day, doc_width=doc.width, on_photo_error=on_photo_error))
+
+
+# --- 多日合併報告 ---
+class MultiDayDocTemplate(BaseDocTemplate):
+    """每天一節：CJKDayHeading 標題產生目錄項目與 PDF 書籤，頁尾加頁碼
+    on_section(排版輪次, 已排版天數) 於每天的標題排入頁面後呼叫"""
+
+    def __init__(self, output, on_section=None, **kw):
+        super().__init__(output, **kw)
+        self.on_section = on_section; self._pass_count = 0
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id='normal')
+        self.addPageTemplates([PageTemplate(id='diary', frames=[frame], onPage=self._draw_page_number)])
+
+    @staticmethod
+    def _draw_page_number(canv, doc):
+        canv.saveState(); canv.setFont(CJK_FONT_NAME, 9)
+        canv.drawCentredString(PAGE_WIDTH / 2, PDF_MARGIN / 2, f"第 {doc.page} 頁")
+        canv.restoreState()
+
+    def beforeDocument(self):
+        self._section_count = 0 # multiBuild 每一輪重新編號，書籤鍵在各輪間保持一致
+        self._pass_count += 1
+
+    def afterFlowable(self, flowable):
+        if isinstance(flowable, Paragraph) and flowable.style.name == 'CJKDayHeading':
+            self._section_count += 1
+            text = flowable.getPlainText(); key = f"day-{self._section_count}" # getPlainText() 已還原跳脫字元
+            self.canv.bookmarkPage(key); self.canv.addOutlineEntry(text, key, level=0) # 書籤為純文字
+            self.notify('TOCEntry', (0, escape(text), self.page, key)) # 目錄項目會再以 Paragraph 標記解析
+            if self.on_section: self.on_section(self._pass_count, self._section_count)
+
+
+def multi_day_pdf_file_name(days):
+    title = days[0].report_title or "安裝日記"
+    return f"{title}_{days[0].install_date.strftime('%Y%m%d')}-{days[-1].install_date.strftime('%Y%m%d')}.pdf"
+
+
+def write_multi_day_pdf(days, output, title=None, photo_options=None, on_photo_error=None, on_section=None):
+    """多日合併 PDF：封面與目錄後每天一節 (新頁開始)，寫入 output (路徑或 file-like)
+    days 的 photos 可為檔案路徑或 iter_journal_days() 的 JournalPhoto，繪製到該頁時才處理；
+    photo_options 同 prepare_photos 的參數，未帶 cache 時使用本次報告專用的快取 (目錄需要兩輪排版)
+    on_section 見 MultiDayDocTemplate (每一輪排版都會由 1 重新計數)
+    回傳排版輪數"""
+    days = sorted(days, key=lambda d: d.install_date)
+    if not days: raise ValueError("沒有可輸出的日誌")
+    photo_options = dict(photo_options or {})
+    photo_options.setdefault("cache", PhotoCache())
+    reported = set()
+    def report_once(prepared): # 每一輪排版都會繪製照片，錯誤只回報一次
+        if on_photo_error and prepared.name not in reported:
+            reported.add(prepared.name); on_photo_error(prepared)
+
+    styles = compile_report_template().styles
+    title = title or days[0].report_title or "工廠安裝日記"
+    doc = MultiDayDocTemplate(output, pagesize=A4, leftMargin=PDF_MARGIN, rightMargin=PDF_MARGIN, topMargin=PDF_MARGIN, bottomMargin=PDF_MARGIN,
+                              title=f"{title}_{days[0].install_date}-{days[-1].install_date}", author="工廠安裝日記自動生成器",
+                              on_section=on_section)
+    toc = TableOfContents(dotsMinLevel=0)
+    toc.levelStyles = [styles['CJKTOCEntry']]
+    story = [Paragraph(escape(title), styles['CJKMainTitle']),
+             Paragraph(f"安裝日誌　{days[0].install_date} ~ {days[-1].install_date}（共 {len(days)} 天）", styles['CJKSubTitle']),
+             Spacer(1, 0.5*units.cm), Paragraph("目錄", styles['CJKHeading2']), toc]
+    for day in days:
+        story.append(PageBreak())
+        story += build_day_story(day, doc_width=doc.width, on_photo_error=report_once, section=True, photo_options=photo_options)
+    return doc.multiBuild(story)
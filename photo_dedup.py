@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""跨日照片比對：同一張照片 (內容雜湊相同) 在 .xlsx 中只存一份 media 部件 (見 excel_export.save_workbook 與 excel_merge.splice_sheet)，
+外觀相近的照片 (感知雜湊 dHash 的漢明距離在門檻內) 提醒使用者可能重複上傳
+比對使用日誌中實際嵌入的 Excel 尺寸照片，新照片與舊日誌經過相同的處理流程，雜湊可以直接比較"""
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+
+from PIL import Image as PILImage
+
+from photo_pipeline import photo_digest
+from spill_io import file_digest, as_file
+
+DHASH_SIZE = 8 # 8 x 8 = 64 位元
+# 64 位元 dHash 的漢明距離門檻：同一場景重拍、不同壓縮品質約在 0~6
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get("DIARY_NEAR_DUPLICATE_DISTANCE", 6))
+# 行程內保留的日誌照片指紋份數 (不同檔案內容)
+JOURNAL_FINGERPRINT_CACHE_SIZE = int(os.environ.get("DIARY_JOURNAL_FINGERPRINT_CACHE", 4))
+
+
+@dataclass
+class PhotoFingerprint:
+    """一張照片的指紋；source 為來源 (日期分頁名稱)，phash 為 None 表示無法解碼"""
+    name: str
+    source: str
+    digest: str
+    phash: int = None
+
+    @property
+    def label(self):
+        return f"{self.source} {self.name}" if self.source else self.name
+
+
+@dataclass
+class DuplicatePhoto:
+    """photo 與先前出現的 reference 相同 (identical) 或相似 (distance 為不同的位元數)"""
+    photo: PhotoFingerprint
+    reference: PhotoFingerprint
+    distance: int
+    identical: bool
+
+
+def perceptual_hash(raw):
+    """dHash：縮成 (DHASH_SIZE + 1) x DHASH_SIZE 灰階後比較左右相鄰像素，回傳 64 位元整數"""
+    img = PILImage.open(BytesIO(raw))
+    img.draft("L", (DHASH_SIZE * 8, DHASH_SIZE * 8)) # JPEG 直接以縮小尺寸解碼
+    pixels = img.convert("L").resize((DHASH_SIZE + 1, DHASH_SIZE), PILImage.Resampling.LANCZOS).tobytes()
+    value = 0
+    for y in range(DHASH_SIZE):
+        row = pixels[y * (DHASH_SIZE + 1):(y + 1) * (DHASH_SIZE + 1)]
+        for x in range(DHASH_SIZE): value = (value << 1) | (row[x] > row[x + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def fingerprint(raw, name, source=""):
+    try: phash = perceptual_hash(raw)
+    except Exception: phash = None
+    return PhotoFingerprint(name, source, photo_digest(raw), phash)
+
+
+def prepared_fingerprints(photos, source="", target="excel"):
+    """prepare_photos() 結果的指紋 (以 target 尺寸的輸出比對；處理失敗的照片略過)"""
+    return [fingerprint(p.buffers[target], p.name, source) for p in photos if not p.error and target in p.buffers]
+
+
+def find_duplicates(photos, references=(), max_distance=NEAR_DUPLICATE_DISTANCE):
+    """依序比對 photos 與 references 及排在前面的 photos；每張照片回報一個最接近的對象 (內容相同者優先)
+    回傳 [DuplicatePhoto]"""
+    seen = [r for r in references if r.phash is not None]
+    by_digest = {}
+    for r in seen: by_digest.setdefault(r.digest, r)
+    matches = []
+    for photo in photos:
+        if photo.phash is None: continue
+        same = by_digest.get(photo.digest)
+        if same is not None:
+            matches.append(DuplicatePhoto(photo, same, 0, True))
+        else:
+            nearest = min(((r, hamming(photo.phash, r.phash)) for r in seen), key=lambda m: m[1], default=None)
+            if nearest is not None and nearest[1] <= max_distance:
+                matches.append(DuplicatePhoto(photo, nearest[0], nearest[1], False))
+        seen.append(photo); by_digest.setdefault(photo.digest, photo)
+    return matches
+
+
+def build_journal_fingerprints(journal_file):
+    """日誌中每張嵌入照片的指紋 (依分頁順序)；多個分頁共用的 media 部件只解碼一次"""
+    from journal_reader import iter_journal_days
+    by_member = {}; fingerprints = []
+    for day in iter_journal_days(journal_file):
+        for photo in day.photos:
+            if photo.member not in by_member: by_member[photo.member] = fingerprint(photo.getvalue(), photo.name)
+            shared = by_member[photo.member]
+            fingerprints.append(PhotoFingerprint(photo.name, str(day.install_date), shared.digest, shared.phash))
+    return fingerprints
+
+
+_fingerprint_cache = OrderedDict()
+_fingerprint_lock = threading.Lock()
+
+
+def load_journal_fingerprints(journal_file, digest=None):
+    """同 build_journal_fingerprints()，依檔案內容雜湊快取 (journal_file 為路徑、位元組或 file-like，不整份讀入記憶體)；已知雜湊時以 digest 傳入"""
+    digest = digest or file_digest(journal_file)
+    with _fingerprint_lock:
+        fingerprints = _fingerprint_cache.get(digest)
+        if fingerprints is not None:
+            _fingerprint_cache.move_to_end(digest); return fingerprints
+    fingerprints = build_journal_fingerprints(as_file(journal_file))
+    with _fingerprint_lock:
+        _fingerprint_cache[digest] = fingerprints
+        while len(_fingerprint_cache) > JOURNAL_FINGERPRINT_CACHE_SIZE: _fingerprint_cache.popitem(last=False)
+    return fingerprints
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""照片前處理：每張上傳照片只解碼一次，裁切/縮放/編碼分散到執行緒池，供 Excel 與 PDF 共用"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from PIL import Image as PILImage, ImageOps
+
+# --- 目標尺寸 (像素) ---
+# Excel：3 欄 x 18 字寬 x 約 7px，扣除 8px 邊距；列高 120pt 換算像素
+EXCEL_PHOTO_SIZE_PX = (18 * 3 * 7 - 8, int(120 / 0.75))
+# PDF：A4 扣 1.5cm 邊界後兩欄並排、高 6cm，pt 換算像素 (x 4/3)
+PDF_PHOTO_SIZE_PX = (330, 226)
+PHOTO_TARGETS = {"excel": EXCEL_PHOTO_SIZE_PX, "pdf": PDF_PHOTO_SIZE_PX}
+
+# --- 畫質/速度模式 ---
+# 名稱: (draft 預留倍數，None 表示不使用 JPEG DCT 縮小解碼, 重採樣濾鏡, reducing_gap)
+# draft 讓大張 JPEG 直接以 1/2、1/4、1/8 解碼；reducing_gap 先以整數倍 reduce() 再做精細重採樣
+PHOTO_QUALITY_MODES = {
+    "fast": (1, PILImage.Resampling.BILINEAR, 2.0),
+    "balanced": (2, PILImage.Resampling.LANCZOS, 3.0),
+    "best": (None, PILImage.Resampling.LANCZOS, None), # 與原本全尺寸解碼 + LANCZOS 輸出相同，供正式報告
+}
+DEFAULT_PHOTO_QUALITY = os.environ.get("DIARY_PHOTO_QUALITY", "balanced")
+
+# --- 輸出格式 ---
+# 照片內容以 JPEG 嵌入遠小於 PNG；PNG 保留給需要無損輸出的情況
+PHOTO_FORMATS = ("JPEG", "PNG")
+DEFAULT_PHOTO_FORMAT = os.environ.get("DIARY_PHOTO_FORMAT", "JPEG")
+DEFAULT_JPEG_QUALITY = int(os.environ.get("DIARY_JPEG_QUALITY", 85))
+MIN_JPEG_QUALITY = 30 # 檔案大小預算下調品質的下限
+JPEG_QUALITY_STEP = 10
+# 已是小尺寸的 JPEG 上傳 (長寬比與目標相符、寬度不超過目標 2 倍、無 EXIF 旋轉) 直接沿用原始位元組
+PASSTHROUGH_MAX_BYTES = 200 * 1024
+PASSTHROUGH_RATIO_TOLERANCE = 0.02
+
+# 每個 session 的照片快取上限 (MB)
+PHOTO_CACHE_MAX_BYTES = int(os.environ.get("DIARY_PHOTO_CACHE_MB", 256)) * 1024 * 1024
+
+# PIL 的解碼/縮放/編碼大多會釋放 GIL，執行緒池即可平行化且不需複製照片資料到子行程
+PHOTO_WORKERS = int(os.environ.get("DIARY_PHOTO_WORKERS", min(4, os.cpu_count() or 1)))
+# 整個行程同時解碼中的照片像素記憶體上限 (MB，所有 session 與導出共用)；超過時後到的照片等待，0 = 不限
+DECODE_MEMORY_LIMIT_BYTES = int(os.environ.get("DIARY_DECODE_MEMORY_MB", 512)) * 1024 * 1024
+DECODE_COPY_FACTOR = 2 # 解碼後的影像 + 轉正/裁切時的暫時複本
+# 整個行程同時進行解碼/縮放/編碼的照片數 (多個 session 同時導出時各自的照片執行緒池共用)，避免 CPU 超額分配
+PHOTO_CPU_SLOTS = int(os.environ.get("DIARY_PHOTO_CPU_SLOTS", os.cpu_count() or 1))
+
+
+@dataclass
+class PreparedPhoto:
+    """一張已處理完成的照片；buffers 以目標名稱 (excel/pdf) 對應編碼後的位元組
+    嵌入時請以目標尺寸顯示 (直接沿用的 JPEG 像素尺寸可能與目標不同)"""
+    name: str
+    buffers: dict = field(default_factory=dict)
+    error: Exception = None
+    digest: str = None # 原始上傳位元組的內容雜湊
+    passthrough: set = field(default_factory=set) # 直接沿用原始 JPEG 的目標
+    cropped: dict = field(default_factory=dict, repr=False) # 大小預算重新編碼用，完成後釋放
+    timings: dict = field(default_factory=dict, repr=False) # 各步驟耗時 (秒)：read、decode、resize:<目標>、encode:<目標>
+
+    def open(self, target):
+        """回傳可直接交給 XLImage / reportlab Image 的新 BytesIO"""
+        return BytesIO(self.buffers[target])
+
+
+class PhotoCache:
+    """以內容雜湊 + 目標尺寸 + 格式為鍵的有界 LRU 快取，存放已編碼的照片位元組
+    每個 session 一份 (放在 st.session_state)，超過 max_bytes 時淘汰最久未使用的項目"""
+
+    def __init__(self, max_bytes=PHOTO_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes; self.total_bytes = 0; self.hits = 0; self.misses = 0
+        self._entries = OrderedDict(); self._lock = threading.Lock() # 執行緒池中的工作會同時存取
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None: self.misses += 1; return None
+            self._entries.move_to_end(key); self.hits += 1
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            if len(data) > self.max_bytes: return
+            old = self._entries.pop(key, None)
+            if old is not None: self.total_bytes -= len(old)
+            self._entries[key] = data; self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False); self.total_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock: self._entries.clear(); self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MemoryBudget:
+    """以位元組計量的號誌：reserve(n) 等到已保留量 + n 不超過上限才放行
+    單一請求大於上限時以上限計 (等其他請求都釋放後單獨執行)，不會永遠等待"""
+
+    def __init__(self, limit_bytes=DECODE_MEMORY_LIMIT_BYTES):
+        self.limit_bytes = limit_bytes; self.reserved = 0; self.peak = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, nbytes):
+        if not self.limit_bytes:
+            yield; return
+        nbytes = min(nbytes, self.limit_bytes)
+        with self._condition:
+            self._condition.wait_for(lambda: self.reserved + nbytes <= self.limit_bytes)
+            self.reserved += nbytes; self.peak = max(self.peak, self.reserved)
+        try: yield
+        finally:
+            with self._condition:
+                self.reserved -= nbytes; self._condition.notify_all()
+
+
+DECODE_BUDGET = MemoryBudget()
+_cpu_slots = threading.BoundedSemaphore(max(1, PHOTO_CPU_SLOTS))
+
+
+@contextmanager
+def _decode_slot(nbytes):
+    """先保留解碼記憶體再取得 CPU 名額 (固定順序，不會互相等待)"""
+    with DECODE_BUDGET.reserve(nbytes), _cpu_slots:
+        yield
+
+
+def photo_digest(raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _cache_key(digest, size, quality, fmt, jpeg_quality):
+    return (digest, tuple(size), quality, fmt, jpeg_quality if fmt == "JPEG" else None)
+
+
+def read_photo_bytes(photo):
+    """讀取上傳檔 (UploadedFile / file-like) 或檔案路徑的原始位元組"""
+    if hasattr(photo, "getvalue"): return photo.getvalue()
+    if hasattr(photo, "read"):
+        photo.seek(0); return photo.read()
+    with open(photo, "rb") as f: return f.read()
+
+
+def photo_name(photo):
+    return getattr(photo, "name", None) or os.path.basename(str(photo))
+
+
+def _fit_box(image_size, size):
+    """與 ImageOps.fit (置中、無 bleed) 相同的裁切框"""
+    img_w, img_h = image_size; output_ratio = size[0] / size[1]
+    if img_w / img_h >= output_ratio: crop_w, crop_h = output_ratio * img_h, img_h
+    else: crop_w, crop_h = img_w, img_w / output_ratio
+    left = (img_w - crop_w) / 2; top = (img_h - crop_h) / 2
+    return (left, top, left + crop_w, top + crop_h)
+
+
+def _draft_size(img, targets, oversample):
+    """計算 draft 需要的最小解碼尺寸：縮小後的裁切區仍需涵蓋每個目標尺寸 x oversample"""
+    raw_w, raw_h = img.size
+    orientation = img.getexif().get(0x0112, 1) # EXIF 旋轉 90/270 度時寬高互換
+    oriented = (raw_h, raw_w) if orientation in (5, 6, 7, 8) else (raw_w, raw_h)
+    scale = 0
+    for size in targets.values():
+        left, top, right, bottom = _fit_box(oriented, size)
+        scale = max(scale, size[0] / (right - left), size[1] / (bottom - top))
+    scale = min(1.0, scale * oversample)
+    return (max(1, math.ceil(raw_w * scale)), max(1, math.ceil(raw_h * scale)))
+
+
+def _can_pass_through(img, raw_size, size):
+    """僅讀檔頭判斷：小型、無旋轉、長寬比相符的 JPEG 不必解碼重編"""
+    if img.format != "JPEG" or img.mode not in ("RGB", "L") or raw_size > PASSTHROUGH_MAX_BYTES: return False
+    if img.getexif().get(0x0112, 1) != 1: return False
+    img_w, img_h = img.size
+    if img_w > size[0] * 2: return False
+    return abs((img_w / img_h) / (size[0] / size[1]) - 1) <= PASSTHROUGH_RATIO_TOLERANCE
+
+
+def _encode(img, fmt, jpeg_quality):
+    img_buffer = BytesIO()
+    if fmt == "JPEG":
+        if img.mode in ("RGBA", "LA", "P"): # 透明背景以白色填底
+            img = img.convert("RGBA"); background = PILImage.new("RGB", img.size, "white")
+            background.paste(img, mask=img.getchannel("A")); img = background
+        elif img.mode not in ("RGB", "L"): img = img.convert("RGB")
+        img.save(img_buffer, format="JPEG", quality=jpeg_quality, optimize=True)
+    else:
+        img.save(img_buffer, format="PNG")
+    return img_buffer.getvalue()
+
+
+def _decoded_bytes(img, targets, quality):
+    """只讀檔頭估計解碼所需的記憶體 (draft 縮小後的尺寸 x 色版數 x DECODE_COPY_FACTOR)"""
+    oversample = PHOTO_QUALITY_MODES[quality][0]
+    img_w, img_h = _draft_size(img, targets, oversample) if oversample is not None and img.format == "JPEG" else img.size
+    return img_w * img_h * max(3, len(img.getbands())) * DECODE_COPY_FACTOR
+
+
+def _decode_oriented(raw, targets, quality):
+    """解碼 (必要時 draft 縮小) 並依 EXIF 轉正"""
+    oversample = PHOTO_QUALITY_MODES[quality][0]
+    img = PILImage.open(BytesIO(raw))
+    if oversample is not None and img.format == "JPEG":
+        img.draft(None, _draft_size(img, targets, oversample))
+    img = ImageOps.exif_transpose(img)
+    img_w, img_h = img.size; assert img_w > 0 and img_h > 0
+    return img
+
+
+def _crop(img, size, quality):
+    _, resample, reducing_gap = PHOTO_QUALITY_MODES[quality]
+    if reducing_gap is None: return ImageOps.fit(img, size, method=resample)
+    return img.resize(size, resample, box=_fit_box(img.size, size), reducing_gap=reducing_gap)
+
+
+def _prepare_one(photo, targets, quality, fmt, jpeg_quality, keep_cropped, cache):
+    name = photo_name(photo); timings = {}
+    try:
+        t = time.perf_counter()
+        raw = read_photo_bytes(photo)
+        prepared = PreparedPhoto(name, digest=photo_digest(raw), timings=timings)
+        img = PILImage.open(BytesIO(raw))
+        timings["read"] = time.perf_counter() - t
+        if fmt == "JPEG":
+            for target, size in targets.items():
+                if _can_pass_through(img, len(raw), size):
+                    prepared.buffers[target] = raw; prepared.passthrough.add(target)
+        missing = {}
+        for target, size in targets.items():
+            if target in prepared.passthrough: continue
+            data = cache.get(_cache_key(prepared.digest, size, quality, fmt, jpeg_quality)) if cache is not None else None
+            if data is None: missing[target] = size
+            else: prepared.buffers[target] = data
+        if not missing: return prepared
+        with _decode_slot(_decoded_bytes(img, missing, quality)): # 解碼後的全尺寸影像離開此區塊即釋放
+            t = time.perf_counter()
+            img = _decode_oriented(raw, missing, quality)
+            img.load(); timings["decode"] = time.perf_counter() - t
+            for target, size in missing.items():
+                t = time.perf_counter()
+                img_cropped = _crop(img, size, quality)
+                timings[f"resize:{target}"] = time.perf_counter() - t; t = time.perf_counter()
+                prepared.buffers[target] = _encode(img_cropped, fmt, jpeg_quality)
+                timings[f"encode:{target}"] = time.perf_counter() - t
+                if cache is not None: cache.put(_cache_key(prepared.digest, size, quality, fmt, jpeg_quality), prepared.buffers[target])
+                if keep_cropped: prepared.cropped[target] = img_cropped
+            img.close(); del img
+        return prepared
+    except Exception as e:
+        return PreparedPhoto(name, error=e, timings=timings)
+
+
+def _fit_size_budget(prepared_photos, photos, target, size, size_budget, quality, jpeg_quality, cache):
+    """某目標的照片總大小超過預算時逐步降低 JPEG 品質重新編碼，回傳最終品質 (已達下限仍超出則盡力而為)"""
+    def total(): return sum(len(p.buffers[target]) for p in prepared_photos if target in p.buffers)
+    while total() > size_budget and jpeg_quality > MIN_JPEG_QUALITY:
+        jpeg_quality = max(MIN_JPEG_QUALITY, jpeg_quality - JPEG_QUALITY_STEP)
+        for p, photo in zip(prepared_photos, photos):
+            if p.error or target in p.passthrough: continue
+            key = _cache_key(p.digest, size, quality, "JPEG", jpeg_quality)
+            data = cache.get(key) if cache is not None else None
+            if data is None:
+                if target not in p.cropped: # 第一輪命中快取的照片沒有保留裁切結果，需重新解碼
+                    raw = read_photo_bytes(photo)
+                    with _decode_slot(_decoded_bytes(PILImage.open(BytesIO(raw)), {target: size}, quality)):
+                        p.cropped[target] = _crop(_decode_oriented(raw, {target: size}, quality), size, quality)
+                data = _encode(p.cropped[target], "JPEG", jpeg_quality)
+                if cache is not None: cache.put(key, data)
+            p.buffers[target] = data
+    return jpeg_quality
+
+
+def prepare_photos(photos, targets=PHOTO_TARGETS, max_workers=PHOTO_WORKERS, quality=DEFAULT_PHOTO_QUALITY,
+                   fmt=DEFAULT_PHOTO_FORMAT, jpeg_quality=DEFAULT_JPEG_QUALITY, size_budget=None, cache=None, on_progress=None):
+    """平行處理所有照片，回傳與輸入同順序的 PreparedPhoto 清單；單張失敗記錄於 .error 不中斷其他照片
+    quality 為 PHOTO_QUALITY_MODES 的鍵 ("fast" / "balanced" / "best")；fmt 為 "JPEG" 或 "PNG"
+    size_budget (位元組) 為每份報告 (每個目標) 的照片總大小上限，僅對 JPEG 生效
+    cache 為 PhotoCache，命中時完全略過解碼
+    on_progress(已完成張數, 總張數) 於每張照片完成後呼叫 (可能來自不同執行緒)；其拋出的例外會中止處理"""
+    photos = list(photos or [])
+    if not photos: return []
+    keep_cropped = bool(size_budget) and fmt == "JPEG"
+    work = lambda p: _prepare_one(p, targets, quality, fmt, jpeg_quality, keep_cropped, cache)
+    if on_progress is not None:
+        prepare_one, progress_lock, completed = work, threading.Lock(), [0]
+        def work(p):
+            prepared = prepare_one(p)
+            with progress_lock: completed[0] += 1; done = completed[0]
+            on_progress(done, len(photos))
+            return prepared
+    if max_workers <= 1 or len(photos) == 1:
+        prepared_photos = [work(p) for p in photos]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(photos))) as pool:
+            prepared_photos = list(pool.map(work, photos))
+    if keep_cropped:
+        for target, size in targets.items(): _fit_size_budget(prepared_photos, photos, target, size, size_budget, quality, jpeg_quality, cache)
+        for p in prepared_photos: p.cropped.clear()
+    return prepared_photos
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""記憶體有界的檔案處理：上傳檔複本與導出結果超過門檻時自動改存暫存檔 (SpooledTemporaryFile)，
+內容雜湊以分段串流計算；.xlsx 為 zip，openpyxl / zipfile 只依中央目錄讀取需要的成員，交給檔案物件即為串流存取
+
+    copied = spool_upload(uploaded_file)     # 背景工作用的複本 (保留 .name)
+    output = SpooledFile("日誌.xlsx")        # 導出結果；關閉 (或被回收) 時刪除暫存檔
+    file_digest(copied)                      # 不需整份讀入記憶體
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+# 超過此大小 (MB) 的上傳複本與導出結果改存暫存檔；0 = 一律寫入暫存檔
+SPILL_THRESHOLD_BYTES = int(os.environ.get("DIARY_SPILL_MB", 16)) * 1024 * 1024
+SPILL_DIR = os.environ.get("DIARY_SPILL_DIR") or None # None = 系統暫存資料夾
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class SpooledFile(tempfile.SpooledTemporaryFile):
+    """SpooledTemporaryFile 加上顯示用的檔名 (.name) 與大小；寫入超過門檻時內容移到磁碟"""
+
+    def __init__(self, name=None, max_size=SPILL_THRESHOLD_BYTES):
+        # max_size 為 0 時 SpooledTemporaryFile 永不轉存，改以 1 位元組代表「一律寫入暫存檔」
+        super().__init__(max_size=max_size or 1, dir=SPILL_DIR); self._display_name = name
+
+    @property
+    def name(self):
+        return self._display_name
+
+    @property
+    def spilled(self):
+        return self._rolled
+
+    @property
+    def size(self):
+        position = self.tell(); end = self.seek(0, os.SEEK_END); self.seek(position)
+        return end
+
+    def read_all(self):
+        """整份內容 (下載時才呼叫)"""
+        self.seek(0); return self.read()
+
+
+def spool_upload(uploaded_file):
+    """複製上傳檔 (UploadedFile / BytesIO / 其他 file-like) 的內容並保留 .name，背景工作讀取時不會與頁面共用檔案位置
+    BytesIO 以 getbuffer() 分段寫出，不產生整份的位元組複本"""
+    copied = SpooledFile(getattr(uploaded_file, "name", None))
+    if hasattr(uploaded_file, "getbuffer"):
+        with uploaded_file.getbuffer() as view:
+            for start in range(0, len(view), COPY_CHUNK_BYTES): copied.write(view[start:start + COPY_CHUNK_BYTES])
+    else:
+        position = uploaded_file.tell(); uploaded_file.seek(0)
+        shutil.copyfileobj(uploaded_file, copied, COPY_CHUNK_BYTES); uploaded_file.seek(position)
+    copied.seek(0)
+    return copied
+
+
+def file_digest(source):
+    """source (路徑、位元組或 file-like) 內容的 blake2b 雜湊 (與 photo_digest 相同)；file-like 分段讀取並還原檔案位置"""
+    h = hashlib.blake2b(digest_size=16)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        h.update(source)
+    elif hasattr(source, "read"):
+        position = source.tell(); source.seek(0)
+        while chunk := source.read(COPY_CHUNK_BYTES): h.update(chunk)
+        source.seek(position)
+    else:
+        with open(source, "rb") as f:
+            while chunk := f.read(COPY_CHUNK_BYTES): h.update(chunk)
+    return h.hexdigest()
+
+
+def as_file(source):
+    """位元組包成 BytesIO；路徑與 file-like 原樣回傳 (openpyxl / zipfile 都接受)"""
+    return BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
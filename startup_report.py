@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""啟動時間報告：在全新行程中以 Streamlit AppTest 執行 app.py，量測首頁與互動 (rerun) 延遲，
+並檢查重型套件 (reportlab / openpyxl / pandas) 是否維持在導出時才載入
+
+    python startup_report.py                       # 表格
+    python startup_report.py --json                # 機器可讀
+    python startup_report.py --max-first-run 2.0   # 首頁超過門檻或重型套件提前載入時回傳 1
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+# 首頁不應載入的套件 (只在導出或上傳舊日誌時才需要)
+DEFERRED_MODULES = ("reportlab", "openpyxl", "pandas")
+RERUN_SAMPLES = 5
+
+
+def measure_once():
+    """子行程：量測一次冷啟動，回傳 dict"""
+    started = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    framework_seconds = time.perf_counter() - started
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    t = time.perf_counter(); at.run(); first_run = time.perf_counter() - t
+    loaded = [m for m in DEFERRED_MODULES if m in sys.modules]
+
+    reruns = []
+    for i in range(RERUN_SAMPLES): # 模擬在欄位中輸入文字
+        at.text_input[0].set_value(f"測試標題 {i}")
+        t = time.perf_counter(); at.run(); reruns.append(time.perf_counter() - t)
+    return dict(framework_seconds=framework_seconds, first_run_seconds=first_run, rerun_seconds=statistics.median(reruns),
+                deferred_loaded=loaded, exceptions=[str(e.value) for e in at.exception])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="量測 app.py 的冷啟動與互動延遲")
+    parser.add_argument("--repeat", type=int, default=3, help="冷啟動次數 (每次為全新行程，取中位數)")
+    parser.add_argument("--json", action="store_true", help="輸出 JSON")
+    parser.add_argument("--max-first-run", type=float, help="首頁時間門檻 (秒)")
+    parser.add_argument("--max-rerun", type=float, help="互動 rerun 時間門檻 (秒)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure_once())); return 0
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="diary_startup_") as store_dir: # 不動到實際的本機儲存
+        env = dict(os.environ, DIARY_STORE_DIR=store_dir)
+        for _ in range(max(1, args.repeat)):
+            t = time.perf_counter()
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], capture_output=True, text=True, check=True, env=env).stdout
+            run = json.loads(out.strip().splitlines()[-1]); run["process_seconds"] = time.perf_counter() - t
+            runs.append(run)
+    report = {key: statistics.median(r[key] for r in runs) for key in ("process_seconds", "framework_seconds", "first_run_seconds", "rerun_seconds")}
+    report.update(repeat=len(runs), deferred_loaded=sorted({m for r in runs for m in r["deferred_loaded"]}),
+                  exceptions=sorted({e for r in runs for e in r["exceptions"]}), python=sys.version.split()[0])
+
+    failures = []
+    if args.max_first_run is not None and report["first_run_seconds"] > args.max_first_run: failures.append("首頁時間超過門檻")
+    if args.max_rerun is not None and report["rerun_seconds"] > args.max_rerun: failures.append("rerun 時間超過門檻")
+    if report["deferred_loaded"]: failures.append(f"首頁已載入 {', '.join(report['deferred_loaded'])}")
+    if report["exceptions"]: failures.append("app.py 執行時發生例外")
+    report["failures"] = failures
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(f"冷啟動 {report['repeat']} 次 (中位數)")
+        print(f"  整個行程        {report['process_seconds']:.3f}s")
+        print(f"  載入 Streamlit  {report['framework_seconds']:.3f}s")
+        print(f"  首頁 (首次執行) {report['first_run_seconds']:.3f}s")
+        print(f"  互動 rerun      {report['rerun_seconds']:.3f}s")
+        print(f"  首頁已載入的延遲套件：{', '.join(report['deferred_loaded']) or '無'}")
+        for failure in failures: print(f"! {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""測試共用：模組位於專案根目錄 (非套件)，合成照片與一天的紀錄"""
+import os
+import random
+import sys
+import zipfile
+from datetime import date
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diary_model import DayRecord, ROLE_TYPES, STAFF_GROUPS
+from photo_pipeline import prepare_photos, EXCEL_PHOTO_SIZE_PX
+
+
+class NamedBytesIO(BytesIO):
+    """與 Streamlit UploadedFile 一樣有 name / getvalue 的上傳照片"""
+
+    def __init__(self, data, name):
+        super().__init__(data); self.name = name
+
+
+def photo_bytes(seed, size=(320, 240)):
+    """內容由 seed 決定的 JPEG (不同 seed 的照片內容不同)"""
+    rng = random.Random(seed)
+    img = Image.frombytes("RGB", (8, 6), rng.randbytes(8 * 6 * 3)).resize(size, Image.BICUBIC)
+    out = BytesIO(); img.save(out, "JPEG", quality=90)
+    return out.getvalue()
+
+
+@pytest.fixture
+def make_day():
+    """make_day(日期, 照片 seed...)：一天的紀錄，照片已處理為 Excel 尺寸"""
+    def factory(install_date, *photo_seeds, recorder="測試員"):
+        photos = [NamedBytesIO(photo_bytes(seed), f"photo_{seed}.jpg") for seed in photo_seeds]
+        return DayRecord("測試專案", install_date if isinstance(install_date, date) else date.fromisoformat(install_date),
+                         "甲、乙", recorder, {group: [1] * len(ROLE_TYPES) for group in STAFF_GROUPS},
+                         [["M1", 1, "吊裝", 2, ""]], [[1, "配管", 1, ""]],
+                         prepare_photos(photos, {"excel": EXCEL_PHOTO_SIZE_PX}, max_workers=1))
+    return factory
+
+
+@pytest.fixture
+def open_zip_files(monkeypatch):
+    """記錄經由 zipfile.ZipFile 開啟的 zip；呼叫時回傳尚未關閉者 (openpyxl 以 from zipfile import ZipFile 載入，不在記錄內)"""
+    opened = []
+    class RecordingZipFile(zipfile.ZipFile):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs); opened.append(self)
+    monkeypatch.setattr(zipfile, "ZipFile", RecordingZipFile)
+    return lambda: [z for z in opened if z.fp is not None]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+from io import BytesIO
+
+import pytest
+import streamlit as st
+from openpyxl import load_workbook
+from streamlit.testing.v1 import AppTest
+
+from export_jobs import JobManager, DONE, CANCELLED
+from test_export_jobs import wait_until, record_task, submit_blocker
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+EXCEL_BUTTON = "✅ 產出/合併 Excel"
+EXPORT_JOB_HISTORY = 5
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """每個測試使用自己的本機儲存 (預設儲存路徑為相對路徑) 與排程器"""
+    monkeypatch.chdir(tmp_path); monkeypatch.delenv("DIARY_STORE_OWNER", raising=False)
+    st.cache_resource.clear()
+    at = AppTest.from_file(APP_PATH, default_timeout=30)
+    at.run()
+    assert not at.exception
+    yield at
+    st.cache_resource.clear()
+
+
+def click(at, label):
+    next(button for button in at.button if button.label == label).click()
+
+
+def workbook_values(job):
+    wb = load_workbook(BytesIO(job.read_output()))
+    return {cell.value for ws in wb.worksheets for row in ws.iter_rows() for cell in row if cell.value is not None}
+
+
+def test_export_includes_field_edited_in_same_run(app):
+    """按鈕的 on_click 在 fragment 把輸入寫回模型之前執行，送出時須直接讀取輸入欄位"""
+    app.text_input(key="side_content_1").set_value("配管工程")
+    app.number_input(key="side_manpower_1").set_value(3)
+    click(app, EXCEL_BUTTON); app.run()
+    job, = app.session_state["export_jobs"]
+    wait_until(lambda: not job.active)
+    assert job.status == DONE, job.exception
+    assert {"配管工程", 3} <= workbook_values(job)
+
+
+def test_session_keeps_last_finished_jobs(app):
+    """每次送出前移除最舊的已結束工作，只保留最近 EXPORT_JOB_HISTORY 個並刪除被移除者的輸出"""
+    submitted = []
+    for _ in range(EXPORT_JOB_HISTORY + 2):
+        click(app, EXCEL_BUTTON); app.run()
+        submitted.append(app.session_state["export_jobs"][-1])
+        wait_until(lambda: not submitted[-1].active)
+    jobs = app.session_state["export_jobs"]
+    assert jobs == submitted[-EXPORT_JOB_HISTORY:]
+    assert all(job.output is None for job in submitted[:2])
+    assert all(job.status == DONE and job.output is not None for job in jobs)
+
+
+def test_cancel_and_remove_buttons(app):
+    manager = JobManager(max_workers=1, max_queued=10, max_per_session=0)
+    started = []
+    try:
+        blocker, release = submit_blocker(manager, started)
+        queued = manager.submit("excel", "queued", record_task, started, "queued", session="b")
+        app.session_state["export_jobs"] = [blocker, queued]; app.run()
+        app.button(key=f"cancel_{queued.id}").click(); app.run()
+        assert queued.status == CANCELLED and blocker.active
+
+        release.set()
+        wait_until(lambda: blocker.status == DONE)
+        app.run()
+        app.button(key=f"remove_{blocker.id}").click(); app.run()
+        assert app.session_state["export_jobs"] == [queued] and blocker.output is None
+        assert started == ["blocker"]
+    finally:
+        manager.shutdown()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from batch_cli import main, safe_file_name
+from conftest import photo_bytes
+
+
+def test_safe_file_name_stays_in_output_dir():
+    assert safe_file_name("A/B 線_2024-05-01.pdf") == "A_B 線_2024-05-01.pdf"
+    assert safe_file_name("..\\..\\報告.pdf") == ".._.._報告.pdf"
+    assert safe_file_name("..") == "_"
+
+
+def test_combined_pdf_counts_photo_errors_and_sanitizes_names(tmp_path, capsys):
+    with open(tmp_path / "good.jpg", "wb") as f: f.write(photo_bytes(1))
+    days = []
+    for d in (1, 2):
+        with open(tmp_path / f"broken_{d}.jpg", "wb") as f: f.write(b"not a jpeg")
+        days.append({"report_title": "A/B 線", "install_date": f"2024-05-0{d}", "recorder": "測試員", "photos": ["good.jpg", f"broken_{d}.jpg"]})
+    with open(tmp_path / "days.json", "w", encoding="utf-8") as f: json.dump(days, f, ensure_ascii=False)
+    out_dir = tmp_path / "out"
+
+    assert main([str(tmp_path / "days.json"), "--out-dir", str(out_dir), "--workers", "1", "--no-excel", "--combined-pdf"]) == 1
+    assert sorted(os.listdir(out_dir)) == ["A_B 線_2024-05-01.pdf", "A_B 線_2024-05-02.pdf", "A_B 線_20240501-20240502.pdf"]
+    captured = capsys.readouterr()
+    assert captured.err.count("(多日 PDF)") == 2
+    assert "錯誤 4 項" in captured.out # 每日 PDF 2 項 + 多日 PDF 2 項
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+
+from conftest import photo_bytes
+from day_store import DayStore, LEGACY_OWNER
+from diary_model import DayRecord
+
+DAY = date(2024, 5, 1)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DayStore(str(tmp_path))
+    yield store
+    store.close()
+
+
+def test_blank_new_date_is_not_stored(store):
+    assert store.save_day(DayRecord(install_date=DAY)) == []
+    assert store.load_day(DAY) is None and store.dates() == []
+    # 有照片的空白日期仍然保存
+    digest = store.put_photo(photo_bytes(1))
+    assert "photos" in store.save_day(DayRecord(install_date=DAY), photos=[(digest, "a.jpg")])
+    assert [p.getvalue() for p in store.load_day(DAY).photos] == [photo_bytes(1)]
+
+
+def test_save_writes_only_changed_fields(store, make_day):
+    day = make_day(DAY)
+    assert set(store.save_day(day)) == {"report_title", "attendees", "recorder", "staff_data", "progress_entries", "side_entries"}
+    assert store.save_day(day) == [] # 內容未變時不寫入
+    day.recorder = "丙"
+    assert store.save_day(day) == ["recorder"]
+    digest = store.put_photo(photo_bytes(2))
+    assert store.save_day(day, photos=[(digest, "b.jpg")]) == ["photos"]
+    assert store.save_day(day) == [] # photos=None 保留已儲存的照片
+
+    # 重新開啟 (沒有快取) 時讀回相同內容
+    reopened = DayStore(store.root)
+    try:
+        loaded = reopened.load_day(DAY)
+        assert (loaded.recorder, loaded.side_entries, [p.name for p in loaded.photos]) == ("丙", day.side_entries, ["b.jpg"])
+        assert reopened.save_day(day) == []
+    finally:
+        reopened.close()
+
+
+def test_owners_do_not_see_each_other(store, make_day):
+    alice, bob = store.for_owner("alice"), store.for_owner("bob")
+    alice.save_day(make_day(DAY, recorder="A"))
+    bob.save_day(make_day(DAY, recorder="B")); bob.save_day(make_day(date(2024, 5, 2), recorder="B"))
+    assert alice.load_day(DAY).recorder == "A" and bob.load_day(DAY).recorder == "B"
+    assert alice.dates() == [DAY] and len(bob.dates()) == 2 and store.dates() == []
+    assert [d.recorder for d in bob.iter_days(end=DAY)] == ["B"]
+
+    # 與另一擁有者相同的內容仍須寫入自己的紀錄
+    assert bob.save_day(make_day(DAY, recorder="A")) == ["recorder"]
+    bob.delete_day(DAY)
+    assert alice.load_day(DAY) is not None and bob.load_day(DAY) is None
+    assert alice.stats()[0] == 1 and bob.stats() == (1, 0, 0)
+
+
+def test_legacy_table_is_migrated_to_legacy_owner(tmp_path):
+    conn = sqlite3.connect(os.path.join(tmp_path, "diary.sqlite3"))
+    conn.executescript("""
+        CREATE TABLE days (
+            install_date TEXT PRIMARY KEY, report_title TEXT NOT NULL DEFAULT '', attendees TEXT NOT NULL DEFAULT '',
+            recorder TEXT NOT NULL DEFAULT '', staff_data TEXT NOT NULL DEFAULT '{}', progress_entries TEXT NOT NULL DEFAULT '[]',
+            side_entries TEXT NOT NULL DEFAULT '[]', photos TEXT NOT NULL DEFAULT '[]', updated_at REAL NOT NULL);
+        INSERT INTO days (install_date, recorder, side_entries, updated_at) VALUES ('2024-05-01', '舊紀錄', '[[1,"配管",1,""]]', 0);
+    """)
+    conn.close()
+
+    store = DayStore(str(tmp_path))
+    try:
+        assert store.load_day(DAY).recorder == "舊紀錄" and store.owner == LEGACY_OWNER
+        assert store.for_owner("other").load_day(DAY) is None
+        # 升級後 (owner, install_date) 為主鍵：其他擁有者可保存同一天
+        assert store.for_owner("other").save_day(DayRecord(install_date=DAY, recorder="新"))
+        assert store.load_day(DAY).side_entries == [[1, "配管", 1, ""]]
+    finally:
+        store.close()
+    reopened = DayStore(str(tmp_path)) # 已升級的資料庫不再重複升級
+    try:
+        assert reopened.load_day(DAY).recorder == "舊紀錄" and reopened.for_owner("other").load_day(DAY).recorder == "新"
+    finally:
+        reopened.close()
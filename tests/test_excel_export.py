@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import inspect
+import posixpath
+import zipfile
+from io import BytesIO
+
+from openpyxl import load_workbook
+from openpyxl.drawing.image import Image
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.writer.excel import ExcelWriter
+
+from excel_export import write_journal_workbook
+
+
+def media_parts(package):
+    return sorted(n for n in zipfile.ZipFile(package).namelist() if n.startswith("xl/media/"))
+
+
+def drawing_media_targets(package):
+    """各繪圖關聯指向的圖片部件 (正規化為套件內路徑)"""
+    archive = zipfile.ZipFile(package); targets = []
+    for name in archive.namelist():
+        if name.startswith("xl/drawings/_rels/"):
+            text = archive.read(name).decode("utf-8")
+            for target in text.split('Target="')[1:]:
+                target = target.split('"')[0]
+                targets.append(target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl/drawings", target)))
+    return targets
+
+
+def test_identical_photo_across_days_is_stored_once(make_day):
+    output = BytesIO()
+    shared = write_journal_workbook([make_day("2024-01-01", 1), make_day("2024-01-02", 1)], output)
+    assert shared == 1
+    assert len(media_parts(output)) == 1
+    assert drawing_media_targets(output) == media_parts(output) * 2
+
+    wb = load_workbook(output)
+    assert wb.sheetnames == ["2024-01-01", "2024-01-02"]
+    assert [len(wb[name]._images) for name in wb.sheetnames] == [1, 1]
+
+
+def test_different_photos_keep_separate_media_parts(make_day):
+    output = BytesIO()
+    shared = write_journal_workbook([make_day("2024-01-01", 1), make_day("2024-01-02", 2)], output)
+    assert shared == 0
+    assert len(media_parts(output)) == 2
+    load_workbook(output)
+
+
+def test_openpyxl_private_api_used_by_shared_media_writer():
+    """SharedMediaWriter 覆寫 ExcelWriter 的內部方法並直接使用其屬性；openpyxl 改版時在此明確失敗，而不是產生錯誤的檔案"""
+    parameters = lambda f: list(inspect.signature(f).parameters)
+    assert parameters(ExcelWriter.__init__) == ["self", "workbook", "archive"]
+    assert parameters(ExcelWriter._write_drawing) == ["self", "drawing"]
+    assert parameters(ExcelWriter._write_images) == ["self"]
+    # 兩個方法都必須仍由 ExcelWriter 自己呼叫，覆寫才會生效
+    source = inspect.getsource(ExcelWriter)
+    assert "self._write_drawing(" in source and "self._write_images()" in source
+    writer = ExcelWriter(None, None)
+    for name in ("_archive", "_images", "_drawings", "_charts", "manifest"): assert hasattr(writer, name), name
+    assert parameters(Image._data) == ["self"] and isinstance(inspect.getattr_static(Image, "path"), property)
+    for name in ("_write", "_write_rels"): assert parameters(getattr(SpreadsheetDrawing, name)) == ["self"], name
+    for name in ("path", "images", "charts"): assert hasattr(SpreadsheetDrawing(), name), name
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import zipfile
+from io import BytesIO
+
+import pytest
+from openpyxl import load_workbook
+
+from excel_export import write_journal_workbook
+from excel_merge import merge_day_into_journal
+
+from test_excel_export import media_parts, drawing_media_targets
+
+
+def sheet_values(ws):
+    return {cell.value for row in ws.iter_rows() for cell in row if cell.value is not None}
+
+
+def drawing_parts(package):
+    return sorted(n for n in zipfile.ZipFile(package).namelist() if n.startswith("xl/drawings/drawing"))
+
+
+@pytest.fixture
+def journal(make_day):
+    """兩天的日誌；第二天有照片 (seed 1)"""
+    output = BytesIO()
+    write_journal_workbook([make_day("2024-01-01"), make_day("2024-01-02", 1)], output)
+    return output
+
+
+def merge(journal, day):
+    output = BytesIO()
+    journal.seek(0)
+    mode = merge_day_into_journal(journal, day, output)
+    return mode, output
+
+
+def test_add_new_sheet(journal, make_day):
+    mode, output = merge(journal, make_day("2024-01-03", 2, recorder="新記錄人"))
+    assert mode == "added"
+    wb = load_workbook(output)
+    assert wb.sheetnames == ["2024-01-01", "2024-01-02", "2024-01-03"]
+    assert any("新記錄人" in str(v) for v in sheet_values(wb["2024-01-03"]))
+    assert [len(wb[name]._images) for name in wb.sheetnames] == [0, 1, 1]
+    assert len(media_parts(output)) == 2
+
+
+def test_replace_sheet_drops_its_old_drawing_and_image(journal, make_day):
+    old_photo = zipfile.ZipFile(journal).read(media_parts(journal)[0])
+    mode, output = merge(journal, make_day("2024-01-02", 2, recorder="改寫後"))
+    assert mode == "replaced"
+    wb = load_workbook(output)
+    assert wb.sheetnames == ["2024-01-01", "2024-01-02"] # 原位置取代
+    values = sheet_values(wb["2024-01-02"])
+    assert any("改寫後" in str(v) for v in values) and not any("測試員" in str(v) for v in values)
+    assert len(wb["2024-01-02"]._images) == 1
+    assert len(drawing_parts(output)) == 1 # 舊分頁的繪圖已移除
+    assert len(media_parts(output)) == 1 # 舊照片沒有其他分頁使用，一併移除 (部件名稱可能被新照片沿用)
+    assert zipfile.ZipFile(output).read(media_parts(output)[0]) != old_photo
+    content_types = zipfile.ZipFile(output).read("[Content_Types].xml").decode("utf-8")
+    assert all(f"/{part}" in content_types for part in drawing_parts(output))
+
+
+def test_identical_photo_reuses_existing_media_part(journal, make_day):
+    old_media = media_parts(journal)
+    mode, output = merge(journal, make_day("2024-01-03", 1))
+    assert mode == "added"
+    assert media_parts(output) == old_media # 沒有新增圖片部件
+    assert drawing_media_targets(output) == old_media * 2
+    wb = load_workbook(output)
+    assert [len(wb[name]._images) for name in wb.sheetnames] == [0, 1, 1]
+
+
+def test_replace_sheet_keeps_its_photo_when_reused(journal, make_day):
+    old_media = media_parts(journal)
+    mode, output = merge(journal, make_day("2024-01-02", 1, recorder="改寫後"))
+    assert mode == "replaced"
+    assert media_parts(output) == old_media
+    assert drawing_media_targets(output) == old_media
+    wb = load_workbook(output)
+    assert len(wb["2024-01-02"]._images) == 1
+
+
+def test_merge_closes_zip_files(journal, make_day, open_zip_files):
+    merge(journal, make_day("2024-01-03", 2))
+    assert open_zip_files() == []
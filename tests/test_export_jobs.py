@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+import pytest
+
+from export_jobs import JobManager, ExportRejected, DONE, CANCELLED, FAILED, RUNNING
+from spill_io import SpooledFile
+
+TIMEOUT = 5
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "逾時"
+        time.sleep(0.005)
+
+
+def record_task(job, started, name, release=None):
+    """記錄開始順序；release 為 Event 時等待放行"""
+    started.append(name)
+    if release is not None: assert release.wait(TIMEOUT)
+    output = SpooledFile(); output.write(name.encode())
+    return output, f"{name}.txt", "text/plain"
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, max_queued=10, max_per_session=0)
+    yield manager
+    manager.shutdown()
+
+
+def submit_blocker(manager, started, session="a"):
+    """佔住唯一的工作執行緒，讓之後送出的工作排隊"""
+    release = threading.Event()
+    job = manager.submit("excel", "blocker", record_task, started, "blocker", release, session=session)
+    wait_until(lambda: job.status == RUNNING)
+    return job, release
+
+
+def test_queued_jobs_alternate_between_sessions(manager):
+    started = []
+    blocker, release = submit_blocker(manager, started, session="a")
+    jobs = [manager.submit("excel", name, record_task, started, name, session=session)
+            for name, session in [("a1", "a"), ("a2", "a"), ("b1", "b"), ("c1", "c"), ("b2", "b")]]
+    # 執行中工作較少的 session 優先，同數量時最久未輪到者優先
+    expected = ["b1", "c1", "a1", "b2", "a2"]
+    assert [job.queue_position for job in jobs] == [expected.index(job.label) + 1 for job in jobs]
+    assert "第 1 位" in jobs[2].progress_text
+
+    release.set()
+    wait_until(lambda: all(job.status == DONE for job in jobs))
+    assert started == ["blocker", *expected]
+    assert jobs[0].read_output() == b"a1"
+    assert manager.metrics_snapshot()["latency"]["全部"]["count"] == 6
+
+
+def test_submit_rejected_when_queue_is_full():
+    manager = JobManager(max_workers=1, max_queued=2, max_per_session=0)
+    started = []
+    try:
+        blocker, release = submit_blocker(manager, started)
+        for name in ("q1", "q2"): manager.submit("pdf", name, record_task, started, name, session=name)
+        with pytest.raises(ExportRejected):
+            manager.submit("pdf", "q3", record_task, started, "q3", session="q3")
+        assert manager.queued_count == 2 and manager.metrics.rejected == 1
+        release.set()
+        wait_until(lambda: manager.queued_count == 0 and manager.running_count == 0)
+        manager.submit("pdf", "q3", record_task, started, "q3", session="q3") # 佇列空出後可再送出
+    finally:
+        manager.shutdown(cancel_pending=False)
+
+
+def test_submit_rejected_over_per_session_limit():
+    manager = JobManager(max_workers=1, max_queued=10, max_per_session=2)
+    started = []
+    try:
+        blocker, release = submit_blocker(manager, started, session="a")
+        manager.submit("pdf", "a1", record_task, started, "a1", session="a")
+        with pytest.raises(ExportRejected):
+            manager.submit("pdf", "a2", record_task, started, "a2", session="a")
+        manager.submit("pdf", "b1", record_task, started, "b1", session="b") # 其他 session 不受影響
+        release.set()
+    finally:
+        manager.shutdown(cancel_pending=False)
+
+
+def test_cancel_queued_job_removes_it_without_running(manager):
+    started = []
+    blocker, release = submit_blocker(manager, started)
+    cancelled = manager.submit("excel", "cancelled", record_task, started, "cancelled", session="b")
+    after = manager.submit("excel", "after", record_task, started, "after", session="c")
+    assert after.queue_position == 2
+
+    cancelled.cancel()
+    assert cancelled.status == CANCELLED and not cancelled.active
+    assert cancelled.queue_position is None and after.queue_position == 1
+    assert manager.metrics.finished[CANCELLED] == 1
+
+    release.set()
+    wait_until(lambda: after.status == DONE)
+    assert started == ["blocker", "after"]
+    assert cancelled.status == CANCELLED
+
+
+def test_cancel_running_job_stops_at_next_progress_report(manager):
+    release = threading.Event()
+    def task(job):
+        assert release.wait(TIMEOUT)
+        job.sheet_done() # 取消後的第一次進度回報拋出 JobCancelled
+        raise AssertionError("取消後不應繼續執行")
+    job = manager.submit("excel", "running", task, session="a")
+    wait_until(lambda: job.status == RUNNING)
+    job.cancel(); release.set()
+    wait_until(lambda: not job.active)
+    assert job.status == CANCELLED and job.exception is None
+
+
+def test_progress_reports_and_output_until_discarded(manager):
+    release = threading.Event(); reported = threading.Event()
+    def task(job):
+        job.set_stage("處理照片", photos_total=4, sheets_total=1)
+        job.add_photos(2); job.info("已略過 1 張照片"); reported.set()
+        assert release.wait(TIMEOUT)
+        return record_task(job, [], "report")
+    job = manager.submit("excel", "progress", task, session="a", sheet_unit="天")
+    wait_until(reported.is_set)
+    assert job.fraction == pytest.approx(2 / 5)
+    assert job.progress_text == "處理照片，照片 2/4，天 0/1"
+    release.set()
+    wait_until(lambda: not job.active)
+    assert job.status == DONE and job.fraction == 1.0 and job.messages == [("info", "已略過 1 張照片")]
+    assert (job.read_output(), job.output_size, job.file_name) == (b"report", 6, "report.txt")
+    output = job.output
+    job.discard(); job.discard() # 可重複呼叫
+    assert job.output is None and job.output_size == 0 and output.closed
+
+
+def test_failed_task_keeps_exception_and_frees_worker(manager):
+    def task(job):
+        raise ValueError("壞掉的日誌")
+    failed = manager.submit("pdf", "failed", task, session="a")
+    after = manager.submit("pdf", "after", record_task, [], "after", session="a")
+    wait_until(lambda: not after.active)
+    assert failed.status == FAILED and str(failed.exception) == "壞掉的日誌" and failed.output is None
+    assert after.status == DONE
+    assert manager.metrics.finished[FAILED] == 1
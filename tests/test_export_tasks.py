@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import zipfile
+from datetime import date
+
+import pytest
+
+from conftest import photo_bytes
+from day_store import DayStore
+from diary_model import DayRecord
+from export_jobs import ExportJob
+from export_tasks import store_journal_task
+
+
+@pytest.fixture
+def store(tmp_path):
+    """三天，每天兩張照片"""
+    store = DayStore(str(tmp_path))
+    for day in (1, 2, 3):
+        photos = [(store.put_photo(photo_bytes(day * 10 + i, (1200, 900))), f"photo_{i}.jpg") for i in range(2)]
+        store.save_day(DayRecord(install_date=date(2024, 5, day), recorder="測試員"), photos=photos)
+    yield store
+    store.close()
+
+
+def media_bytes(store, size_budget):
+    output, _, _ = store_journal_task(ExportJob("excel", "日誌"), store, None, dict(size_budget=size_budget))
+    with zipfile.ZipFile(output) as archive:
+        return sum(info.file_size for info in archive.infolist() if info.filename.startswith("xl/media/"))
+
+
+def test_store_journal_size_budget_covers_whole_report(store):
+    """預算為整份日誌的上限，而非每天各自的上限"""
+    unlimited = media_bytes(store, None)
+    budget = unlimited // 2
+    assert media_bytes(store, budget) <= budget
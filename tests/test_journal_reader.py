@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from contextlib import nullcontext
+
+import pytest
+
+from excel_export import write_journal_workbook
+from journal_reader import iter_journal_days
+
+
+@pytest.fixture
+def journal_path(tmp_path, make_day):
+    path = str(tmp_path / "journal.xlsx")
+    write_journal_workbook([make_day("2024-01-01", 1), make_day("2024-01-02", 2, 3)], path)
+    return path
+
+
+def test_days_and_lazy_photos_read_back(journal_path, make_day):
+    days = list(iter_journal_days(journal_path))
+    assert [str(d.install_date) for d in days] == ["2024-01-01", "2024-01-02"]
+    assert [p.name for p in days[1].photos] == ["photo_2.jpg", "photo_3.jpg"]
+    assert days[1].side_entries == make_day("2024-01-02").side_entries
+    assert days[0].photos[0].getvalue()[:2] == b"\xff\xd8" # 迭代結束後仍可讀取照片
+
+
+@pytest.mark.parametrize("as_file", [False, True])
+def test_archive_closed_after_iteration(journal_path, open_zip_files, as_file):
+    with open(journal_path, "rb") if as_file else nullcontext(journal_path) as source:
+        days = iter_journal_days(source)
+        next(days)
+        assert len(open_zip_files()) == 1 # 迭代期間共用一個 zip
+        days = [*days]
+        assert open_zip_files() == []
+        days[0].photos[0].getvalue()
+        assert open_zip_files() == [] # 之後的讀取各自開啟並關閉
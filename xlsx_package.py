@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""直接讀取 .xlsx zip 套件的共用工具 (關聯檔、分頁與部件路徑)，供增量合併與日誌讀取使用"""
+import posixpath
+import xml.etree.ElementTree as ET
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_DOC_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+NS_DRAWING = "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing"
+NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+REL_WORKSHEET = NS_DOC_REL + "/worksheet"
+REL_STYLES = NS_DOC_REL + "/styles"
+REL_DRAWING = NS_DOC_REL + "/drawing"
+REL_OFFICE_DOCUMENT = NS_DOC_REL + "/officeDocument"
+CT_WORKSHEET = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+
+def qname(tag, ns=NS_MAIN):
+    return f"{{{ns}}}{tag}"
+
+
+def rels_path(part):
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", name + ".rels")
+
+
+def resolve_target(source_part, target):
+    if target.startswith("/"): return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def read_rels(zf, part):
+    """回傳 [(Id, Type, 解析後的目標部件 或 None(外部連結))]"""
+    path = rels_path(part)
+    if path not in zf.NameToInfo: return []
+    rels = []
+    for rel in ET.fromstring(zf.read(path)).iter(qname("Relationship", NS_PKG_REL)):
+        target = None if rel.get("TargetMode") == "External" else resolve_target(part, rel.get("Target"))
+        rels.append((rel.get("Id"), rel.get("Type"), target))
+    return rels
+
+
+def workbook_part(zf):
+    """套件根關聯指向的 workbook 部件 (通常為 xl/workbook.xml)"""
+    for _, rtype, target in read_rels(zf, ""):
+        if rtype == REL_OFFICE_DOCUMENT: return target
+    return None
+
+
+def sheet_parts(zf):
+    """{分頁名稱: 工作表部件路徑}，依活頁簿中的分頁順序"""
+    part = workbook_part(zf)
+    targets = {rid: target for rid, _, target in read_rels(zf, part)}
+    return {s.get("name"): targets.get(s.get(qname("id", NS_DOC_REL)))
+            for s in ET.fromstring(zf.read(part)).iter(qname("sheet"))}